@@ -0,0 +1,75 @@
+"""
+Benchmark of the UI-core inductor problem of eui_fit.py: fitness evaluated
+one individual per call (pymoo elementwise_evaluation) against the whole
+population per call.
+
+First the fitness function alone is timed on random populations, checking
+that both give the same objectives and constraints.  Then NSGA-II is run in
+both modes with the same seed, which gives the same Pareto front.
+
+Usage:
+    python bench_eui_fit.py
+    python bench_eui_fit.py --npop 1000 --ngen 500
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from eui_fit import design_space, eui_fit, eui_modesign, input_design_parameters
+
+
+def elementwise_fit(X, D):
+    """Fitness of a population, one eui_fit() call per individual
+
+    Args:
+        X (np.ndarray): population, one design per row
+        D (Struct): design parameters
+
+    Returns:
+        tuple: objective and constraint arrays, one row per design
+    """
+    fg = [eui_fit(x, D, None) for x in X]
+    return np.array([f for f, g in fg]), np.array([g for f, g in fg])
+
+
+def time_call(fcn, *args):
+    """Run fcn(*args) once
+
+    Returns:
+        tuple: (fcn's result, run time in s)
+    """
+    start = time.perf_counter()
+    result = fcn(*args)
+    return result, time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="UI-core inductor fitness benchmark")
+    parser.add_argument("--npop", type=int, default=100, help="population size of the NSGA-II runs")
+    parser.add_argument("--ngen", type=int, default=100, help="generations of the NSGA-II runs")
+    parser.add_argument("--seed", type=int, default=1, help="random seed")
+    args = parser.parse_args()
+
+    D = input_design_parameters()
+    GAP = design_space()
+    rng = np.random.default_rng(args.seed)
+
+    print("Fitness evaluation")
+    for npop in (100, 1000, 10000):
+        X = GAP.gd_min + rng.random((npop, len(GAP.gd_min)))*(GAP.gd_max - GAP.gd_min)
+        (f1, g1), t1 = time_call(elementwise_fit, X, D)
+        (f2, g2), t2 = time_call(eui_fit, X, D, None)
+        same = np.array_equal(f1, f2) and np.array_equal(g1, g2)
+        print(f"  {npop:6d} designs: elementwise {t1*1e3:8.2f} ms, population {t2*1e3:6.2f} ms,"
+              f" {t1/t2:6.0f}x, {'same' if same else 'DIFFERENT'} results")
+
+    print(f"NSGA-II, population {args.npop}, {args.ngen} generations")
+    fronts = []
+    for elementwise in (True, False):
+        res, t = time_call(eui_modesign, args.npop, args.ngen, elementwise, False, args.seed)
+        fronts.append(res.F[np.lexsort(res.F.T)])
+        print(f"  {'elementwise' if elementwise else 'population':11s}: {t:7.2f} s,"
+              f" {len(res.F)} designs on the front")
+    print("  same front" if np.array_equal(*fronts) else "  DIFFERENT fronts")
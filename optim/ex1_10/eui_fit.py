@@ -33,43 +33,57 @@ def input_design_parameters():
     
     return D
 
+def design_space():
+    # setup design space
+    #               N   ds   ws   wc   lc   g
+    GAP = Struct()
+    GAP.gd_min = np.array([1,  1e-3, 1e-3, 1e-3, 1e-3, 1e-5])
+    GAP.gd_max = np.array([1e3, 1e-1, 1e-1, 1e-1, 1e-1, 1e-2])
+
+    return GAP
+
 class MyProblem(Problem):
     def __init__(self):
         super().__init__()
         self.D = input_design_parameters()
 
     def _evaluate(self, x, out, *args, **kwargs):
+        # x is the whole population, one individual per row (or a single
+        # individual with elementwise_evaluation)
         f, g = eui_fit(x, self.D, None)
         out["F"] = f
         out["G"] = g
 
-def eui_modesign():
+def eui_modesign(npop=100, ngen=100, elementwise=False, verbose=True, seed=None):
     """
     eui_modesign performs a multi-objective optimal design of a ui core 
                   inductor based on an elementary analysis.  Used in 
                   section 10.1 of "Power Magnetic Devices: A Multi-Objective
                   Deign Approach" by S.D. Sudhoff
+
+    Args:
+        npop (int): population size
+        ngen (int): number of generations
+        elementwise (bool): evaluate one individual per call instead of
+            the whole population at once (slow, for comparison)
+        verbose (bool): print the progress of each generation
+        seed (int): random seed of the optimization, for repeatable runs
     """
 
     # setup design space
-    #               N   ds   ws   wc   lc   g
-    GAP = Struct()
-    GAP.gd_min = np.array([1,  1e-3, 1e-3, 1e-3, 1e-3, 1e-5])
-    GAP.gd_max = np.array([1e3, 1e-1, 1e-1, 1e-1, 1e-1, 1e-2])
+    GAP = design_space()
 
 
     # setup genetic algorithm parameters--------------------------------------
     nobj=2                 # number of objectives
-    ngen=100              # number of generations
-    npop = 100  # population size
     
     problem = MyProblem()
     problem.n_var = len(GAP.gd_min)
     problem.n_obj = nobj
-    problem.n_constr = 2
+    problem.n_constr = 5
     problem.xl = GAP.gd_min
     problem.xu = GAP.gd_max
-    problem.elementwise_evaluation = True
+    problem.elementwise_evaluation = elementwise
 
     algorithm = NSGA2(
         pop_size=npop,
@@ -77,13 +91,14 @@ def eui_modesign():
     )
     
     # conduct the optimization-------------------------------------------------
-    res = minimize(problem, algorithm, ("n_gen", ngen), verbose=True)
+    res = minimize(problem, algorithm, ("n_gen", ngen), seed=seed, verbose=verbose)
 
     # save results-------------------------------------------------------------
     return res
 
 def calc_inductor(x, D):
-    # break paramameter vector into components
+    # break paramameter vector into components; x is one design, or an
+    # array with one design per row, giving arrays of results
     # Internal:
     # N = number of turns
     # ds = slot depth(m)
@@ -97,13 +112,14 @@ def calc_inductor(x, D):
     # Brt = flux denity at rated current(T)
     # Jrt = current density at rated current(A/m ** 2)
 
-    N = round(x[0]) # force number of turns to be integer
-    # N = x[0]
-    ds = x[1]
-    ws = x[2]
-    wc = x[3]
-    lc = x[4]
-    g = x[5]
+    x = np.asarray(x, dtype=float)
+    N = np.round(x[..., 0]) # force number of turns to be integer
+    # N = x[..., 0]
+    ds = x[..., 1]
+    ws = x[..., 2]
+    wc = x[..., 3]
+    lc = x[..., 4]
+    g = x[..., 5]
 
     # compute mass
     M = 2.0*(2.0*wc+ws+ds)*lc*wc*D.rowmc + \
@@ -130,7 +146,7 @@ def eui_fit(x, D, fn):
     # f = eui_fit(x, D, fn)
     #
     # Input:
-    # x = parameter vector
+    # x = parameter vector, or population matrix with one per row
     #  x(1) = desired number of turns(as real number)
     #  x(2) = slot depth(m)
     #  x(3) = slot width(m)
@@ -157,9 +173,9 @@ def eui_fit(x, D, fn):
     g5 = M-D.Mmx
 
 
-    # vectorization
-    f = np.array([f1, f2])
-    g = np.array([g1, g2, g3, g4, g5])  
+    # vectorization: one row of objectives and constraints per design
+    f = np.stack([f1, f2], axis=-1)
+    g = np.stack([g1, g2, g3, g4, g5], axis=-1)
     return f, g
 
 def draw_inductor():
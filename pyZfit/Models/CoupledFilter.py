@@ -4,7 +4,7 @@ See LTspice schematic in ./Data/CoupledFilter.asc
 """
 
 import numpy as np
-import numpy.linalg as la
+from zfit_matrix import stack_matrix, stack_solve
 
 j = 1j
 
@@ -54,32 +54,27 @@ def model(w, params, **kws):
     # inductor currents (see "MatrixGen.py").  The network is driven with input voltage =
     # 1, so network impedance is just 1 / input current.
 
-    # A and B matrices from "MatrixGen.py":
-    def get_A(s, Zl):
-        # Evaluate A matrix for a single point in s and Zl
-        A = np.array([
-            [1/Rs1+1/Rp1+1/(L1*s), -1/Rp1-1/(L1*s)           , 0                   , 0                        , 0              , 0                 , 0     , -M1/L1, 0     ],
-            [1/Rp1+1/(L1*s)      , -C1*s-1/Rs1-1/Rp1-1/(L1*s), 1/Rs1               , 0                        , 0              , 0                 , 0     , -M1/L1, 0     ],
-            [0                   , -1/Rs1                    , 1/Rs1+1/Rp2+1/(L2*s), -1/Rp2-1/(L2*s)          , 0              , 0                 , -M1/L2, 0     , -M2/L2],
-            [0                   , 0                         , -1/Rp2-1/(L2*s)     , C2*s+1/Rs2+1/Rp2+1/(L2*s), -1/Rs2         , 0                 , M1/L2 , 0     , M2/L2 ],
-            [0                   , 0                         , 0                   , 1/Rs2                    , -1/Rs2-1/(L3*s), 1/(L3*s)          , 0     , M2/L3 , 0     ],
-            [0                   , 0                         , 0                   , 0                        , -1/(L3*s)      , C3*s+1/Zl+1/(L3*s), 0     , M2/L3 , 0     ],
-            [-1                  , 1                         , 0                   , 0                        , 0              , 0                 , L1*s  , M1*s  , 0     ],
-            [0                   , 0                         , -1                  , 1                        , 0              , 0                 , M1*s  , L2*s  , M2*s  ],
-            [0                   , 0                         , 0                   , 0                        , -1             , 1                 , 0     , M2*s  , L3*s  ]
-        ])
-        return A
+    # A and B matrices from "MatrixGen.py", evaluated for all s and loads at once
+    s = j*w
+    Zl = load
+    A = stack_matrix([
+        [1/Rs1+1/Rp1+1/(L1*s), -1/Rp1-1/(L1*s)           , 0                   , 0                        , 0              , 0                 , 0     , -M1/L1, 0     ],
+        [1/Rp1+1/(L1*s)      , -C1*s-1/Rs1-1/Rp1-1/(L1*s), 1/Rs1               , 0                        , 0              , 0                 , 0     , -M1/L1, 0     ],
+        [0                   , -1/Rs1                    , 1/Rs1+1/Rp2+1/(L2*s), -1/Rp2-1/(L2*s)          , 0              , 0                 , -M1/L2, 0     , -M2/L2],
+        [0                   , 0                         , -1/Rp2-1/(L2*s)     , C2*s+1/Rs2+1/Rp2+1/(L2*s), -1/Rs2         , 0                 , M1/L2 , 0     , M2/L2 ],
+        [0                   , 0                         , 0                   , 1/Rs2                    , -1/Rs2-1/(L3*s), 1/(L3*s)          , 0     , M2/L3 , 0     ],
+        [0                   , 0                         , 0                   , 0                        , -1/(L3*s)      , C3*s+1/Zl+1/(L3*s), 0     , M2/L3 , 0     ],
+        [-1                  , 1                         , 0                   , 0                        , 0              , 0                 , L1*s  , M1*s  , 0     ],
+        [0                   , 0                         , -1                  , 1                        , 0              , 0                 , M1*s  , L2*s  , M2*s  ],
+        [0                   , 0                         , 0                   , 0                        , -1             , 1                 , 0     , M2*s  , L3*s  ]
+    ])
 
-    # B matrix is constant over s and Zl
-    B_row = np.array([1/Rs1, 0, 0, 0, 0, 0, 0, 0, 0])
-    # Convert single row to column
-    B = B_row[:,None]
+    # B vector is constant over s and load
+    B = [1/Rs1, 0, 0, 0, 0, 0, 0, 0, 0]
 
     # Solution vector = [v1,v2,v3,v4,v5,v6,i3,i7,i10] (see "MatrixGen.py")
-    soln = np.array([la.solve(get_A(j*_w, _Zl), B) for _w, _Zl in zip(w, load)])
-    # List comprehension like this results in transposed matrix, so extract
-    # *column* 0 and flatten it from lists of one number to only the number
-    v1 = soln[:,0].flatten()
+    soln = stack_solve(A, B)
+    v1 = soln[..., 0]
     # Input current is difference between source (1.0) and v1, through Rs1
     i_in = (1.0-v1)/Rs1
     # Input impedance is source voltage (1.0) over input current
@@ -3,7 +3,7 @@ Model script for matrix solution exp't, with coupled windings.
 """
 
 import numpy as np
-import numpy.linalg as la
+from zfit_matrix import stack_matrix, stack_solve
 
 j = 1j
 
@@ -37,32 +37,19 @@ def model(w, params, **kws):
     # inductor currents (see "MatrixSolnExpt.ipynb").  The network is driven with input voltage =
     # 1, so network impedance is just 1 / input current.
 
-    # A and B matrices from "MatrixSolnExpt.ipynb":
-    def get_A(s):
-        # Evaluate A matrix for a single point in s and Zl
-        A = np.array([
-            [-1/(s*L1) - 1/(s*L2) - 1/R1, 1/(s*L2)        , M/L2 , -M/L1],
-            [1/(s*L2)                   , -1/(s*L2) - s*C1, -M/L2, 0    ],
-            [1                          , 0               , s*L1 , s*M  ],
-            [-1                         , 1               , s*M  , s*L2 ]
-        ])
-        return A
-
-    def get_B(s):
-        # Evaluate B matrix for single s point
-        B = np.array([
-            [-1/(s*L1)],
-            [0],
-            [1],
-            [0]
-        ])
-        return B
+    # A and B matrices from "MatrixSolnExpt.ipynb", evaluated for all s at once
+    s = j*w
+    A = stack_matrix([
+        [-1/(s*L1) - 1/(s*L2) - 1/R1, 1/(s*L2)        , M/L2 , -M/L1],
+        [1/(s*L2)                   , -1/(s*L2) - s*C1, -M/L2, 0    ],
+        [1                          , 0               , s*L1 , s*M  ],
+        [-1                         , 1               , s*M  , s*L2 ]
+    ])
+    B = [-1/(s*L1), 0, 1, 0]
 
     # Solution vector = [v2,v3,i1,i2] (see "MatrixSolnExpt.ipynb")
-    soln = np.array([la.solve(get_A(j*_w), get_B(j*_w)) for _w in w])
-    # List comprehension like this results in transposed matrix, so extract
-    # *column* 2 and flatten it from lists of one number to only the number
-    i1 = soln[:,2].flatten()
+    soln = stack_solve(A, B)
+    i1 = soln[..., 2]
     # Input impedance is source voltage (1.0) over input current
     Z = 1.0/i1
 
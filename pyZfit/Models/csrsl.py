@@ -34,6 +34,21 @@ def model(w, params, **kws):
     return R + 1.0/(j*w*C) + j*w*L
 
 
+def jacobian(w, params, **kws):
+    """
+    Optional: derivatives of the model impedance with respect to each param,
+    used by the Jacobian-based fitting methods instead of finite differences.
+    :param w: radian frequency array
+    :param params: list of component values to apply to the model equations
+    :param kws: dict of optional args (eg load, fsf, zsf)
+    :return: dict of param name: complex derivative array corresponding to freqs w
+    """
+    C = params['C']
+    return {'R': np.ones_like(w, dtype=complex),
+            'C': -1.0/(j*w*C**2),
+            'L': j*w}
+
+
 if __name__ == "__main__":
     import numpy as np
     import matplotlib.pyplot as plt
@@ -15,6 +15,16 @@ PARAMS = [
     {"name": "Rp", "init":   1.00e3, "vary": True, "min":      0.0, "max":  1.00e12},
 ]
 
+def prepare(w, load):
+    """
+    Terms which depend only on the data, computed once per fit and passed
+    to model() as kws["prep"].
+    :param w: radian frequency array
+    :param load: load impedance array
+    :return: dict of precomputed arrays
+    """
+    return {"jw": j*w, "sqrt_w": np.sqrt(w)}
+
 def model(w, params, **kws):
     """
     Calculate impedance using equations here for all frequencies w.
@@ -25,6 +35,9 @@ def model(w, params, **kws):
     :param kws: dict of optional args (eg load, fsf, zsf)
     :return: complex impedance array corresponding to freqs w
     """
+    # Frequency terms, precomputed by prepare() when called from Zfit
+    prep = kws.get("prep") or prepare(w, kws.get("load"))
+    jw, sqrt_w = prep["jw"], prep["sqrt_w"]
     # Extract individual component values from params list
     L = params['L']
     sf = params['sf']
@@ -33,7 +46,7 @@ def model(w, params, **kws):
     # This is the definition of the model impedance which we want to
     # fit to the data points.  Modify it to represent the circuit you
     # want to fit to the data.
-    Zlr = j*w*L + Rs + sf*np.sqrt(w)
+    Zlr = jw*L + Rs + sf*sqrt_w
     Y = 1/Zlr + 1/Rp
     Z = 1/Y
     return Z
@@ -26,7 +26,6 @@ class AppMainWindow(QtWidgets.QMainWindow, Ui_MainWindow):
         # setup the GUI --> function generated by pyuic5
         self.setupUi(self)
 
-        self.prog_bar_tick = 0
         self.plot_file_path = ""
 
         # Restore last file & path names or empty strings
@@ -156,19 +155,18 @@ class Range:
         self.load_array = None
         self.segment_str = ""
         self.segment_index = 0
+        # SegmentedDataset of all segments, shared with the YAxes class
+        self.dataset = None
 
-    def data_bundle(self):
-        # Return a list of copies of the current data
-        x = copy.copy(self.xa)
-        l = copy.copy(self.load_array)
-        s = copy.copy(self.segment_str)
-        return [x, l, s]
-
-    def data_unbundle(self, group):
-        # Complement of function above
-        self.xa = group[0]
-        self.load_array = group[1]
-        self.segment_str = group[2]
+    def select_segment(self, i):
+        # Point the frequency and load arrays at views of segment i of
+        # the dataset
+        ds = self.dataset
+        s = ds.segment_slice(i)
+        self.xa = {"Hz": ds.hz[s], "omega": 2.0*np.pi*ds.hz[s]}
+        self.load_array = ds.load[s]
+        self.segment_str = ds.segment_strs[i]
+        self.segment_index = i
 
 
 def zfit_excepthook(type, value, tb):
@@ -216,9 +214,7 @@ def clear_active_axes():
     ix = ya.index
 
     # Remove all added plot lines (includes drawn points), but leave data
-    for line in ya.ax[ix].get_lines():
-        if line.get_label() != "Zdata":
-            line.remove()
+    render.clear(ya.ax[ix], keep=("Zdata",))
 
     # Null array for drawn models
     if ix != W:
@@ -238,37 +234,10 @@ def clear_active_axes():
 
 def read_and_plot_data_file(file):
 
-    class Data:
-        """
-        A class to hold data structures used locally and to perform common
-        append operations
-        """
-        def __init__(self):
-            self.reset()
-
-        def reset(self):
-            # Set default and empty variables
-            self.hz, self.omega, self.mag, self.pha, self.load = [], [], [], [], []
-            self.segment_str = ""
-            self.segment_code = compile("1", "<string>", "eval")
-
-        def append(self):
-            # Copy local lists to working arrays
-            range.xa["Hz"] = np.array(self.hz)
-            range.xa["omega"] = np.array(self.omega)
-            ya.inputData[M] = np.array(self.mag)
-            ya.inputData[P] = np.array(self.pha)
-            range.load_array = np.array(self.load)
-            range.segment_str = self.segment_str
-            # Append working arrays to segment lists
-            ya_list.append(ya.data_bundle())
-            range_list.append(range.data_bundle())
-
     while True:
         # Clear any existing data, drawn, or modeling lines
         for ax in ya.ax:
-            for line in ax.get_lines():
-                line.remove()
+            render.clear(ax)
 
         # Clear text windows
         amw.labelStatus.setText("")
@@ -280,64 +249,25 @@ def read_and_plot_data_file(file):
         ya.modeledData = [None, None, None]
         ya.drawnData = [None, None, None]
 
-        # Clear data segment lists
-        ya_list.clear()
-        range_list.clear()
-
-        # Create and clear local data class
-        d = Data()
-        d.reset()
         try:
-            # Read and plot impedance data to lists from CSV file with one header line
-            # (use lists instead of ndarrays because appending to ndarrays doesn't work well)
-            # There may be several segments with <segment> lines between them.  Append each
-            # segment to a local list.
-            with open(file, "r", encoding="utf-8", newline='') as f:
-                # Skip single header line
-                next(f)
-                for line in f:
-                    if line[:9] == "<segment>":
-                        # <segment> line defines break between segments, or the first segment.
-                        # May or may not be present.
-                        if d.hz:
-                            # Data exists in d, append segment just read
-                            d.append()
-                        # Starting a new data segment
-                        d.reset()
-                        d.segment_str = line[9:].strip()
-                        try:
-                            # Compile segment expression (may simply be a comment)
-                            d.segment_code = compile(d.segment_str, "<string>", "eval")
-                        except:
-                            d.reset()
-                    else:
-                        # Read freq, mag, and phase
-                        elems = line.strip().split(',')
-                        freq = float(elems[0])
-                        d.hz.append(freq)
-                        d.mag.append(float(elems[1]))
-                        d.pha.append(float(elems[2]))
-                        # Calculate radian freq and complex load (if provided)
-                        w = 2.0*np.pi*freq
-                        d.omega.append(w)
-                        j = 1j
-                        # w and j are now defined for use in load expression
-                        d.load.append(eval(d.segment_code))
+            # Read all segments of the CSV data file at once.  There may be several
+            # segments with <segment> lines between them.
+            ds = zfit_data.read_data_file(file)
             # Successful loading of data file, break from while loop
             break
         except:
             # Pick a data file and loop again
             start = path.dirname(amw.lineEditData.text())
             file = QtWidgets.QFileDialog.getOpenFileName(caption="Data File", directory=start,
-                                                         filter="CSV files (*.csv)")[0]
+                                                         filter="Data files (*.csv *.bode3 *.txt *.s1p *.s2p *.ts)")[0]
             file = path.normpath(file)
             amw.lineEditData.setText(file)
             reg.set_reg("DataFilename", file)
 
-    # Final append for data with no <segment> or for last <segment> segment.
-    # The last segment in the list is the one being displayed.
-    d.append()
-    range.segment_index = len(ya_list) - 1
+    # Share the dataset, and select views of its last segment for display
+    ya.dataset = range.dataset = ds
+    range.select_segment(len(ds) - 1)
+    ya.select_segment(len(ds) - 1)
 
     # Display segment string if segment is present
     if not range.segment_str:
@@ -350,7 +280,7 @@ def read_and_plot_data_file(file):
         amw.lineEditSegment.setText(range.segment_str)
 
     # Enable drawing curves & disable Next if only one segment is present
-    if len(ya_list) == 1:
+    if len(ds) == 1:
         amw.groupBoxDrawing.setEnabled(True)
         amw.pushButtonNext.setEnabled(False)
     else:
@@ -358,11 +288,11 @@ def read_and_plot_data_file(file):
         amw.pushButtonNext.setEnabled(True)
 
     # Add input data to plot
-    ya.ax[M].plot(range.xa["Hz"], ya.inputData[M], ".", ms=3, color=M_COLOR, label="Zdata")
-    ya.ax[P].plot(range.xa["Hz"], ya.inputData[P], ".", ms=3, color=P_COLOR, label="Zdata")
+    render.set_line(ya.ax[M], "Zdata", range.xa["Hz"], ya.inputData[M], ".", ms=3, color=M_COLOR)
+    render.set_line(ya.ax[P], "Zdata", range.xa["Hz"], ya.inputData[P], ".", ms=3, color=P_COLOR)
 
-    # Default weighting curve is all 1's
-    ya.drawnData[W] = np.ones(len(ya.inputData[M]))
+    # Default weighting curve is the dataset's, all 1's
+    ya.drawnData[W] = ds.weight
 
     draw_formatted()
 
@@ -370,25 +300,25 @@ def read_and_plot_data_file(file):
 def next_plot():
     # 'Next' button click:
     # Button is enabled, so multiple data segments exist.
-    # Clear any existing data, drawn, or modeling lines
+    # Clear any existing drawn lines; the data and modeling lines are updated
     for ax in ya.ax:
-        for line in ax.get_lines():
-            line.remove()
-
-    range.segment_index += 1
-    if range.segment_index >= len(ya_list):
-        range.segment_index = 0
-    ya.data_unbundle(ya_list[range.segment_index])
-    range.data_unbundle(range_list[range.segment_index])
+        render.clear(ax, keep=("Zdata", "modeledZPlot"))
+
+    i = range.segment_index + 1
+    if i >= len(range.dataset):
+        i = 0
+    range.select_segment(i)
+    ya.select_segment(i)
     amw.lineEditSegment.setText(range.segment_str)
 
-    ya.ax[M].plot(range.xa["Hz"], ya.inputData[M], ".", ms=3, color=M_COLOR, label="Zdata")
-    ya.ax[P].plot(range.xa["Hz"], ya.inputData[P], ".", ms=3, color=P_COLOR, label="Zdata")
-    if ya.modeledData[M] is not None:
-        ya.ax[M].plot(range.xa["Hz"], ya.modeledData[M], ya.modeledLinePlot[M],
-                      ls=ya.modeledLineStyle[M], lw=1, label="modeledZPlot")
-        ya.ax[P].plot(range.xa["Hz"], ya.modeledData[P], ya.modeledLinePlot[P],
-                      ls=ya.modeledLineStyle[P], lw=1, label="modeledZPlot")
+    render.set_line(ya.ax[M], "Zdata", range.xa["Hz"], ya.inputData[M], ".", ms=3, color=M_COLOR)
+    render.set_line(ya.ax[P], "Zdata", range.xa["Hz"], ya.inputData[P], ".", ms=3, color=P_COLOR)
+    for ix in (M, P):
+        if ya.modeledData[ix] is None:
+            render.hide_line(ya.ax[ix], "modeledZPlot")
+        else:
+            render.set_line(ya.ax[ix], "modeledZPlot", range.xa["Hz"], ya.modeledData[ix],
+                            ya.modeledLinePlot[ix], ls=ya.modeledLineStyle[ix], lw=1)
 
     draw_formatted()
 
@@ -447,7 +377,7 @@ def axes_init(amw):
 def select_data_file():
     start = path.dirname(amw.lineEditData.text())
     file = QtWidgets.QFileDialog.getOpenFileName(caption="Data File", directory=start,
-                                             filter="CSV files (*.csv)")[0]
+                                             filter="Data files (*.csv *.bode3 *.txt *.s1p *.s2p *.ts)")[0]
     if file:
         file = path.normpath(file)
         amw.lineEditData.setText(file)
@@ -485,16 +415,16 @@ def edit_model_script():
 
 def on_click(event):
     # 'event' applies to the currently active axes
-    if (event.inaxes is None) or (event.button != 1) or (len(ya_list) > 1):
+    if (event.inaxes is None) or (event.button != 1) or (len(range.dataset) > 1):
         # Click is outside axes or not left-click, or multiple data segments exist
         return
     # Get index for axis-dependent selections
     ix = ya.index
-    # .xdata and .ydata are in data coords for the active axes
-    ya.ax[ix].plot(event.xdata, event.ydata, marker="s", ms=4,
-                   color=ya.dataColor[ix], picker=5,
-                   label="drawnPoint")
-    draw_formatted()
+    # .xdata and .ydata are in data coords for the active axes.
+    # The point is blitted onto the plot, without a full redraw.
+    render.add_point(ya.ax[ix], event.xdata, event.ydata, marker="s", ms=4,
+                     color=ya.dataColor[ix], picker=5,
+                     label="drawnPoint")
 
 
 def on_pick(event):
@@ -550,12 +480,11 @@ def draw_active():
     ix = ya.index
     pointcoord = []
 
-    # Remember drawnPlot coordinates, delete existing drawnPlot line
+    # Remember drawnPlot coordinates, hide existing drawnPlot line
     for line in ya.ax[ix].get_lines():
         if line.get_label() == "drawnPoint":
             pointcoord.append(line.get_data())
-        if line.get_label() == "drawnPlot":
-            line.remove()
+    render.hide_line(ya.ax[ix], "drawnPlot")
 
     if pointcoord == []:
         # No points to draw
@@ -583,8 +512,8 @@ def draw_active():
                 point = 1.0
 
     # Add drawn plot
-    ya.ax[ix].plot(range.xa["Hz"], ya.drawnData[ix], ya.drawnLinePlot[ix],
-                   ls="-", lw=1, label="drawnPlot")
+    render.set_line(ya.ax[ix], "drawnPlot", range.xa["Hz"], ya.drawnData[ix],
+                    ya.drawnLinePlot[ix], ls="-", lw=1)
     draw_formatted()
 
 
@@ -643,8 +572,9 @@ def draw_formatted():
         # Check data, spline, and model lines for min/max
         bmax, bmin = 0.0, 0.0
         for line in ya.ax[M].get_lines():
-            bmax = max(bmax, max(line._y))
-            bmin = min(bmin, min(line._y))
+            if line.get_visible() and len(line.get_ydata()):
+                bmax = max(bmax, max(line.get_ydata()))
+                bmin = min(bmin, min(line.get_ydata()))
         ya.ax[M].set_ybound(lower=.83 * bmin, upper=1.2 * bmax)
 
     # Need to set formatter again if X scale was changed
@@ -652,8 +582,8 @@ def draw_formatted():
     ya.ax[M].xaxis.set_major_formatter(formatter)
     ya.ax[P].xaxis.set_major_formatter(formatter)
 
-    # Finally do the draw
-    amw.mpl.canvas.draw()
+    # Finally do the draw, of the lines decimated for the new limits
+    render.draw()
 
 
 def show_help():
@@ -673,28 +603,23 @@ if __name__ == "__main__":
 
     # import the MainWindow widget from the converted .ui file
     import subprocess
-    import copy
     # Zfit modules:
     from zfit_constants import *
     import zfit_modelcore
+    import zfit_data
     import zfit_yaxes
     import zfit_registry as reg
+    import zfit_render
 
     # Instantiate class to keep track of the active Y axis
     ya = zfit_yaxes.YAxes(W)
-    # Keep a list of mag, pha, and weight data for all data segments here
-    ya_list = []
     # Instantiate range class
     range = Range()
-    # Keep a list of load data for all data segments here
-    range_list = []
     
     # Instantiate and link the modeling class
     mc = zfit_modelcore.DoModel()
     mc.ya = ya
-    mc.ya_list = ya_list
     mc.range = range
-    mc.range_list = range_list
     mc.print_results = print_results
     mc.draw_formatted = draw_formatted
 
@@ -705,6 +630,9 @@ if __name__ == "__main__":
     app = QtWidgets.QApplication(sys.argv)
     # Instantiate the main window
     amw = AppMainWindow()
+    # Persistent, decimated plot lines
+    render = zfit_render.Renderer(amw.mpl.canvas)
+    mc.render = render
     # Initialize and show axes
     axes_init(amw)
     amw.show()
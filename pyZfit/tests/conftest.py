@@ -0,0 +1,10 @@
+"""
+Tests of the Zfit modules, run from the pyZfit folder:
+    python -m pytest -q tests
+"""
+
+import os
+import sys
+
+# The Zfit modules are flat files in the folder above
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
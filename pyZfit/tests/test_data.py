@@ -0,0 +1,95 @@
+"""
+Bulk data file reading against a line-by-line reference parser.
+"""
+
+import glob
+import importlib
+import os
+
+import numpy as np
+import pytest
+
+import zfit_cache
+import zfit_data
+
+DATA = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "TestDataFiles")
+
+
+def read_lines(file):
+    # Line-by-line parser, as data files were read before the bulk loader:
+    # list of (segment_str, hz, mag, pha, load) per segment
+    segments, rows, segment_str = [], [], ""
+    code = compile("1", "<string>", "eval")
+    with open(file, "r", encoding="utf-8", newline='') as f:
+        next(f)
+        for line in f:
+            if line[:9] == "<segment>":
+                if rows:
+                    segments.append((segment_str, *map(np.array, zip(*rows))))
+                rows, segment_str = [], line[9:].strip()
+                try:
+                    code = compile(segment_str, "<string>", "eval")
+                except SyntaxError:
+                    code = compile("1", "<string>", "eval")
+            elif line.strip():
+                elems = line.strip().split(',')
+                freq = float(elems[0])
+                load = eval(code, dict(zfit_data.LOAD_NAMESPACE, w=2.0*np.pi*freq, j=1j))
+                rows.append((freq, float(elems[1]), float(elems[2]), complex(load)))
+    segments.append((segment_str, *map(np.array, zip(*rows))))
+    return segments
+
+
+@pytest.mark.parametrize("file", sorted(glob.glob(os.path.join(DATA, "*.csv"))),
+                         ids=os.path.basename)
+def test_matches_line_parser(file):
+    ds = zfit_data.read_data_file(file, cache=False)
+    ref = read_lines(file)
+    assert len(ds) == len(ref)
+    for seg, (segment_str, hz, mag, pha, load) in zip(ds, ref):
+        assert seg.segment_str == segment_str
+        assert np.array_equal(seg.hz, hz)
+        assert np.array_equal(seg.mag, mag)
+        assert np.array_equal(seg.pha, pha)
+        assert np.allclose(seg.load, load, rtol=1e-15, atol=0)
+
+
+def test_segments(tmp_path):
+    file = tmp_path / "data.csv"
+    file.write_text("Hz,Mag,Phase\n"
+                    "1e3,1,0\n"
+                    "<segment> 50 # one\n"
+                    "2e3,2,10\n3e3,3,20\n"
+                    "<segment> 1/(j*w*1e-9)\n"
+                    "4e3,4,30\n"
+                    "<segment> a comment, no load\n"
+                    "5e3,5,40\n")
+    ds = zfit_data.read_data_file(str(file), cache=False)
+    assert list(ds.offsets) == [0, 1, 3, 4, 5]
+    assert [seg.segment_str for seg in ds] == ["", "50 # one", "1/(j*w*1e-9)", ""]
+    assert np.array_equal(ds.load[[0, 1, 2, 4]], [1, 50, 50, 1])
+    assert ds.load[3] == pytest.approx(1/(1j*2*np.pi*4e3*1e-9))
+
+
+@pytest.mark.parametrize("expr, scalar", [
+    ("50 if w > 1e6 else 0", lambda w: 50 if w > 1e6 else 0),
+    ("complex(10, w*1e-6)", lambda w: complex(10, w*1e-6)),
+])
+def test_scalar_only_load(expr, scalar):
+    # Expressions that fail on arrays are evaluated point by point
+    w = 2*np.pi*np.logspace(4, 7, 20)
+    assert np.array_equal(zfit_data.eval_load(expr, w), [scalar(x) for x in w])
+
+
+@pytest.mark.parametrize("name, module", [("data.csv", None), ("data.bode3", "zfit_bode3"),
+                                          ("data.txt", "zfit_ltspice"),
+                                          ("data.s2p", "zfit_touchstone"),
+                                          ("data.ts", "zfit_touchstone")])
+def test_cache_key_reader_version(monkeypatch, tmp_path, name, module):
+    # A new version of the module reading a file misses the cache
+    file = tmp_path / name
+    file.write_bytes(b"contents")
+    key = zfit_cache.cache_key(str(file))
+    module = zfit_data if module is None else importlib.import_module(module)
+    monkeypatch.setattr(module, "LOADER_VERSION", module.LOADER_VERSION + 1)
+    assert zfit_cache.cache_key(str(file)) != key
@@ -0,0 +1,66 @@
+"""
+Fits recovering the params of synthetic data.
+"""
+
+import os
+
+import numpy as np
+import pytest
+
+import zfit_data
+import zfit_modelcore_cli as cli
+from zfit_models import load_model
+
+DATA = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "TestDataFiles")
+
+
+def synthetic(model, scale=1.0, hz=None, load=50.0):
+    # Model impedance at params scaled from the PARAMS inits
+    hz = np.logspace(3, 7, 300) if hz is None else hz
+    values = {p["name"]: p["init"]*scale for p in model.PARAMS}
+    load = np.full(len(hz), load, dtype=complex)
+    z = model.model(2*np.pi*hz, values, load=load, fsf=1.0, zsf=1.0)
+    return values, hz, z, load
+
+
+def fit(model, hz, z, load, method="leastsq", **kws):
+    method_nr = [m[1] for m in cli.METHODS].index(method)
+    return cli.DoModel().do_model_arrays(model, hz, np.abs(z), np.angle(z, deg=True),
+                                         load, method_nr, **kws)
+
+
+@pytest.mark.parametrize("limits", ["lmfit", "zfit"])
+def test_leastsq_recovers_params(monkeypatch, limits):
+    # With zfit limits leastsq has no Dfun and differences earlier residual
+    # arrays itself, which must not be overwritten by later calls
+    monkeypatch.setattr(cli, "LIMITS", limits)
+    model = load_model("ls(cpr)")
+    values, hz, z, load = synthetic(model, 1.3)
+    fitted, result, chisqr = fit(model, hz, z, load)
+    assert result.nfev > 10
+    assert chisqr < 1e-12
+    for name, val in fitted:
+        assert val == pytest.approx(values[name], rel=1e-5)
+
+
+@pytest.mark.parametrize("method", ["leastsq", "least_squares"])
+@pytest.mark.parametrize("name", ["ls(cpr)", "rpcpl", "xfmr1"])
+def test_jacobian_fit_recovers_params(method, name):
+    # lmfit limits: the fit uses zfit_jacobian's Jacobian
+    model = load_model(name)
+    values, hz, z, load = synthetic(model, 0.85)
+    fitted, result, chisqr = fit(model, hz, z, load, method)
+    assert chisqr < 1e-12
+    for name, val in fitted:
+        assert val == pytest.approx(values[name], rel=1e-4)
+
+
+def test_normalized_load_fit():
+    # The load must be normalized with the target impedance: both fits of
+    # the sample file reach the same minimum
+    ds = zfit_data.read_data_file(os.path.join(DATA, "Sample rs(c+load).csv"), cache=False)
+    model = load_model("rs(c+load)")
+    chisqr = [cli.DoModel().do_model_arrays(model, ds.hz, ds.mag, ds.pha, ds.load,
+                                            do_norm_denorm=norm)[2] for norm in (True, False)]
+    assert chisqr[0] == pytest.approx(chisqr[1], rel=1e-6)
+    assert chisqr[0] < 11.0
@@ -0,0 +1,26 @@
+"""
+Ranking of the fit benchmark results.
+"""
+
+from zfit_fitbench import rank
+
+
+def result(method, chisqr, wall_time, success=True):
+    return {"dataset": "d.csv", "model": "m", "method": method, "success": success,
+            "chisqr": chisqr, "nfev": 10, "wall_time": wall_time, "message": ""}
+
+
+def test_rank_exact_fits():
+    # Best chi-square near zero: fits reaching rounding level count as converged
+    rows = rank([result("leastsq", 1e-28, 2.0), result("least_squares", 3e-24, 1.0),
+                 result("nelder", 1e-12, 3.0), result("powell", 1e-3, 0.5),
+                 result("cg", 1e-30, 0.1, success=False)])
+    assert [r["method"] for r in rows] == ["least_squares", "leastsq", "nelder", "powell", "cg"]
+    assert [r["converged"] for r in rows] == [True, True, True, False, False]
+
+
+def test_rank_relative():
+    rows = rank([result("leastsq", 100.0, 2.0), result("nelder", 100.5, 1.0),
+                 result("powell", 102.0, 0.5)])
+    assert [r["method"] for r in rows] == ["nelder", "leastsq", "powell"]
+    assert [r["converged"] for r in rows] == [True, True, False]
@@ -0,0 +1,80 @@
+"""
+Estimated Jacobians against carefully converged central differences.
+"""
+
+import numpy as np
+import pytest
+from lmfit import Parameters
+
+from zfit_jacobian import model_jacobian, residual_jacobian
+from zfit_models import load_model
+from zfit_residual import ResidualEngine
+
+W = 2*np.pi*np.logspace(3, 7, 200)
+KWS = {"load": np.full(len(W), 50.0+0j), "fsf": 1.0, "zsf": 1.0}
+
+
+def reference_jacobian(fcn, values, names, rel=1e-2):
+    # Richardson extrapolated central differences, one param at a time,
+    # with steps large enough for the model's rounding not to matter
+    cols = []
+    for name in names:
+        def diff(h):
+            up, down = dict(values), dict(values)
+            up[name] += h
+            down[name] -= h
+            return (fcn(up) - fcn(down)) / (2*h)
+        h = rel*abs(values[name])
+        cols.append((4*diff(h/2) - diff(h)) / 3)
+    return np.column_stack(cols)
+
+
+def column_errors(jac, ref):
+    # Largest error of each column, relative to the column's largest value
+    return np.max(np.abs(jac - ref), axis=0) / np.max(np.abs(ref), axis=0)
+
+
+@pytest.mark.parametrize("name", ["ls(cpr)", "xfmr2", "CoupledFilter"])
+def test_model_jacobian(name):
+    model = load_model(name)
+    values = {p["name"]: p["init"] for p in model.PARAMS}
+    names = [p["name"] for p in model.PARAMS if p["vary"]]
+    jac = model_jacobian(model, W, values, names, **KWS)
+    ref = reference_jacobian(lambda v: model.model(W, v, **KWS), values, names)
+    err = column_errors(jac, ref)
+    assert np.all(err < 1e-3), dict(zip(names, err))
+
+
+@pytest.mark.parametrize("log_mag", [True, False])
+def test_residual_jacobian(log_mag):
+    model = load_model("ls(cpr)")
+    values = {p["name"]: p["init"] for p in model.PARAMS}
+    params = Parameters()
+    for name, val in values.items():
+        params.add(name, value=val)
+    z = model.model(W, {k: 1.1*v for k, v in values.items()}, **KWS)
+    weight = np.linspace(0.5, 2.0, len(W))
+    residuals = ResidualEngine(model, z, weight, log_mag)
+    jac = residual_jacobian(model, params, W, z, weight, log_mag, **KWS)
+    # Steps of 1e-2 are too coarse at the resonance for the log residuals
+    ref = reference_jacobian(lambda v: residuals(v, W, **KWS), values, list(values), 1e-3)
+    assert np.all(column_errors(jac, ref) < 1e-6)
+
+
+@pytest.mark.parametrize("log_mag", [True, False])
+def test_gui_dfun_uses_fit_log_mag(log_mag):
+    # The GUI's Jacobian runs on the fit's worker thread, so it must follow
+    # the residual engine of the fit and never read the window (amw)
+    import zfit_modelcore
+    model = load_model("ls(cpr)")
+    values = {p["name"]: p["init"] for p in model.PARAMS}
+    params = Parameters()
+    for name, val in values.items():
+        params.add(name, value=val)
+    z = model.model(W, {k: 1.1*v for k, v in values.items()}, **KWS)
+    weight = np.ones(len(W))
+    dm = zfit_modelcore.DoModel()
+    dm.model = model
+    dm._residual_engine(z, weight, log_mag)
+    jac = dm._dfun(params, W, z, weight, **KWS)
+    assert np.array_equal(jac, residual_jacobian(model, params, W, z, weight, log_mag, **KWS))
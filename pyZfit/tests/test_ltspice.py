@@ -0,0 +1,137 @@
+"""
+LTspice waveform exports and .raw files, written synthetically.
+"""
+
+import numpy as np
+import pytest
+
+import zfit_data
+import zfit_ltspice
+
+HZ = np.logspace(1, 6, 37)
+# One run per step: series R-L with R stepped
+RUNS = [r + 1j*2*np.pi*HZ*1e-3 for r in (1.0, 10.0, 100.0)]
+STEPS = ["Rl=1", "Rl=10", "Rl=100"]
+
+
+def export_row(hz, values, fmt):
+    # One line of an export, as LTspice writes it
+    if fmt == "cartesian":
+        cols = ["{:.15e},{:.15e}".format(v.real, v.imag) for v in values]
+    elif fmt == "db":
+        cols = ["({:.15e}dB,{:.15e}\xb0)".format(20*np.log10(abs(v)), np.angle(v, deg=True))
+                for v in values]
+    elif fmt == "polar":
+        cols = ["({:.15e},{:.15e}\xb0)".format(abs(v), np.angle(v, deg=True)) for v in values]
+    else:
+        cols = ["{:.15e}".format(v) for v in values]
+    return "\t".join(["{:.15e}".format(hz)] + cols) + "\r\n"
+
+
+def write_export(path, fmt, runs, steps=None, encoding="latin-1"):
+    # Export of two traces, V(n001) and twice its value, for each run
+    x_name = "Freq." if fmt != "real" else "time"
+    lines = [x_name + "\tV(n001)\tV(n002)\r\n"]
+    for k, z in enumerate(runs):
+        if steps:
+            lines.append("Step Information: {}  (Run: {}/{})\r\n".format(steps[k], k + 1, len(runs)))
+        lines += [export_row(h, (v, 2*v), fmt) for h, v in zip(HZ, z)]
+    data = "".join(lines)
+    if encoding == "utf-16-le":
+        path.write_bytes(b"\xff\xfe" + data.encode(encoding))
+    else:
+        path.write_bytes(data.encode(encoding))
+    return str(path)
+
+
+@pytest.mark.parametrize("chunk_bytes", [zfit_ltspice.CHUNK_BYTES, 100])
+@pytest.mark.parametrize("encoding", ["latin-1", "utf-8", "utf-16-le"])
+@pytest.mark.parametrize("fmt", ["cartesian", "db", "polar"])
+def test_export(tmp_path, fmt, encoding, chunk_bytes):
+    # Small chunks split lines and step information across blocks
+    file = write_export(tmp_path / "export.txt", fmt, RUNS, STEPS, encoding)
+    export = zfit_ltspice.read_export(file, chunk_bytes)
+    assert export.fmt == fmt
+    assert export.x_name == "Freq." and export.names == ["V(n001)", "V(n002)"]
+    assert list(export.offsets) == [0, 37, 74, 111]
+    # Step information with runs of spaces collapsed
+    assert export.step_strs == ["{} (Run: {}/3)".format(s, k + 1) for k, s in enumerate(STEPS)]
+    assert np.allclose(export.x, np.tile(HZ, 3), rtol=1e-14)
+    z = np.concatenate(RUNS)
+    assert np.allclose(export.trace("V(n001)"), z, rtol=1e-12)
+    assert np.allclose(export.trace(1), 2*z, rtol=1e-12)
+
+
+def test_real_export(tmp_path):
+    file = write_export(tmp_path / "tran.txt", "real", [np.linspace(-1, 1, len(HZ))])
+    export = zfit_ltspice.read_export(file, 64)
+    assert export.fmt == "real" and export.step_strs == [""]
+    assert np.allclose(export.trace(0), np.linspace(-1, 1, len(HZ)), rtol=1e-14)
+
+
+def test_read_data_file(tmp_path):
+    file = write_export(tmp_path / "export.txt", "db", RUNS, STEPS)
+    ds = zfit_data.read_data_file(file, cache=False)
+    assert len(ds) == 3
+    assert ds.segment_strs[1] == "1  # V(n001) Rl=10 (Run: 2/3)"
+    z = np.concatenate(RUNS)
+    assert np.allclose(ds.mag, np.abs(z), rtol=1e-12)
+    assert np.allclose(ds.pha, np.angle(z, deg=True), rtol=1e-12)
+    assert np.array_equal(ds.load, np.ones(len(z)))
+
+
+def test_bad_export(tmp_path):
+    file = tmp_path / "bad.txt"
+    file.write_text("Freq.\tV(n001)\n1,2\n3,4,5\n")
+    with pytest.raises(ValueError):
+        zfit_ltspice.read_export(str(file))
+
+
+def write_raw(path, runs, fastaccess=False, utf16=True, stepped=True):
+    # Binary AC .raw file of frequency, V(n001) and I(V1) = -1 for each run
+    hz = np.concatenate([HZ[:len(z)] for z in runs])
+    data = np.column_stack((hz, np.concatenate(runs), -np.ones(len(hz)))).astype(np.complex128)
+    flags = "complex forward log" + (" stepped" if stepped else "") + (" fastaccess" if fastaccess else "")
+    header = ("Title: * test\nPlotname: AC Analysis\nFlags: {}\nNo. Variables: 3\n"
+              "No. Points: {}\nVariables:\n\t0\tfrequency\tfrequency\n\t1\tV(n001)\tvoltage\n"
+              "\t2\tI(V1)\tdevice_current\nBinary:\n").format(flags, len(hz))
+    with open(path, "wb") as f:
+        f.write(header.encode("utf-16-le" if utf16 else "latin-1"))
+        (data.T if fastaccess else data).tofile(f)
+    return str(path)
+
+
+@pytest.mark.parametrize("utf16", [True, False])
+@pytest.mark.parametrize("fastaccess", [False, True])
+def test_raw(tmp_path, fastaccess, utf16):
+    file = write_raw(tmp_path / "ac.raw", RUNS, fastaccess, utf16)
+    with zfit_ltspice.RawFile(file) as raw:
+        assert raw.names == ["frequency", "V(n001)", "I(V1)"]
+        assert len(raw) == 3 and list(raw.offsets) == [0, 37, 74, 111]
+        assert raw.step_strs == ["Run 1/3", "Run 2/3", "Run 3/3"]
+        hz, (z,) = raw.run(1, ["v(n001)"])
+        assert np.array_equal(hz, HZ) and np.array_equal(z, RUNS[1])
+        assert np.array_equal(raw.impedance("V(n001)", "-I(V1)"), np.concatenate(RUNS))
+    ds = zfit_ltspice.read_raw(file, "V(n001)", "-I(V1)")
+    assert ds.segment_strs[2] == "1  # V(n001)/-I(V1) Run 3/3"
+    assert np.allclose(ds.mag, np.abs(np.concatenate(RUNS)), rtol=1e-15)
+
+
+def test_raw_runs_of_different_lengths(tmp_path):
+    file = write_raw(tmp_path / "ac.raw", [RUNS[0][:20], RUNS[1], RUNS[2][:30]])
+    with zfit_ltspice.RawFile(file) as raw:
+        assert list(raw.offsets) == [0, 20, 57, 87]
+
+
+def test_raw_log_steps(tmp_path):
+    file = write_raw(tmp_path / "ac.raw", RUNS)
+    (tmp_path / "ac.log").write_bytes("\n".join(
+        [".step rl=1", ".step rl=10", ".step rl=100"]).encode("utf-16-le"))
+    with zfit_ltspice.RawFile(file) as raw:
+        assert raw.step_strs == ["rl=1", "rl=10", "rl=100"]
+
+
+def test_raw_not_stepped(tmp_path):
+    file = write_raw(tmp_path / "ac.raw", RUNS[:1], stepped=False)
+    ds = zfit_ltspice.read_raw(file, 1)
+    assert list(ds.offsets) == [0, 37] and ds.segment_strs == ["1  # V(n001)"]
@@ -0,0 +1,48 @@
+"""
+Stacked matrix solutions against one solve per frequency point.
+"""
+
+import numpy as np
+import pytest
+from lmfit import Parameter
+
+import zfit_matrix
+from zfit_models import load_model
+
+W = 2*np.pi*np.logspace(3, 7, 100)
+
+
+def test_stack_solve_matches_per_point():
+    rng = np.random.default_rng(0)
+    A = rng.normal(size=(50, 4, 4)) + 1j*rng.normal(size=(50, 4, 4))
+    b = rng.normal(size=(50, 4)) + 1j*rng.normal(size=(50, 4))
+    assert np.allclose(zfit_matrix.stack_solve(A, b), zfit_matrix._stack_solve_per_point(A, b))
+    # Constant right hand side, as a list, broadcast over the stack
+    x = zfit_matrix.stack_solve(A, [1, 0, 0, 0])
+    assert x.shape == (50, 4)
+    assert np.allclose(x, zfit_matrix._stack_solve_per_point(A, [1, 0, 0, 0]))
+
+
+def test_stack_matrix_entries():
+    # Arrays, numbers and lmfit Parameters, broadcast to the array shape
+    s = 1j*W
+    A = zfit_matrix.stack_matrix([[s*1e-6 + 10, Parameter("R", value=-10.0)],
+                                  [-10, 10 + 1/(s*1e-9)]])
+    assert A.shape == (len(W), 2, 2)
+    assert np.all(A[:, 0, 1] == -10) and np.allclose(A[:, 1, 1], 10 + 1/(s*1e-9))
+    assert zfit_matrix.stack_vector([1, s]).shape == (len(W), 2)
+    assert zfit_matrix.stack_matrix([[1, 2], [3, 4]]).shape == (2, 2)
+
+
+@pytest.mark.parametrize("name", ["MatrixSolnExptModel", "CoupledFilter"])
+def test_models_match_per_point(monkeypatch, name):
+    # The systems solved by the matrix models give the same impedance
+    # solved point by point
+    model = load_model(name)
+    values = {p["name"]: p["init"] for p in model.PARAMS}
+    kws = {"load": np.full(len(W), 50.0+0j), "fsf": 1.0, "zsf": 1.0}
+    monkeypatch.setattr(model, "stack_solve", zfit_matrix._stack_solve_per_point)
+    z_loop = model.model(W, values, **kws)
+    monkeypatch.undo()
+    z = model.model(W, values, **kws)
+    assert np.allclose(z, z_loop, rtol=1e-12, atol=0)
@@ -0,0 +1,73 @@
+"""
+Model scripts generated from netlists.
+"""
+
+import os
+
+import numpy as np
+import pytest
+
+import zfit_netlist
+from zfit_models import load_model
+
+MODELS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "Models")
+W = 2*np.pi*np.logspace(3, 7, 50)
+
+# Transformer with a shunt capacitance and a resistive load
+XFMR = """* xfmr
+V1 in 0 AC 1
+Lp in 0 100u
+Ls out 0 {Lp*n^2}
+K1 Lp Ls 0.9
+Cp in 0 10p
+Rl out 0 50
+.param n=2
+.end
+"""
+
+
+def compiled(code):
+    # Model module namespace of generated source
+    namespace = {}
+    exec(compile(code, "<generated>", "exec"), namespace)
+    return namespace
+
+
+@pytest.mark.parametrize("name", ["(csr)p(lsr)", "csrsl", "ls(cpr)"])
+def test_no_unused_numpy(name):
+    # Without couplings or functions the generated script doesn't use numpy
+    code = zfit_netlist.generate(zfit_netlist.read_netlist(os.path.join(MODELS, name + ".asc")))
+    assert "np." not in code
+    assert "import numpy" not in code
+    compiled(code)
+
+
+def test_ls_cpr_matches_model_script():
+    namespace = compiled(zfit_netlist.generate(
+        zfit_netlist.read_netlist(os.path.join(MODELS, "ls(cpr).asc"))))
+    values = {"Ls": 100e-9, "Cp": 10e-9, "Rp": 100.0}
+    z = namespace["model"](W, {"L": values["Ls"], "C": values["Cp"], "rC": values["Rp"]})
+    assert np.allclose(z, load_model("ls(cpr)").model(W, values), rtol=1e-12)
+
+
+def test_coupled_inductors():
+    code = zfit_netlist.generate(zfit_netlist.parse_spice(XFMR))
+    assert "import numpy as np" in code
+    namespace = compiled(code)
+    assert [p["name"] for p in namespace["PARAMS"]] == ["Lp", "Cp", "Rl", "K1", "n"]
+    lp, n, k, cp, rl = 100e-6, 2.0, 0.9, 10e-12, 50.0
+    z = namespace["model"](W, {"Lp": lp, "n": n, "K1": k, "Cp": cp, "Rl": rl})
+    # Primary inductance in parallel with the load reflected through the
+    # coupled inductors, and Cp
+    s = 1j*W
+    ls, m = lp*n**2, k*lp*n
+    z_l = s*lp - (s*m)**2/(s*ls + rl)
+    assert np.allclose(z, 1/(1/z_l + s*cp), rtol=1e-9)
+
+
+@pytest.mark.parametrize("line", ["E1 out 0 in 0 10", "G1 out 0 in 0 1m", "F1 out 0 V1 2",
+                                  "H1 out 0 V1 50", "X1 in out filter", "D1 in 0 1N4148"])
+def test_unsupported_element(line):
+    # An element the compiler can't model must not be dropped silently
+    with pytest.raises(ValueError, match=line.split()[0]):
+        zfit_netlist.parse_spice("* test\nV1 in 0 AC 1\nR1 in out 1k\n" + line + "\n.end\n")
@@ -0,0 +1,62 @@
+"""
+Joint fits of several load segments with shared and per-segment params.
+"""
+
+import numpy as np
+import pytest
+
+import zfit_modelcore_cli as cli
+from zfit_models import load_model
+from zfit_shared import SegmentedModel, local_name
+
+from test_fit import synthetic
+from test_jacobian import column_errors, reference_jacobian
+
+LOADS = (10.0, 50.0, 200.0)
+
+
+def segmented(name, local, scales=(0.8, 1.0, 1.25)):
+    # Synthetic data of one segment per load, the local params scaled
+    # differently in each segment
+    model = load_model(name)
+    values, hz, z, load = {}, [], [], []
+    for i, (scale, zl) in enumerate(zip(scales, LOADS)):
+        v, h, zs, ls = synthetic(model, 1.0, np.logspace(3, 7, 100), zl)
+        for p in local:
+            v[p] *= scale
+            values[local_name(p, i)] = v[p]
+        zs = model.model(2*np.pi*h, v, load=ls, fsf=1.0, zsf=1.0)
+        values.update({k: val for k, val in v.items() if k not in local})
+        hz.append(h), z.append(zs), load.append(ls)
+    offsets = 100*np.arange(len(LOADS) + 1)
+    return model, values, np.concatenate(hz), np.concatenate(z), np.concatenate(load), offsets
+
+
+def test_segmented_jacobian():
+    model, values, hz, z, load, offsets = segmented("xfmr2", ["Cp"])
+    seg = SegmentedModel(model, offsets, ["Cp"])
+    w = 2*np.pi*hz
+    kws = {"load": load, "fsf": 1.0, "zsf": 1.0}
+    names = [p["name"] for p in seg.PARAMS]
+    jac = seg.jacobian(w, values, **kws)
+    jac = np.column_stack([jac[name] for name in names])
+    # Steps of 1e-2 are too coarse in k near the resonances
+    ref = reference_jacobian(lambda v: seg.model(w, v, **kws), values, names, 1e-3)
+    err = column_errors(jac, ref)
+    assert np.all(err < 1e-3), dict(zip(names, err))
+    # A local copy only changes its own segment
+    for i, (a, b) in enumerate(zip(offsets[:-1], offsets[1:])):
+        col = jac[:, names.index(local_name("Cp", i))]
+        assert np.all(col[:a] == 0) and np.all(col[b:] == 0)
+
+
+@pytest.mark.parametrize("method", ["leastsq", "least_squares"])
+def test_joint_fit_recovers_params(method):
+    model, values, hz, z, load, offsets = segmented("rpcpl", ["C"])
+    method_nr = [m[1] for m in cli.METHODS].index(method)
+    fitted, result, chisqr = cli.DoModel().do_model_arrays(
+        model, hz, np.abs(z), np.angle(z, deg=True), load, method_nr,
+        offsets=offsets, local=["C"])
+    assert chisqr < 1e-12
+    for name, val in fitted:
+        assert val == pytest.approx(values[name], rel=1e-4)
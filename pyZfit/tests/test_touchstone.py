@@ -0,0 +1,158 @@
+"""
+Touchstone files, written synthetically from known impedance matrices.
+"""
+
+import numpy as np
+import pytest
+
+import zfit_data
+import zfit_touchstone
+
+HZ = np.linspace(1e6, 1e8, 37)
+Z1 = 10 + 2j*np.pi*HZ*1e-7
+
+
+def z_matrices(n_ports, seed=1):
+    # Symmetric impedance matrices, one per frequency
+    rng = np.random.default_rng(seed)
+    z = rng.normal(size=(len(HZ), n_ports, n_ports)) + 1j*rng.normal(size=(len(HZ), n_ports, n_ports))
+    return z + z.transpose(0, 2, 1) + 20*np.eye(n_ports)
+
+
+def z_to_s(z, ref=50.0):
+    eye = np.eye(z.shape[-1])
+    return np.linalg.solve((z + ref*eye).transpose(0, 2, 1),
+                           (z - ref*eye).transpose(0, 2, 1)).transpose(0, 2, 1)
+
+
+def pair(c, fmt):
+    # Number pair of a complex value in a Touchstone format
+    if fmt == "RI":
+        return c.real, c.imag
+    if fmt == "MA":
+        return abs(c), np.angle(c, deg=True)
+    return 20*np.log10(abs(c)), np.angle(c, deg=True)
+
+
+def relative_error(got, want):
+    return np.max(np.abs(got - want) / np.abs(want))
+
+
+@pytest.mark.parametrize("chunk_bytes", [zfit_touchstone.CHUNK_BYTES, 50])
+@pytest.mark.parametrize("param", ["S", "Z", "Y"])
+@pytest.mark.parametrize("fmt", ["RI", "MA", "DB"])
+def test_one_port(tmp_path, fmt, param, chunk_bytes):
+    data = {"S": (Z1 - 75)/(Z1 + 75), "Z": Z1/75, "Y": 75/Z1}[param]
+    file = tmp_path / "a.s1p"
+    with open(file, "w") as f:
+        f.write("! comment\n# kHz {} {} R 75\n".format(param, fmt))
+        for h, c in zip(HZ, data):
+            f.write("{!s} {!s} {!s} ! trailing comment\n".format(h/1e3, *pair(c, fmt)))
+    ts = zfit_touchstone.read_touchstone(str(file), chunk_bytes)
+    assert ts.n_ports == 1 and ts.version == 1
+    assert np.allclose(ts.hz, HZ, rtol=1e-14)
+    assert relative_error(ts.z[:, 0, 0], Z1) < 1e-12
+
+
+@pytest.mark.parametrize("chunk_bytes", [zfit_touchstone.CHUNK_BYTES, 100, 333])
+def test_wrapped_rows(tmp_path, chunk_bytes):
+    # Rows of three ports run over three lines
+    z = z_matrices(3)
+    s = z_to_s(z)
+    file = tmp_path / "b.s3p"
+    with open(file, "w") as f:
+        f.write("# Hz S RI R 50\n")
+        for k, h in enumerate(HZ):
+            for i in range(3):
+                values = " ".join("{!s} {!s}".format(v.real, v.imag) for v in s[k, i])
+                f.write(("{!s} ".format(h) if i == 0 else "   ") + values + "\n")
+    ts = zfit_touchstone.read_touchstone(str(file), chunk_bytes)
+    assert ts.n_ports == 3
+    assert relative_error(ts.z, z) < 1e-10
+    # Ports 2 and 3 in their reference impedance: what S11 shows
+    assert relative_error(ts.input_impedance(), 50*(1 + s[:, 0, 0])/(1 - s[:, 0, 0])) < 1e-10
+
+
+@pytest.mark.parametrize("chunk_bytes", [zfit_touchstone.CHUNK_BYTES, 200, 1000])
+def test_two_port_noise(tmp_path, chunk_bytes):
+    # Version 1 two-port order is 11 21 12 22; noise data follows
+    z = z_matrices(2)
+    s = z_to_s(z)
+    file = tmp_path / "c.s2p"
+    with open(file, "w") as f:
+        f.write("# Hz S MA R 50\n")
+        for k, h in enumerate(HZ):
+            f.write("{!s} ".format(h) + " ".join(
+                "{!s} {!s}".format(*pair(s[k, i, j], "MA"))
+                for i, j in ((0, 0), (1, 0), (0, 1), (1, 1))) + "\n")
+        f.write("! noise parameters\n")
+        for h in HZ[::5]:
+            f.write("{!s} 1.5 0.5 30 0.3\n".format(h))
+    ts = zfit_touchstone.read_touchstone(str(file), chunk_bytes)
+    assert len(ts.hz) == len(HZ)
+    assert relative_error(ts.z, z) < 1e-10
+
+
+@pytest.mark.parametrize("chunk_bytes", [zfit_touchstone.CHUNK_BYTES, 150])
+def test_version_2(tmp_path, chunk_bytes):
+    # Lower triangle, references per port over two lines, Z not normalized
+    z = z_matrices(3)
+    file = tmp_path / "d.ts"
+    with open(file, "w") as f:
+        f.write("! version 2\n[Version] 2.0\n# MHz Z RI R 50\n[Number of Ports] 3\n"
+                "[Number of Frequencies] {}\n[Reference] 50\n 75 25\n[Matrix Format] Lower\n"
+                "[Begin Information]\nfoo 1 2\n[End Information]\n[Network Data]\n".format(len(HZ)))
+        for k, h in enumerate(HZ):
+            f.write("{!s} ".format(h/1e6) + " ".join(
+                "{!s} {!s}".format(z[k, i, j].real, z[k, i, j].imag)
+                for i in range(3) for j in range(i + 1)) + "\n")
+        f.write("[Noise Data]\n1 2 3 4 5\n[End]\n")
+    ts = zfit_touchstone.read_touchstone(str(file), chunk_bytes)
+    assert ts.version == 2
+    assert list(ts.ref) == [50, 75, 25]
+    assert relative_error(ts.z, z) < 1e-12
+
+
+def test_terminations(tmp_path):
+    z = z_matrices(2)
+    file = tmp_path / "c.s2p"
+    with open(file, "w") as f:
+        f.write("# Hz Z RI R 1\n")
+        for k, h in enumerate(HZ):
+            f.write("{!s} ".format(h) + " ".join(
+                "{!s} {!s}".format(z[k, i, j].real, z[k, i, j].imag)
+                for i, j in ((0, 0), (1, 0), (0, 1), (1, 1))) + "\n")
+    ds = zfit_touchstone.read_touchstone_dataset(str(file), ["np.inf", "1/(j*w*1e-12)"])
+    assert ds.segment_strs == ["np.inf", "1/(j*w*1e-12)"]
+    zl = 1/(1j*2*np.pi*HZ*1e-12)
+    assert np.allclose(ds.load[37:], zl, rtol=1e-15)
+    assert relative_error(ds.mag[:37], np.abs(z[:, 0, 0])) < 1e-12
+    assert relative_error(ds.mag[37:],
+                          np.abs(z[:, 0, 0] - z[:, 0, 1]*z[:, 1, 0]/(z[:, 1, 1] + zl))) < 1e-12
+    # Read through zfit_data: port 2 in its reference impedance
+    ds = zfit_data.read_data_file(str(file), cache=False)
+    assert len(ds) == 1
+    assert relative_error(ds.mag, np.abs(z[:, 0, 0] - z[:, 0, 1]*z[:, 1, 0]/(z[:, 1, 1] + 1))) < 1e-12
+
+
+@pytest.mark.parametrize("text", [
+    "# Hz H RI R 50\n1 2 3 4 5 6 7 8 9\n",   # unsupported parameter
+    "# Hz S RI R 50\n1 2 3 4 5 6 7 8\n",     # short row
+])
+def test_bad_file(tmp_path, text):
+    file = tmp_path / "e.s2p"
+    file.write_text(text)
+    with pytest.raises(ValueError):
+        zfit_touchstone.read_touchstone(str(file))
+
+
+@pytest.mark.parametrize("chunk_bytes", [zfit_touchstone.CHUNK_BYTES, 30])
+def test_brackets_in_comments(tmp_path, chunk_bytes):
+    # A "[" in a comment is not a keyword ending the network data
+    file = tmp_path / "f.s1p"
+    file.write_text("# Hz S RI R 50 ! options [v1]\n"
+                    "1 0.1 0.0\n2 0.2 0.0 ! note [a]\n3 0.3 0.0\n4 0.4 0.0\n")
+    ts = zfit_touchstone.read_touchstone(str(file), chunk_bytes)
+    assert list(ts.hz) == [1, 2, 3, 4]
+    assert np.allclose(ts.z[:, 0, 0], 50*(1 + np.array([0.1, 0.2, 0.3, 0.4]))
+                       / (1 - np.array([0.1, 0.2, 0.3, 0.4])))
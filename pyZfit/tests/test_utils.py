@@ -0,0 +1,63 @@
+"""
+Array versions of the utils helpers against their scalar versions.
+"""
+
+import numpy as np
+import pytest
+
+import utils
+
+
+def values(seed=0):
+    # Random values over many decades, series values and their
+    # neighbours, values next to powers of ten, and out of range values
+    rng = np.random.default_rng(seed)
+    x = 10.0**rng.uniform(-15, 12, 20000)
+    series = np.concatenate(list(utils.E_SERIES.values()))
+    decades = 10.0**np.arange(-14, 12)
+    edges = np.concatenate([series*decades[k] for k in (3, 12, 20)]
+                           + [decades, np.nextafter(decades, 0), np.nextafter(decades, np.inf)])
+    return np.concatenate((x, edges, np.nextafter(edges, 0), np.nextafter(edges, np.inf),
+                           [0.0, -1.0, np.inf, np.nan]))
+
+
+@pytest.mark.parametrize("tol", ["e6", "e12", "e24", "e48", "e96", "e192", "5%", ".1%"])
+def test_closest_array(tol):
+    x = values()
+    value, lo, hi, distance = utils.closest_array(x, tol)
+    assert np.array_equal(value, [utils.closest(v, tol) if np.isfinite(v) else 0.0 for v in x])
+    ok = np.isfinite(x) & (x > 0)
+    assert np.all((lo[ok] <= value[ok]) & (value[ok] <= hi[ok]))
+    assert np.all(np.isnan(distance[~ok]))
+    assert np.allclose(distance[ok], np.log10(x[ok] / value[ok]))
+
+
+def test_closest_array_unknown_series():
+    with pytest.raises(ValueError):
+        utils.closest_array([1.0], "e7")
+
+
+@pytest.mark.parametrize("neg_ok", [False, True])
+@pytest.mark.parametrize("suff", [True, False])
+@pytest.mark.parametrize("d", [1, 2, 3, 4, 6])
+def test_eng_notate_array(d, suff, neg_ok):
+    # Values next to rounding ties (1.5, 2.25, 9.995, ...) in every decade too
+    ties = np.array([1.5, 2.25, 9.995, 0.0995, 999.5, 123.45, 1234.5])
+    ties = np.outer(10.0**np.arange(-16, 13), ties).ravel()
+    x = np.concatenate((values(1)[::10], ties, -values(2)[:2000:10], [-0.0, -np.inf]))
+    got = utils.eng_notate_array(x, d, suff, neg_ok)
+    want = [utils.eng_notate(v, d, suff, neg_ok) for v in x]
+    assert got.tolist() == want
+
+
+def test_eng_notate_array_shape():
+    assert utils.eng_notate_array([[1e3, 2.2e-6]]).tolist() == [["1.00k", "2.20u"]]
+    assert utils.eng_notate_array(4.7e-9).tolist() == "4.70n"
+
+
+@pytest.mark.parametrize("ext", [".csv", ".html"])
+def test_write_eng_table(tmp_path, ext):
+    out = str(tmp_path / ("table" + ext))
+    utils.write_eng_table(out, ["name", "R"], [["a", "b"], [1.5e3, np.nan]])
+    text = open(out, encoding="utf-8").read()
+    assert "1.50k" in text and "a" in text
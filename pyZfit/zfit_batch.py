@@ -0,0 +1,190 @@
+"""
+Batch fitting of many data files against one or more model scripts.
+Each (data file, model) pair is fitted in a worker process and the results
+are collected into a single CSV table, one row per pair, instead of the
+params file written by single fits.
+
+Usage:
+    python zfit_batch.py "lot42/*.csv" -m "ls(cpr)" -m csrsl -o lot42_fits.csv
+    python zfit_batch.py "lot42/*.csv" -m csrsl --eng 4 -o lot42_fits.html
+"""
+
+import os
+# One BLAS thread per worker process; the parallelism comes from the pool.
+# Must be set before numpy is imported.
+for _var in ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS"):
+    os.environ.setdefault(_var, "1")
+
+import csv
+import glob
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+import utils as ut
+import zfit_data
+from zfit_modelcore_cli import DoModel, METHODS
+from zfit_models import load_model, module_name
+from zfit_store import FitStore
+
+# Fixed leading columns of the results table; param columns follow
+RESULT_COLUMNS = ["file", "model", "method", "success", "chisqr", "nfev", "wall_time", "message"]
+
+
+def method_index(method):
+    """
+    Index into METHODS for an lmfit method name or an index string.
+    :param method: eg "leastsq" or "0"
+    :return: int index
+    """
+    if method.isdigit():
+        return int(method)
+    for i, m in enumerate(METHODS):
+        if m[1] == method:
+            return i
+    raise ValueError("Unknown method '{}'".format(method))
+
+
+def fit_one(file, model_name, method_nr=0, do_norm_denorm=True, coarse_points=None,
+            use_store=True, local=None):
+    """
+    Fit one data file (all segments together) with one model.
+    :param file: data file name
+    :param model_name: importable model module name
+    :param method_nr: index into METHODS
+    :param do_norm_denorm: normalize params, frequency and impedance for the fit
+    :param coarse_points: fit coarse to fine, with this many points for the coarse fit
+    :param use_store: warm start from the fit store and record the fit in it
+    :param local: list of per-segment param names (default: those marked
+                  "local" in the model's PARAMS; see zfit_shared)
+    :return: dict with RESULT_COLUMNS keys plus "params", a list of (name, value)
+    """
+    row = {"file": file, "model": model_name.split(".", 1)[1],
+           "method": METHODS[method_nr][1], "params": []}
+    start = time.perf_counter()
+    try:
+        ds = zfit_data.read_data_file(file)
+        model = load_model(model_name)
+        store = FitStore() if use_store else None
+        try:
+            values, result, chisqr = DoModel().do_model_arrays(
+                model, ds.hz, ds.mag, ds.pha, ds.load, method_nr, do_norm_denorm,
+                coarse_points=coarse_points, offsets=ds.offsets, store=store,
+                dataset=os.path.abspath(file), local=local)
+        finally:
+            if store is not None:
+                store.close()
+        row.update(success=result.success, chisqr=chisqr, nfev=result.nfev,
+                   message=result.message, params=values)
+    except Exception as e:
+        row.update(success=False, chisqr=np.nan, nfev=0, message=repr(e))
+    row["wall_time"] = time.perf_counter() - start
+    return row
+
+
+def _fit_job(job):
+    # Worker process entry point
+    return fit_one(*job)
+
+
+def run_batch(files, models, method_nr=0, do_norm_denorm=True, processes=None,
+              progress=None, coarse_points=None, use_store=True, local=None):
+    """
+    Fit every data file with every model on a process pool.
+    :param files: list of data file names
+    :param models: list of model script names or paths
+    :param method_nr: index into METHODS
+    :param do_norm_denorm: normalize params, frequency and impedance for the fit
+    :param processes: number of worker processes (default: one per core)
+    :param progress: optional callable(row, n_done, n_total) called as fits finish
+    :param coarse_points: fit coarse to fine, with this many points for the coarse fit
+    :param use_store: warm start from the fit store and record the fits in it
+    :param local: list of per-segment param names, for models which have them
+    :return: list of result rows (see fit_one), in file, model order
+    """
+    jobs = [(f, module_name(m), method_nr, do_norm_denorm, coarse_points, use_store, local)
+            for f in files for m in models]
+    rows = [None] * len(jobs)
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        futures = {pool.submit(_fit_job, job): i for i, job in enumerate(jobs)}
+        for n, future in enumerate(as_completed(futures), 1):
+            rows[futures[future]] = future.result()
+            if progress is not None:
+                progress(rows[futures[future]], n, len(jobs))
+    return rows
+
+
+def write_results(rows, out, eng=None):
+    """
+    Write result rows to a CSV table with one column per param name found
+    in any of the models.  Params not in a row's model are left empty.
+    :param rows: list of result rows from run_batch()
+    :param out: output CSV file name (or HTML, with eng)
+    :param eng: if given, write values in engineering units with this many
+                significant digits, to CSV or to an HTML table if out ends
+                in .html
+    """
+    param_names = []
+    for row in rows:
+        for name, _ in row["params"]:
+            if name not in param_names:
+                param_names.append(name)
+    if eng is not None:
+        # Whole columns at once
+        columns = [[row[c] for c in RESULT_COLUMNS] for row in rows]
+        columns = [np.array(col, dtype=float) if c in ("chisqr", "wall_time") else col
+                   for c, col in zip(RESULT_COLUMNS, zip(*columns))]
+        columns += [np.array([dict(row["params"]).get(name, np.nan) for row in rows])
+                    for name in param_names]
+        ut.write_eng_table(out, RESULT_COLUMNS + param_names, columns, d=eng, neg_ok=True)
+        return
+    with open(out, mode='w', encoding='utf-8', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(RESULT_COLUMNS + param_names)
+        for row in rows:
+            values = dict(row["params"])
+            writer.writerow([row[c] for c in RESULT_COLUMNS] +
+                            [values.get(name, "") for name in param_names])
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Fit many Zfit data files with one or more models")
+    parser.add_argument("data", nargs="+", help="data files or glob patterns")
+    parser.add_argument("-m", "--model", action="append", required=True,
+                        help="model script name or path (may be repeated)")
+    parser.add_argument("--method", default="leastsq",
+                        help="lmfit method name or index into METHODS (default leastsq)")
+    parser.add_argument("--no-norm", action="store_true",
+                        help="don't normalize values for fitting")
+    parser.add_argument("--coarse", type=int, default=None, metavar="N",
+                        help="fit on N log-spaced points first, then refine on all points")
+    parser.add_argument("--local", action="append", metavar="NAME",
+                        help="fit one copy of this param per segment, the others shared "
+                             "(may be repeated; default: params marked local in the model)")
+    parser.add_argument("--no-store", action="store_true",
+                        help="don't warm start from or record fits in the fit store")
+    parser.add_argument("-j", "--processes", type=int, default=None,
+                        help="number of worker processes (default: one per core)")
+    parser.add_argument("--eng", type=int, default=None, metavar="D",
+                        help="write values in engineering units with D significant digits "
+                             "(to an HTML table if the results file ends in .html)")
+    parser.add_argument("-o", "--out", default="zfit_batch.csv", help="results CSV file")
+    args = parser.parse_args()
+
+    files = []
+    for pattern in args.data:
+        files += sorted(glob.glob(pattern)) or [pattern]
+
+    def report(row, n, total):
+        print("[{}/{}] {} / {}: chi-square {:.6g}, {} evals, {:.2f} s{}".format(
+            n, total, row["file"], row["model"], row["chisqr"], row["nfev"], row["wall_time"],
+            "" if row["success"] else "  FAILED: " + str(row["message"])))
+
+    start = time.perf_counter()
+    rows = run_batch(files, args.model, method_index(args.method), not args.no_norm,
+                     args.processes, report, args.coarse, not args.no_store, args.local)
+    write_results(rows, args.out, args.eng)
+    print("{} fits in {:.1f} s, written to {}".format(len(rows), time.perf_counter() - start, args.out))
@@ -0,0 +1,199 @@
+"""
+Benchmarks of the model scripts in Models/.
+
+Each model's model(w, params, **kws) is timed at its PARAMS init values over
+a range of frequency point counts, with a complex load array (50 ohms plus
+a little series inductance) as a fixture would present.  Evaluations per
+second and peak memory allocated during one evaluation are recorded for each
+size, and the growth of the evaluation time with the number of points is fitted
+as a power law: models whose cost grows faster than linearly are flagged.
+
+Results are written as JSON so that runs on different versions can be
+compared:
+    python zfit_bench.py -o bench_new.json --baseline bench_old.json
+"""
+
+import glob
+import json
+import os
+import platform
+import time
+import timeit
+import tracemalloc
+import numpy as np
+
+from zfit_models import load_model, model_kws
+
+# Point counts benchmarked, 1e2 to 1e6
+POINTS = [100, 1000, 10000, 100000, 1000000]
+# Minimum total time spent timing each size, seconds
+MIN_TIME = 0.2
+# Power law exponent of time vs points above which a model is flagged.
+# Only sizes of at least SCALING_MIN_POINTS are used, where per-call
+# overhead no longer dominates.
+SUPERLINEAR = 1.15
+SCALING_MIN_POINTS = 10000
+# Evaluations per second below baseline / REGRESSION are reported as regressions
+REGRESSION = 1.2
+
+
+def model_names(folder="Models"):
+    """
+    :param folder: folder of model scripts
+    :return: sorted list of model script names, without .py
+    """
+    return sorted(os.path.splitext(os.path.basename(f))[0]
+                  for f in glob.glob(os.path.join(folder, "*.py")))
+
+
+def fixture(n):
+    """
+    Frequency and load arrays for a benchmark of n points.
+    :param n: number of points
+    :return: (w, load): radian frequencies from 100 Hz to 100 MHz, and a
+             50 ohm load with 10 nH series inductance
+    """
+    w = 2*np.pi*np.logspace(2, 8, n)
+    load = 50.0 + 1j*w*10e-9
+    return w, load
+
+
+def time_model(model, n):
+    """
+    Time one model at one number of points.
+    :param model: model module
+    :param n: number of points
+    :return: dict with "points", "seconds" (per evaluation), "evals_per_sec"
+             and "peak_bytes"
+    """
+    w, load = fixture(n)
+    params = {p["name"]: p["init"] for p in model.PARAMS}
+    kws = model_kws(model, w, load)
+
+    # Peak memory of one evaluation (numpy allocations are traced too)
+    tracemalloc.start()
+    model.model(w, params, **kws)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    timer = timeit.Timer(lambda: model.model(w, params, **kws))
+    number, total = timer.autorange()
+    if total < MIN_TIME:
+        number = max(1, int(number * MIN_TIME / total))
+    seconds = min(timer.repeat(repeat=3, number=number)) / number
+    return {"points": n, "seconds": seconds, "evals_per_sec": 1.0 / seconds,
+            "peak_bytes": peak}
+
+
+def scaling_exponent(sizes):
+    """
+    Power law exponent of evaluation time vs number of points.
+    :param sizes: list of time_model() results
+    :return: exponent (1.0 is linear), or None with fewer than two sizes
+    """
+    sizes = [s for s in sizes if s["points"] >= SCALING_MIN_POINTS] or sizes
+    if len(sizes) < 2:
+        return None
+    x = np.log([s["points"] for s in sizes])
+    y = np.log([s["seconds"] for s in sizes])
+    return float(np.polyfit(x, y, 1)[0])
+
+
+def bench_model(name, points=POINTS):
+    """
+    Benchmark one model script over several numbers of points.
+    :param name: model script name
+    :param points: list of point counts
+    :return: dict with "sizes" (list of time_model() results), "exponent",
+             "superlinear", and "error" if the model failed
+    """
+    result = {"sizes": []}
+    try:
+        model = load_model(name)
+        for n in points:
+            result["sizes"].append(time_model(model, n))
+    except Exception as e:
+        result["error"] = repr(e)
+    exponent = scaling_exponent(result["sizes"])
+    result["exponent"] = exponent
+    result["superlinear"] = exponent is not None and exponent > SUPERLINEAR
+    return result
+
+
+def run(names=None, points=POINTS, progress=None):
+    """
+    Benchmark model scripts.
+    :param names: list of model script names (default: all in Models/)
+    :param points: list of point counts
+    :param progress: optional callable(name, result) called after each model
+    :return: dict for JSON output, with run information and "models"
+    """
+    results = {
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "machine": platform.platform(),
+        "points": list(points),
+        "models": {},
+    }
+    for name in names or model_names():
+        results["models"][name] = bench_model(name, points)
+        if progress is not None:
+            progress(name, results["models"][name])
+    return results
+
+
+def regressions(results, baseline, threshold=REGRESSION):
+    """
+    Compare two benchmark runs.
+    :param results: run() result
+    :param baseline: earlier run() result
+    :param threshold: slowdown ratio reported as a regression
+    :return: list of (model name, points, slowdown ratio)
+    """
+    found = []
+    for name, r in results["models"].items():
+        if name not in baseline["models"]:
+            continue
+        base = {s["points"]: s for s in baseline["models"][name]["sizes"]}
+        for s in r["sizes"]:
+            if s["points"] in base:
+                ratio = base[s["points"]]["evals_per_sec"] / s["evals_per_sec"]
+                if ratio > threshold:
+                    found.append((name, s["points"], ratio))
+    return found
+
+
+if __name__ == "__main__":
+    import argparse
+    import sys
+
+    parser = argparse.ArgumentParser(description="Benchmark Zfit model scripts")
+    parser.add_argument("models", nargs="*", help="model script names (default: all in Models/)")
+    parser.add_argument("-n", "--points", type=int, nargs="+", default=POINTS,
+                        help="numbers of frequency points")
+    parser.add_argument("-o", "--out", default="bench_models.json", help="results JSON file")
+    parser.add_argument("--baseline", help="earlier results JSON file to compare against")
+    args = parser.parse_args()
+
+    def report(name, r):
+        cols = "  ".join("{:>10.4g}".format(s["evals_per_sec"]) for s in r["sizes"])
+        flag = "  superlinear ({:.2f})".format(r["exponent"]) if r["superlinear"] else ""
+        error = "  ERROR: " + r["error"] if "error" in r else ""
+        print("{:22s} {}{}{}".format(name, cols, flag, error))
+
+    print("{:22s} {}   (evaluations/s)".format(
+        "model", "  ".join("{:>10d}".format(n) for n in args.points)))
+    results = run([os.path.splitext(os.path.basename(m))[0] for m in args.models],
+                  args.points, report)
+    with open(args.out, mode='w', encoding='utf-8') as f:
+        json.dump(results, f, indent=1)
+    print("Written to", args.out)
+
+    if args.baseline:
+        with open(args.baseline, mode='r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        slow = regressions(results, baseline)
+        for name, n, ratio in slow:
+            print("REGRESSION {} at {} points: {:.2f}x slower".format(name, n, ratio))
+        sys.exit(1 if slow else 0)
@@ -0,0 +1,144 @@
+"""
+Reading of OMICRON Lab Bode 100 .bode3 measurement files.
+
+A .bode3 file is a zip archive of XML documents.  The live measurement is in
+TraceValues.xml and each stored memory trace is a Traces/<guid>.MemoryTrace
+entry, with one <item Frequency="..." Result="(re, im)" .../> element per
+frequency point.  Only impedance measurements are read.
+
+The points of a trace are decoded straight from the decompressed bytes with a
+single pass over the buffer (no XML tree), and archive entries are only
+decompressed when their trace is requested.  Only the head of each entry is
+read to list the trace names.
+"""
+
+import re
+import zipfile
+import numpy as np
+
+from zfit_data import SegmentedDataset
+
+# Version of the reading of .bode3 files, part of the zfit_cache key (see
+# zfit_data.LOADER_VERSION).  Increment whenever it changes what is produced.
+LOADER_VERSION = 1
+
+LIVE_ENTRY = "TraceValues.xml"
+LIVE_NAME = "Measurement"
+# Bytes read from the start of a trace entry to find its name
+HEAD_BYTES = 2048
+
+_NAME_RE = re.compile(rb"<TraceName>(.*?)</TraceName>")
+# Impedance section: <ImpedanceValues> in memory traces, <Impedance> in TraceValues.xml
+_IMPEDANCE_RE = re.compile(rb"<Impedance(?:Values)?>(.*?)</Impedance(?:Values)?>", re.S)
+_POINT_RE = re.compile(rb'Frequency="([^"]*)" Result="\(([^,]*),([^)]*)\)"')
+
+
+class Bode3File:
+    """
+    Lazily read traces of a .bode3 file.  Traces are identified by name or by
+    index into the traces list; the live measurement comes first.
+    """
+    def __init__(self, file):
+        self.file = file
+        self._zip = zipfile.ZipFile(file)
+        # (entry name, trace name) for every trace in the archive
+        self.traces = []
+        entries = self._zip.namelist()
+        if LIVE_ENTRY in entries:
+            self.traces.append((LIVE_ENTRY, LIVE_NAME))
+        for entry in entries:
+            if entry.endswith(".MemoryTrace"):
+                with self._zip.open(entry) as f:
+                    m = _NAME_RE.search(f.read(HEAD_BYTES))
+                name = m.group(1).decode("utf-8") if m else entry.split("/")[-1]
+                self.traces.append((entry, name))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self._zip.close()
+
+    @property
+    def names(self):
+        return [name for _, name in self.traces]
+
+    def _entry(self, trace):
+        # Archive entry for a trace name or index
+        if isinstance(trace, str):
+            for entry, name in self.traces:
+                if name == trace:
+                    return entry
+            raise KeyError("No trace '{}' in {}".format(trace, self.file))
+        return self.traces[trace][0]
+
+    def read_trace(self, trace):
+        """
+        Read the impedance points of one trace.
+        :param trace: trace name or index into traces
+        :return: (hz, z) arrays; points without a result are dropped
+        """
+        buf = self._zip.read(self._entry(trace))
+        m = _IMPEDANCE_RE.search(buf)
+        points = _POINT_RE.findall(m.group(1)) if m else []
+        if not points:
+            return np.empty(0), np.empty(0, dtype=complex)
+        # Convert all the numbers of the trace in one call
+        values = np.array(b" ".join(b" ".join(p) for p in points).split(), dtype=float)
+        values = values.reshape(-1, 3)
+        hz = values[:, 0]
+        z = values[:, 1] + 1j*values[:, 2]
+        keep = np.isfinite(z)
+        return hz[keep], z[keep]
+
+    def to_dataset(self, traces=None):
+        """
+        Read traces into a SegmentedDataset, one segment per trace.  Traces
+        without impedance data are skipped.
+        :param traces: list of trace names or indices (default: all)
+        :return: SegmentedDataset with no loads; segment strings name the traces
+        """
+        if traces is None:
+            traces = range(len(self.traces))
+        hz, z, segment_strs = [], [], []
+        for trace in traces:
+            h, _z = self.read_trace(trace)
+            if len(h):
+                name = trace if isinstance(trace, str) else self.traces[trace][1]
+                hz.append(h)
+                z.append(_z)
+                # Unit load, with the trace name as a comment
+                segment_strs.append("1  # " + name)
+        if not hz:
+            raise ValueError("No impedance traces in {}".format(self.file))
+        offsets = np.cumsum([0] + [len(h) for h in hz])
+        hz, z = np.concatenate(hz), np.concatenate(z)
+        return SegmentedDataset(hz, np.abs(z), np.angle(z, deg=True),
+                                np.ones(len(hz), dtype=complex), offsets, segment_strs)
+
+
+def read_bode3(file, traces=None):
+    """
+    Read a .bode3 file into a SegmentedDataset, one segment per trace.
+    :param file: .bode3 file name
+    :param traces: list of trace names or indices (default: all)
+    :return: SegmentedDataset
+    """
+    with Bode3File(file) as b:
+        return b.to_dataset(traces)
+
+
+if __name__ == "__main__":
+    import sys
+
+    for file in sys.argv[1:] or ["TestDataFiles/Inductors.bode3", "TestDataFiles/Capacitors.bode3"]:
+        with Bode3File(file) as b:
+            print(file)
+            for i, name in enumerate(b.names):
+                hz, z = b.read_trace(i)
+                if len(hz):
+                    print("  {:2d} {:30s} {:4d} points, {:.4g} - {:.4g} Hz".format(
+                        i, name, len(hz), hz[0], hz[-1]))
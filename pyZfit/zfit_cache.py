@@ -0,0 +1,126 @@
+"""
+Binary cache of parsed data files.
+
+A parsed SegmentedDataset is stored as a directory of .npy files (one per
+array) plus the segment strings, named by a hash of the data file's contents
+and the versions of the code reading it (zfit_data.loader_version()).
+Reloading an unchanged file then skips parsing and load expression
+evaluation, and the arrays are memory mapped read-only instead of being
+read into memory.
+
+The cache directory is $ZFIT_CACHE_DIR if set, otherwise ZFit\\cache under
+%LOCALAPPDATA% (or ~/.zfit_cache where that isn't defined).
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import numpy as np
+
+from zfit_data import SegmentedDataset, loader_version
+
+ARRAYS = ("hz", "mag", "pha", "load", "offsets")
+# Read the data file in chunks of this size for hashing
+HASH_CHUNK = 1 << 20
+
+
+def cache_dir():
+    """
+    :return: directory holding cached datasets
+    """
+    if os.environ.get("ZFIT_CACHE_DIR"):
+        return os.environ["ZFIT_CACHE_DIR"]
+    if os.environ.get("LOCALAPPDATA"):
+        return os.path.join(os.environ["LOCALAPPDATA"], "ZFit", "cache")
+    return os.path.join(os.path.expanduser("~"), ".zfit_cache")
+
+
+def cache_key(file):
+    """
+    Cache key of a data file: hash of its contents and the versions of the
+    code reading it, so that edited files and reader changes both miss the
+    cache.
+    :param file: data file name
+    :return: hex digest string
+    """
+    h = hashlib.sha1((loader_version(file) + "\n").encode())
+    with open(file, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _load(path):
+    # Memory map the arrays of a cache entry
+    arrays = {name: np.load(os.path.join(path, name + ".npy"), mmap_mode="r")
+              for name in ARRAYS}
+    with open(os.path.join(path, "segments.json"), "r", encoding="utf-8") as f:
+        segment_strs = json.load(f)
+    return SegmentedDataset(segment_strs=segment_strs, **arrays)
+
+
+def _store(path, ds):
+    # Write to a temporary directory and rename it into place, so that a
+    # concurrent reader never sees a partial entry
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = tempfile.mkdtemp(dir=os.path.dirname(path))
+    try:
+        for name in ARRAYS:
+            np.save(os.path.join(tmp, name + ".npy"), np.ascontiguousarray(getattr(ds, name)))
+        with open(os.path.join(tmp, "segments.json"), "w", encoding="utf-8") as f:
+            json.dump(ds.segment_strs, f)
+        os.replace(tmp, path)
+    except OSError:
+        # Entry written by another process meanwhile, or cache not writable
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+def load_cached(file, loader):
+    """
+    Return the cached dataset for a data file, or read it with loader and
+    cache the result.
+    :param file: data file name
+    :param loader: callable(file) returning a SegmentedDataset
+    :return: SegmentedDataset; arrays are read-only memory maps when cached
+    """
+    path = os.path.join(cache_dir(), cache_key(file))
+    if os.path.isdir(path):
+        try:
+            return _load(path)
+        except (OSError, ValueError):
+            # Damaged entry: discard and reload
+            shutil.rmtree(path, ignore_errors=True)
+    ds = loader(file)
+    _store(path, ds)
+    return ds
+
+
+def clear_cache():
+    """
+    Delete all cached datasets.
+    """
+    shutil.rmtree(cache_dir(), ignore_errors=True)
+
+
+if __name__ == "__main__":
+    import sys
+    import time
+    import zfit_data
+
+    if sys.argv[1:] == ["--clear"]:
+        clear_cache()
+        print("Cleared", cache_dir())
+        sys.exit()
+
+    # Compare parsing with cached loading
+    for file in sys.argv[1:] or ["TestDataFiles/TestTline1, four loads.csv"]:
+        start = time.perf_counter()
+        zfit_data.read_data_file(file, cache=False)
+        t_parse = time.perf_counter() - start
+        zfit_data.read_data_file(file)
+        start = time.perf_counter()
+        zfit_data.read_data_file(file)
+        t_cached = time.perf_counter() - start
+        print("{}: parse {:.2f} ms, cached {:.2f} ms".format(file, t_parse*1e3, t_cached*1e3))
@@ -24,9 +24,9 @@ PARAM_FILE = "params.csv"
 # TODO: make this usable from os.startfile() -- not successful so far
 EDITOR = "notepad++.exe"
 EDIT_PATH = "C:\\Program Files\\Notepad++\\"
-# List of fitting methods available to lmfit
-# (Dogleg and Newton CG are not included since they require a Jacobian
-# to be supplied)
+# List of fitting methods available to lmfit.
+# A Jacobian is supplied for leastsq and the gradient methods (see
+# zfit_jacobian).  Dogleg is not included since it also requires a Hessian.
 METHODS = [
     ("Levenberg-Marquardt",         "leastsq"),
     ("Nelder-Mead",                 "nelder"),
@@ -36,7 +36,8 @@ METHODS = [
     ("COBYLA",                      "cobyla"),
     ("Truncated Newton",            "tnc"),
     ("Sequential Linear Squares",   "slsqp"),
-    ("Differential Evolution",      "differential_evolution")
+    ("Differential Evolution",      "differential_evolution"),
+    ("Newton-CG",                   "newton")
 ]
 # Define one or the other:
 LIMITS = "lmfit"
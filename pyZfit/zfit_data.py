@@ -0,0 +1,217 @@
+"""
+Reading of Zfit data files, shared by the GUI and the CLI.
+
+A data file is a CSV file with one header line and rows of frequency (Hz),
+magnitude (ohms) and phase (degrees).  It may be split into segments by lines
+starting with "<segment>", followed by a python expression for the load
+impedance of that segment in terms of w (radian frequency) and j, and an
+optional comment.  .bode3 files, LTspice exports (.txt) and Touchstone
+files (.s1p, .s2p, ... .ts) are read by zfit_bode3, zfit_ltspice and
+zfit_touchstone into the same form.
+
+Each segment's numbers are parsed in bulk, and its load expression is
+evaluated once over the whole omega array of the segment.  Parsed files are
+cached in binary form by zfit_cache.
+"""
+
+import importlib
+import io
+import re
+import numpy as np
+
+# Version of the parsed data layout, of CSV file reading and of load
+# expression evaluation, part of the zfit_cache key.  Increment whenever
+# any of them changes what is produced.  Files read by another module
+# (_READERS) also key on that module's own LOADER_VERSION.
+LOADER_VERSION = 2
+
+# Data files read by other modules: file name pattern, module, function
+_READERS = [(r"\.bode3$", "zfit_bode3", "read_bode3"),
+            (r"\.txt$", "zfit_ltspice", "read_ltspice"),
+            (r"\.(s\d+p|ts)$", "zfit_touchstone", "read_touchstone_dataset")]
+
+# Names available to segment load expressions, besides w and j
+LOAD_NAMESPACE = {"np": np, "pi": np.pi, "sqrt": np.sqrt, "exp": np.exp,
+                  "log": np.log, "log10": np.log10}
+
+
+class Segment:
+    """
+    Data for one segment of a data file.  Arrays are views into the
+    SegmentedDataset they came from.
+    """
+    __slots__ = ("segment_str", "hz", "mag", "pha", "load", "weight")
+
+    def __init__(self, segment_str, hz, mag, pha, load, weight):
+        self.segment_str = segment_str
+        self.hz = hz
+        self.mag = mag
+        self.pha = pha
+        self.load = load
+        self.weight = weight
+
+
+class SegmentedDataset:
+    """
+    All segments of a data file, held as single concatenated arrays with
+    an index of segment start offsets.  Segments are handed out as views,
+    so the GUI and the fitters share one copy of the data.  Modeled
+    magnitude and phase, once set, are held the same way.
+    """
+    __slots__ = ("hz", "mag", "pha", "load", "weight", "offsets", "segment_strs",
+                 "model_mag", "model_pha")
+
+    def __init__(self, hz, mag, pha, load, offsets, segment_strs, weight=None):
+        self.hz = hz
+        self.mag = mag
+        self.pha = pha
+        self.load = load
+        # Fitting weights, default 1.0
+        self.weight = np.ones(len(hz)) if weight is None else weight
+        # Segment i is [offsets[i]:offsets[i+1]]
+        self.offsets = np.asarray(offsets)
+        self.segment_strs = list(segment_strs)
+        self.model_mag = None
+        self.model_pha = None
+
+    def __len__(self):
+        return len(self.segment_strs)
+
+    def __getitem__(self, i):
+        s = self.segment_slice(i)
+        return Segment(self.segment_strs[i], self.hz[s], self.mag[s], self.pha[s],
+                       self.load[s], self.weight[s])
+
+    def segment_slice(self, i):
+        """
+        :param i: segment index (negative counts from the end)
+        :return: slice of segment i in the concatenated arrays
+        """
+        if not -len(self) <= i < len(self):
+            raise IndexError("segment index out of range")
+        i %= len(self)
+        return slice(int(self.offsets[i]), int(self.offsets[i+1]))
+
+    def set_modeled(self, mag, pha):
+        """
+        Set the modeled magnitude and phase of all segments.
+        :param mag: modeled magnitude array, same length as hz
+        :param pha: modeled phase array, degrees
+        """
+        if len(mag) != len(self.hz) or len(pha) != len(self.hz):
+            raise ValueError("modeled data length differs from dataset")
+        self.model_mag = mag
+        self.model_pha = pha
+
+    @property
+    def omega(self):
+        return 2.0*np.pi*self.hz
+
+
+def _parse_block(lines):
+    # Parse data lines "freq, mag, phase[, ...]" into an (n, 3) array
+    if not lines:
+        return np.empty((0, 3))
+    text = "".join(lines)
+    if text.count(",") == 2*len(lines):
+        # Exactly three columns everywhere: split all numbers at once
+        return np.array(text.replace(",", " ").split(), dtype=float).reshape(-1, 3)
+    return np.loadtxt(io.StringIO(text), delimiter=",", usecols=(0, 1, 2), ndmin=2)
+
+
+def eval_load(segment_str, w):
+    """
+    Evaluate a segment load expression over an omega array.
+    :param segment_str: text following "<segment>"; may be just a comment
+    :param w: radian frequency array
+    :return: complex load array, same length as w (1.0 if no expression)
+    """
+    try:
+        code = compile(segment_str, "<string>", "eval")
+    except SyntaxError:
+        # No load expression
+        code = compile("1", "<string>", "eval")
+    namespace = dict(LOAD_NAMESPACE, w=w, j=1j)
+    try:
+        load = eval(code, namespace)
+    except (TypeError, ValueError):
+        # Expression only works on scalars (eg math functions, or conditions
+        # like "50 if w > 1e6 else 0"): one at a time
+        load = [eval(code, dict(LOAD_NAMESPACE, w=_w, j=1j)) for _w in w]
+    return np.broadcast_to(np.asarray(load, dtype=complex), w.shape).copy()
+
+
+def read_data_file(file, cache=True):
+    """
+    Read a data file into a SegmentedDataset.
+    :param file: data file name; .bode3 files are read with zfit_bode3,
+                 .txt files as LTspice exports with zfit_ltspice, and
+                 Touchstone files with zfit_touchstone
+    :param cache: use the binary dataset cache (see zfit_cache)
+    :return: SegmentedDataset with at least one segment
+    """
+    if cache:
+        import zfit_cache
+        return zfit_cache.load_cached(file, _read_data_file)
+    return _read_data_file(file)
+
+
+def _reader(file):
+    # Module and reading function of a data file, or None for CSV files
+    for pattern, module, function in _READERS:
+        if re.search(pattern, file, re.I):
+            module = importlib.import_module(module)
+            return module, getattr(module, function)
+    return None
+
+
+def loader_version(file):
+    """
+    Version of the code reading a data file, for cache keys.
+    :param file: data file name
+    :return: string of this module's LOADER_VERSION and, for files read by
+             another module, that module's name and LOADER_VERSION
+    """
+    reader = _reader(file)
+    version = "zfit_data {}".format(LOADER_VERSION)
+    if reader is None:
+        return version
+    return "{} {} {}".format(version, reader[0].__name__, reader[0].LOADER_VERSION)
+
+
+def _read_data_file(file):
+    reader = _reader(file)
+    if reader is not None:
+        return reader[1](file)
+
+    with open(file, "r", encoding="utf-8", newline='') as f:
+        # Skip single header line
+        next(f)
+        lines = f.readlines()
+
+    # Split into blocks of data lines at <segment> lines
+    segment_strs, blocks = [""], [[]]
+    for line in lines:
+        if line[:9] == "<segment>":
+            if blocks[-1]:
+                # Data exists, start a new segment
+                segment_strs.append("")
+                blocks.append([])
+            segment_strs[-1] = line[9:].strip()
+            try:
+                compile(segment_strs[-1], "<string>", "eval")
+            except SyntaxError:
+                # Not a load expression (eg only a comment): no segment string
+                segment_strs[-1] = ""
+        elif line.strip():
+            blocks[-1].append(line)
+
+    data = [_parse_block(b) for b in blocks]
+    offsets = np.cumsum([0] + [len(d) for d in data])
+    hz = np.concatenate([d[:, 0] for d in data])
+    mag = np.concatenate([d[:, 1] for d in data])
+    pha = np.concatenate([d[:, 2] for d in data])
+    w = 2.0*np.pi*hz
+    load = np.concatenate([eval_load(s, w[offsets[i]:offsets[i+1]])
+                           for i, s in enumerate(segment_strs)])
+    return SegmentedDataset(hz, mag, pha, load, offsets, segment_strs)
@@ -0,0 +1,173 @@
+"""
+Selection of subsets of frequency points.
+
+log_decimate() picks a log-uniform subset of a sweep for coarse fitting,
+keeping extra points around resonances: peaks and dips of the magnitude
+(found by prominence, so measurement noise isn't mistaken for resonances)
+and zero crossings of the smoothed phase.
+
+minmax_decimate() and cell_decimate() pick the points of a plot line that
+can be told apart on screen, given the pixel column (and row) of each point
+(eg from log_columns()), so long sweeps draw as fast as short ones.
+"""
+
+import numpy as np
+from scipy.signal import find_peaks
+
+# Minimum prominence of a magnitude peak or dip, decades
+PROMINENCE = 0.05
+# Points kept across each resonance, spread over twice its half-height width
+RESONANCE_POINTS = 16
+# Minimum phase step, degrees, for a zero crossing of the smoothed phase to
+# count: resonances cross steeply, noise around 0 degrees doesn't
+PHASE_STEP = 1.0
+
+
+def _block_mean(x, block):
+    # Means of consecutive blocks of points (the last partial block dropped)
+    n = len(x) // block * block
+    return x[:n].reshape(-1, block).mean(axis=1)
+
+
+def resonance_points(mag, pha=None, smooth=1):
+    """
+    Indices of points describing resonances: points spread across each
+    prominent peak and dip of the magnitude, and the points either side of
+    steep zero crossings of the phase.
+    :param mag: magnitude array
+    :param pha: optional phase array
+    :param smooth: number of points averaged together before looking for
+                   peaks and crossings, to suppress noise (and save time on
+                   long sweeps)
+    :return: sorted array of indices
+    """
+    n = len(mag)
+    block = max(1, min(smooth, n // 3))
+    if n < 3:
+        return np.arange(n)
+    logmag = _block_mean(np.log10(np.maximum(np.abs(mag), np.finfo(float).tiny)), block)
+    # Index of each block's centre point
+    centre = (block - 1) / 2.0
+    idx = []
+    for sign in (1, -1):
+        peaks, props = find_peaks(sign * logmag, prominence=PROMINENCE, width=0)
+        for p, width in zip(peaks, props["widths"]):
+            idx.append(centre + block*np.linspace(p - width, p + width, RESONANCE_POINTS))
+            idx.append([centre + block*p])
+    if pha is not None:
+        pha = _block_mean(np.asarray(pha), block)
+        cross = np.nonzero((pha[:-1] * pha[1:] < 0) &
+                           (np.abs(np.diff(pha)) > PHASE_STEP))[0]
+        # Points either side of the crossing, between the block centres
+        mid = block*(cross + 1) - 0.5
+        idx.append(mid - 0.5)
+        idx.append(mid + 0.5)
+    if not idx:
+        return np.empty(0, dtype=int)
+    idx = np.rint(np.concatenate(idx)).astype(int)
+    return np.unique(np.clip(idx, 0, n - 1))
+
+
+def log_decimate(hz, n_points, mag=None, pha=None, offsets=None):
+    """
+    Indices of a log-uniform subset of frequency points.
+    Each segment is decimated separately, to about n_points in total,
+    keeping each segment's end points and resonance points (if mag given).
+    :param hz: frequency array, each segment sorted in frequency
+    :param n_points: target number of log-uniform points
+    :param mag: optional magnitude array, for resonance points
+    :param pha: optional phase array, for resonance points
+    :param offsets: optional segment start offsets (as SegmentedDataset.offsets);
+                    default is one segment
+    :return: sorted array of indices into hz
+    """
+    hz = np.asarray(hz)
+    if offsets is None:
+        offsets = [0, len(hz)]
+    keep = []
+    for a, b in zip(offsets[:-1], offsets[1:]):
+        n = b - a
+        # Share of the points in proportion to segment length
+        m = max(2, int(round(n_points * n / len(hz))))
+        if n <= m:
+            keep.append(np.arange(a, b))
+            continue
+        f = np.log(np.maximum(hz[a:b], np.finfo(float).tiny))
+        # Nearest point to each of m log-uniform frequencies
+        targets = np.linspace(f[0], f[-1], m)
+        i = np.clip(np.searchsorted(f, targets), 1, n - 1)
+        i -= (targets - f[i - 1]) < (f[i] - targets)
+        keep.append(a + i)
+        keep.append([a, b - 1])
+        if mag is not None:
+            # Look for resonances at about 4x the decimated resolution
+            keep.append(a + resonance_points(mag[a:b], None if pha is None else pha[a:b],
+                                             smooth=max(1, n // (4*m))))
+    return np.unique(np.concatenate(keep).astype(int))
+
+
+def log_columns(hz, n_columns, hz_range=None):
+    """
+    Pixel column of each frequency on a log frequency axis.
+    :param hz: frequency array
+    :param n_columns: number of columns across the range
+    :param hz_range: optional (low, high) frequencies of the range; default
+                     is the span of hz
+    :return: integer array of columns; points below the range are in
+             column -1, points above it in column n_columns
+    """
+    f = np.log10(np.maximum(np.asarray(hz, dtype=float), np.finfo(float).tiny))
+    if not len(f):
+        return np.empty(0, dtype=int)
+    lo, hi = (f.min(), f.max()) if hz_range is None else np.log10(hz_range)
+    columns = np.floor((f - lo) / max(hi - lo, np.finfo(float).eps) * n_columns)
+    columns = np.where(f > hi, n_columns, np.minimum(columns, n_columns - 1))
+    return np.maximum(columns, -1).astype(int)
+
+
+def _first_of_groups(keys):
+    # Index of the first point with each distinct key
+    return np.unique(keys, return_index=True)[1]
+
+
+def minmax_decimate(columns, y):
+    """
+    Indices of the points of a line needed to draw it at screen resolution:
+    the first, last, lowest and highest point in each pixel column.  Drawn
+    in order, they trace the same pixels as the whole line.
+    :param columns: integer pixel column of each point (eg from log frequency)
+    :param y: y value array
+    :return: sorted array of indices
+    """
+    columns = np.asarray(columns)
+    y = np.asarray(y)
+    if not len(y):
+        return np.empty(0, dtype=int)
+    idx = np.arange(len(y))
+    # Sort by column, then by y: the first and last of each column's run
+    # are its lowest and highest points
+    order = np.lexsort((y, columns))
+    starts = _first_of_groups(columns[order])
+    ends = np.append(starts[1:], len(order)) - 1
+    keep = [order[starts], order[ends],
+            np.minimum.reduceat(idx[order], starts),
+            np.maximum.reduceat(idx[order], starts)]
+    return np.unique(np.concatenate(keep))
+
+
+def cell_decimate(columns, rows):
+    """
+    Indices of the points of a marker plot needed to draw it at screen
+    resolution: the first point in each occupied cell of a grid.  With
+    pixel cells, the dropped points are hidden by the kept ones.
+    :param columns: integer grid column of each point
+    :param rows: integer grid row of each point
+    :return: sorted array of indices
+    """
+    columns = np.asarray(columns, dtype=np.int64)
+    rows = np.asarray(rows, dtype=np.int64)
+    if not len(rows):
+        return np.empty(0, dtype=int)
+    # One key per cell
+    keys = (columns - columns.min()) * (rows.max() - rows.min() + 1) + (rows - rows.min())
+    return np.sort(_first_of_groups(keys))
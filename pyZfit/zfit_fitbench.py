@@ -0,0 +1,223 @@
+"""
+Benchmark of the fitting methods: every method in METHODS is run against
+each bundled test dataset with its matching model, and the wall time, number
+of model evaluations, final chi-square and success of each fit are recorded.
+
+Methods are ranked per dataset: fits which reach the best chi-square found
+by any method (within CONVERGED_TOL relative, plus CONVERGED_ATOL for exact
+fits) come first, fastest first, followed by the other successful fits by
+chi-square, then failures.  Fits run in worker
+processes, and each is aborted after a time limit, so the global methods
+can't hold up the whole matrix.
+
+Usage:
+    python zfit_fitbench.py -o fitbench.csv
+    python zfit_fitbench.py --method leastsq --method nelder --pair "my.csv=ls(cpr)"
+"""
+
+import os
+# One BLAS thread per worker process; the parallelism comes from the pool.
+# Must be set before numpy is imported.
+for _var in ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS"):
+    os.environ.setdefault(_var, "1")
+
+import csv
+import time
+import warnings
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+from lmfit.minimizer import AbortFitException
+
+import zfit_data
+from zfit_batch import method_index
+from zfit_models import load_model
+from zfit_modelcore_cli import DoModel, METHODS
+
+# Bundled test datasets and the model each was measured for
+DATASETS = [
+    ("TestDataFiles/Sample ls(cpr).csv", "ls(cpr)"),
+    ("TestDataFiles/Sample rs(c+load).csv", "rs(c+load)"),
+    ("TestDataFiles/Xfmr, 3 loads.csv", "xfmr1"),
+    ("TestDataFiles/Xfmr, 3 loads.csv", "xfmr2"),
+    ("TestDataFiles/MatrixSolnExptSwept.csv", "MatrixSolnExptModel"),
+]
+# Limits for each fit
+MAX_NFEV = 20000
+TIME_LIMIT = 60.0
+# Relative chi-square margin within which a fit counts as converged
+CONVERGED_TOL = 0.01
+# Absolute margin, for datasets fitted exactly (best chi-square near zero),
+# where the relative margin is meaningless
+CONVERGED_ATOL = 1e-10
+
+RESULT_COLUMNS = ["dataset", "model", "method", "rank", "converged", "success",
+                  "chisqr", "nfev", "wall_time", "message"]
+
+
+def fit_method(file, model_name, method_nr, max_nfev=MAX_NFEV, time_limit=TIME_LIMIT):
+    """
+    Fit one dataset with one model and method.
+    :param file: data file name
+    :param model_name: model script name
+    :param method_nr: index into METHODS
+    :param max_nfev: limit on model evaluations
+    :param time_limit: seconds after which the fit is aborted
+    :return: dict with RESULT_COLUMNS keys except rank and converged
+    """
+    row = {"dataset": os.path.basename(file), "model": model_name,
+           "method": METHODS[method_nr][1]}
+    start = time.perf_counter()
+
+    def timeout(params, iter, resid, *args, **kws):
+        # lmfit aborts the fit when the iteration callback returns True
+        return time.perf_counter() - start > time_limit
+
+    try:
+        ds = zfit_data.read_data_file(file)
+        _, result, chisqr = DoModel().do_model_arrays(
+            load_model(model_name), ds.hz, ds.mag, ds.pha, ds.load, method_nr,
+            max_nfev=max_nfev, iter_cb=timeout)
+        if result.aborted:
+            message = "Timed out after {:g} s".format(time_limit)
+        else:
+            # Not all methods set a message (eg ampgo)
+            message = str(getattr(result, "message", "")).strip()
+        row.update(success=bool(result.success and not result.aborted and np.isfinite(chisqr)),
+                   chisqr=chisqr if np.isfinite(chisqr) else np.nan,
+                   nfev=result.nfev, message=message)
+    except AbortFitException:
+        # Some methods don't catch the abort themselves
+        row.update(success=False, chisqr=np.nan, nfev=0,
+                   message="Timed out after {:g} s".format(time_limit))
+    except Exception as e:
+        row.update(success=False, chisqr=np.nan, nfev=0, message=repr(e))
+    row["wall_time"] = time.perf_counter() - start
+    return row
+
+
+def _fit_job(job):
+    # Worker process entry point.  Overflow and nan warnings from methods
+    # probing extreme values would swamp the progress output.
+    warnings.simplefilter("ignore")
+    return fit_method(*job)
+
+
+def rank(rows):
+    """
+    Rank the fits of each dataset and model in place, and sort them.
+    :param rows: list of fit_method() results
+    :return: rows sorted by dataset, model and rank
+    """
+    groups = {}
+    for row in rows:
+        groups.setdefault((row["dataset"], row["model"]), []).append(row)
+    ranked = []
+    for key in sorted(groups):
+        group = groups[key]
+        ok = [r["chisqr"] for r in group if r["success"]]
+        best = min(ok) if ok else np.nan
+        for r in group:
+            r["converged"] = bool(r["success"] and
+                                  r["chisqr"] <= best*(1 + CONVERGED_TOL) + CONVERGED_ATOL)
+        group.sort(key=lambda r: (not r["converged"], not r["success"],
+                                  r["wall_time"] if r["converged"] else r["chisqr"]))
+        for i, r in enumerate(group, 1):
+            r["rank"] = i
+        ranked += group
+    return ranked
+
+
+def run(datasets=DATASETS, methods=None, max_nfev=MAX_NFEV, time_limit=TIME_LIMIT,
+        processes=None, progress=None):
+    """
+    Run every method against every dataset.
+    :param datasets: list of (data file, model script name)
+    :param methods: list of indices into METHODS (default: all)
+    :param max_nfev: limit on model evaluations per fit
+    :param time_limit: seconds after which a fit is aborted
+    :param processes: number of worker processes (default: one per core)
+    :param progress: optional callable(row, n_done, n_total) called as fits finish
+    :return: ranked list of result rows
+    """
+    if methods is None:
+        methods = range(len(METHODS))
+    jobs = [(file, model, m, max_nfev, time_limit) for file, model in datasets for m in methods]
+    rows = []
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        futures = [pool.submit(_fit_job, job) for job in jobs]
+        for n, future in enumerate(as_completed(futures), 1):
+            rows.append(future.result())
+            if progress is not None:
+                progress(rows[-1], n, len(jobs))
+    return rank(rows)
+
+
+def write_results(rows, out):
+    """
+    Write ranked result rows to a CSV table.
+    :param rows: list of result rows from run()
+    :param out: output CSV file name
+    """
+    with open(out, mode='w', encoding='utf-8', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(RESULT_COLUMNS)
+        for row in rows:
+            writer.writerow([row[c] for c in RESULT_COLUMNS])
+
+
+def print_table(rows):
+    """
+    Print the ranked methods of each dataset and model.
+    :param rows: list of result rows from run()
+    """
+    key = None
+    for row in rows:
+        if (row["dataset"], row["model"]) != key:
+            key = (row["dataset"], row["model"])
+            print("\n{} / {}".format(*key))
+            print("  {:>4} {:24s} {:>12} {:>7} {:>9}".format("rank", "method", "chi-square",
+                                                          "nfev", "time (s)"))
+        if row["converged"]:
+            note = ""
+        elif row["success"]:
+            note = "  (not converged)"
+        else:
+            note = "  FAILED: " + row["message"]
+        print("  {:>4} {:24s} {:>12.6g} {:>7} {:>9.2f}{}".format(
+            row["rank"], row["method"], row["chisqr"], row["nfev"], row["wall_time"], note))
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Benchmark fitting methods on the test datasets")
+    parser.add_argument("--method", action="append",
+                        help="lmfit method name or index into METHODS (may be repeated; default all)")
+    parser.add_argument("--pair", action="append",
+                        help="FILE=MODEL dataset and model to use instead of the bundled ones "
+                             "(may be repeated)")
+    parser.add_argument("--max-nfev", type=int, default=MAX_NFEV,
+                        help="limit on model evaluations per fit")
+    parser.add_argument("--time-limit", type=float, default=TIME_LIMIT,
+                        help="seconds after which a fit is aborted")
+    parser.add_argument("-j", "--processes", type=int, default=None,
+                        help="number of worker processes (default: one per core)")
+    parser.add_argument("-o", "--out", default="zfit_fitbench.csv", help="results CSV file")
+    args = parser.parse_args()
+
+    datasets = DATASETS
+    if args.pair:
+        datasets = [tuple(p.rsplit("=", 1)) for p in args.pair]
+    methods = None if not args.method else [method_index(m) for m in args.method]
+
+    def report(row, n, total):
+        print("[{}/{}] {} / {} / {}: {:.2f} s".format(
+            n, total, row["dataset"], row["model"], row["method"], row["wall_time"]))
+
+    start = time.perf_counter()
+    rows = run(datasets, methods, args.max_nfev, args.time_limit, args.processes, report)
+    write_results(rows, args.out)
+    print_table(rows)
+    print("\n{} fits in {:.1f} s, written to {}".format(
+        len(rows), time.perf_counter() - start, args.out))
@@ -0,0 +1,128 @@
+"""
+Jacobians of the modeling residuals, so that leastsq, least_squares and the
+gradient-based scalar minimizers don't have to estimate them with one full
+model evaluation per varying parameter.
+
+A model script may supply the derivatives itself with an optional function
+    jacobian(w, params, **kws)
+returning a dict of {param name: dZ/dparam array}.  For params it doesn't
+cover, the derivatives are estimated by forward differences.  Perturbed
+param values are passed to the model as a column of values, so a model
+written with numpy broadcasting evaluates all of them in a single call.
+
+(A complex step can't be used here, because the model output is already
+complex.)
+"""
+
+import numpy as np
+
+# Methods which take the Jacobian of the residual array (Dfun / jac)
+JACOBIAN_METHODS = ("leastsq", "least_squares")
+# Scalar methods which take the gradient of the sum of squared residuals.
+# dogleg and the trust-region methods also need a Hessian and are not included.
+GRADIENT_METHODS = ("cg", "bfgs", "newton", "lbfgsb", "tnc", "slsqp")
+# Upper limit on (perturbed param sets x frequency points) evaluated in one
+# model call.  Matrix models hold a k x k matrix per point, so keep it modest.
+BATCH_POINTS = 65536
+# Relative step of the central differences.  Much larger than the usual
+# eps**(1/3), because models solving a matrix per point are only accurate to
+# about 1e-12, which swamps the differences of smaller steps.
+DIFF_STEP = 1e-4
+
+
+def _values(params):
+    # Plain dict of param values, from lmfit Parameters or a dict
+    return {name: getattr(p, "value", p) for name, p in params.items()}
+
+
+def var_names(params):
+    """
+    Names of the params varied by the fit, in lmfit's order.
+    :param params: lmfit Parameters
+    :return: list of names
+    """
+    return [name for name, p in params.items() if p.vary and not p.expr]
+
+
+def model_jacobian(model, w, params, names, **kws):
+    """
+    Derivatives of the model impedance with respect to some params.
+    :param model: model script module
+    :param w: radian frequency array
+    :param params: lmfit Parameters or dict of values
+    :param names: list of param names to differentiate with respect to
+    :param kws: keyword args for the model (eg load, fsf, zsf)
+    :return: complex array of shape (len(w), len(names))
+    """
+    return _model_jacobian(model, w, _values(params), names, kws)
+
+
+def _model_jacobian(model, w, values, names, kws):
+    jac = np.empty((len(w), len(names)), dtype=complex)
+    todo = list(range(len(names)))
+
+    # Analytic derivatives from the model script, if provided
+    if hasattr(model, "jacobian"):
+        given = model.jacobian(w, values, **kws)
+        for i, name in enumerate(names):
+            if name in given:
+                jac[:, i] = given[name]
+                todo.remove(i)
+    if not todo:
+        return jac
+
+    # Central differences for the rest, several perturbations per model call
+    batch = max(1, BATCH_POINTS // max(2*len(w), 1))
+    for start in range(0, len(todo), batch):
+        cols = todo[start:start + batch]
+        # Param values stepped up and down; the steps actually taken, after
+        # rounding, are their differences
+        up = [values[names[i]] + DIFF_STEP*max(abs(values[names[i]]), 1e-12) for i in cols]
+        down = [2*values[names[i]] - u for i, u in zip(cols, up)]
+        steps = np.subtract(up, down)
+        if len(cols) > 1:
+            # Each param becomes a column of 2*len(cols) values; rows r and
+            # len(cols)+r have param cols[r] stepped up and down.
+            perturbed = {name: np.full((2*len(cols), 1), float(val))
+                         for name, val in values.items()}
+            for r, i in enumerate(cols):
+                perturbed[names[i]][r, 0] = up[r]
+                perturbed[names[i]][len(cols) + r, 0] = down[r]
+            try:
+                z = model.model(w, perturbed, **kws)
+            except Exception:
+                z = None
+            if z is not None and np.shape(z) == (2*len(cols), len(w)):
+                jac[:, cols] = ((z[:len(cols)] - z[len(cols):]) / steps[:, None]).T
+                continue
+        # Model doesn't broadcast over params: two calls per param
+        for i, u, d, h in zip(cols, up, down, steps):
+            z = [model.model(w, dict(values, **{names[i]: v}), **kws) for v in (u, d)]
+            jac[:, i] = (z[0] - z[1]) / h
+    return jac
+
+
+def residual_jacobian(model, params, w, Z, weight, log_mag=True, **kws):
+    """
+    Jacobian of the residuals returned by DoModel._fcn2min (without zfit
+    limit penalties), in the form lmfit expects from Dfun.
+    :param model: model script module
+    :param params: lmfit Parameters
+    :param w: radian frequency array
+    :param Z: complex impedance target (unused, since it's constant)
+    :param weight: array of weights corresponding to frequencies w
+    :param log_mag: True if residuals are differences of log10 impedance
+    :param kws: keyword args for the model (eg load, fsf, zsf)
+    :return: float array of shape (2*len(w), number of varying params)
+    """
+    values = _values(params)
+    jac = _model_jacobian(model, w, values, var_names(params), kws)
+    if log_mag:
+        # d/dp of -log10(Zmodel) = -dZ/dp / (Zmodel * ln(10))
+        zm = model.model(w, values, **kws)
+        jac /= (-np.log(10.0) * zm)[:, None]
+    else:
+        jac = -jac
+    jac *= np.reshape(weight, (-1, 1))
+    # Interleave re/im rows to match the residual array's view('double')
+    return np.stack((jac.real, jac.imag), axis=1).reshape(2 * len(w), -1)
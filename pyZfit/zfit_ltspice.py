@@ -0,0 +1,509 @@
+"""
+Reading of LTspice waveform exports (File / Export data as text in the
+waveform viewer) and of binary .raw simulation results.
+
+An export is a tab separated text file with a header line naming the x axis
+("Freq." for AC analyses) and each exported trace, then one row per point.
+AC traces are complex, written in one of the export formats, recognised by
+their units:
+    Cartesian:          re,im
+    Polar / Bode:       (magnitude dB,phase deg)
+    linear magnitude:   (magnitude,phase deg)
+Real (eg transient) traces are single numbers.  A .step simulation exports
+each run after a "Step Information: ..." line; runs are kept as separate
+steps, and become separate segments of a SegmentedDataset.
+
+Files are read in chunks of whole lines.  All the numbers of a chunk are
+converted in one call, after stripping the unit marks, so large exports
+are read at about the speed of a plain numeric table without holding the
+text in memory.
+
+A .raw file has a text header (UTF-16 in recent LTspice versions) listing
+the variables, then the points in binary.  AC results are complex doubles,
+frequency included, stored point by point (or variable by variable with
+the "fastaccess" flag).  RawFile memory-maps the binary part, so traces are
+NumPy views of the file and nothing is read until used.  The runs of a
+stepped simulation follow each other; a run starts where the frequency
+sweep starts again.  Runs are found from the frequency of a few points
+when they are all the same length, so a single run can be taken from a
+large stepped file without reading the others.
+"""
+
+import io
+import itertools
+import os
+import re
+import warnings
+import numpy as np
+
+from zfit_data import SegmentedDataset
+
+# Version of the reading of exports and .raw files, part of the zfit_cache key (see
+# zfit_data.LOADER_VERSION).  Increment whenever it changes what is produced.
+LOADER_VERSION = 1
+
+# Bytes read at a time
+CHUNK_BYTES = 1 << 24
+
+# Start of the line before each run of a .step simulation
+STEP_MARK = b"Step Information:"
+# Unit marks and brackets of complex values: deleted.  The degree sign is
+# 0xB0 in Latin-1, 0xC2 0xB0 in UTF-8.
+_DELETE = b"()dB\xb0\xc2"
+# Separators: tab and the comma between parts of a complex value
+_SPACES = bytes.maketrans(b"\t,", b"  ")
+# Bytes of a .raw file read at a time while looking for the end of its header
+RAW_HEADER_BYTES = 1 << 16
+# Points read at a time while looking for the end of the first run
+RAW_SCAN_POINTS = 1 << 16
+
+
+class LtspiceExport:
+    """
+    Data of an LTspice export, all steps concatenated.
+    """
+    def __init__(self, x_name, names, x, y, offsets, step_strs, fmt):
+        """
+        :param x_name: x axis name, eg "Freq."
+        :param names: trace names
+        :param x: x array of all steps
+        :param y: array of points x traces, complex for AC data
+        :param offsets: step start offsets; step i is [offsets[i]:offsets[i+1]]
+        :param step_strs: step information of each step ("" if not stepped)
+        :param fmt: "cartesian", "db", "polar" or "real"
+        """
+        self.x_name = x_name
+        self.names = names
+        self.x = x
+        self.y = y
+        self.offsets = np.asarray(offsets)
+        self.step_strs = step_strs
+        self.fmt = fmt
+
+    def __len__(self):
+        return len(self.step_strs)
+
+    def trace(self, trace=0):
+        """
+        :param trace: trace name or index into names
+        :return: array of the trace's values over all steps
+        """
+        if isinstance(trace, str):
+            if trace not in self.names:
+                raise KeyError("No trace '{}' in the export".format(trace))
+            trace = self.names.index(trace)
+        return self.y[:, trace]
+
+    def to_dataset(self, trace=0):
+        """
+        Make a SegmentedDataset of one impedance trace, one segment per step.
+        :param trace: trace name or index into names
+        :return: SegmentedDataset with no loads; segment strings give the
+                 trace name and step
+        """
+        z = self.trace(trace).astype(complex)
+        name = trace if isinstance(trace, str) else self.names[trace]
+        # Unit load, with the trace name and step as a comment
+        segment_strs = ["1  # " + (name + " " + s).strip() for s in self.step_strs]
+        return SegmentedDataset(self.x, np.abs(z), np.angle(z, deg=True),
+                                np.ones(len(z), dtype=complex), self.offsets, segment_strs)
+
+
+def _numbers(buf, n_cols):
+    # All the numbers of a block of data lines, as rows of n_cols
+    text = buf.translate(_SPACES, _DELETE).decode("latin-1")
+    if not text.strip():
+        # np.fromstring() gives [-1.] for a string of only line breaks
+        return np.empty((0, n_cols))
+    try:
+        with warnings.catch_warnings():
+            # Old NumPy versions warn and stop at bad data instead of raising
+            warnings.simplefilter("error")
+            values = np.fromstring(text, sep=" ")
+    except (ValueError, DeprecationWarning):
+        # Let float() name the bad value
+        values = np.array(text.split(), dtype=float)
+    if len(values) % n_cols:
+        raise ValueError("Export rows don't all have {} values".format(n_cols))
+    return values.reshape(-1, n_cols)
+
+
+def _reader(f):
+    # Function reading up to n bytes' worth of a file as Latin-1 bytes.
+    # UTF-16 files (with a byte order mark) are converted.
+    if f.read(2) == b"\xff\xfe":
+        text = io.TextIOWrapper(f, encoding="utf-16-le", newline="")
+        return lambda n: text.read(n // 2).encode("latin-1", errors="replace")
+    f.seek(0)
+    return f.read
+
+
+def _line_blocks(read, chunk_bytes):
+    # Blocks of whole lines of a file
+    rest = b""
+    while True:
+        data = read(chunk_bytes)
+        if not data:
+            if rest:
+                yield rest
+            return
+        data = rest + data
+        end = data.rfind(b"\n") + 1
+        if end:
+            yield data[:end]
+            rest = data[end:]
+        else:
+            rest = data
+
+
+def _detect_format(line):
+    # Export format of a data line, from the units of its values
+    if b"dB" in line:
+        return "db"
+    if b"\xb0" in line:
+        return "polar"
+    if b"," in line:
+        return "cartesian"
+    return "real"
+
+
+def _values(numbers, fmt):
+    # Trace values from the converted numbers of the trace columns
+    if fmt == "real":
+        return numbers
+    a, b = numbers[:, 0::2], numbers[:, 1::2]
+    if fmt == "cartesian":
+        return a + 1j*b
+    if fmt == "db":
+        a = np.power(10.0, a / 20.0)
+    return a * np.exp(1j*np.radians(b))
+
+
+def read_export(file, chunk_bytes=CHUNK_BYTES):
+    """
+    Read an LTspice waveform export.
+    :param file: export file name
+    :param chunk_bytes: bytes read and converted at a time
+    :return: LtspiceExport
+    """
+    with open(file, "rb") as f:
+        blocks = _line_blocks(_reader(f), chunk_bytes)
+        first = next(blocks, b"")
+        header, _, first = first.partition(b"\n")
+        columns = header.decode("latin-1").strip().split("\t")
+        x_name, names = columns[0], columns[1:]
+        if not names:
+            raise ValueError("No traces in the export header of {}".format(file))
+
+        fmt = None
+        values = []
+        n_rows = 0
+        # Row where each step starts, and its step information
+        starts, step_strs = [0], [""]
+
+        def convert(buf):
+            nonlocal fmt, n_rows
+            if not buf.strip():
+                return
+            if fmt is None:
+                fmt = _detect_format(buf.lstrip().split(b"\n", 1)[0])
+            v = _numbers(buf, 1 + len(names) * (1 if fmt == "real" else 2))
+            values.append(v)
+            n_rows += len(v)
+
+        for block in itertools.chain([first], blocks):
+            # Split the block at step lines
+            pos = block.find(STEP_MARK)
+            convert(block if pos < 0 else block[:pos])
+            while pos >= 0:
+                end = block.find(b"\n", pos)
+                end = len(block) if end < 0 else end
+                starts.append(n_rows)
+                step_strs.append(" ".join(block[pos + len(STEP_MARK):end].decode("latin-1").split()))
+                pos = block.find(STEP_MARK, end)
+                convert(block[end:pos] if pos >= 0 else block[end:])
+
+    if not values:
+        raise ValueError("No data in {}".format(file))
+    values = np.concatenate(values)
+    # Drop steps without points (eg the rows before the first step line)
+    offsets = starts + [n_rows]
+    keep = [i for i in range(len(starts)) if offsets[i+1] > offsets[i]]
+    offsets = [offsets[i] for i in keep] + [n_rows]
+    step_strs = [step_strs[i] for i in keep]
+    return LtspiceExport(x_name, names, values[:, 0], _values(values[:, 1:], fmt),
+                         offsets, step_strs, fmt)
+
+
+def read_ltspice(file, trace=0):
+    """
+    Read an LTspice AC export into a SegmentedDataset, one segment per step.
+    :param file: export file name
+    :param trace: trace name or index (default: the first trace)
+    :return: SegmentedDataset
+    """
+    return read_export(file).to_dataset(trace)
+
+
+class RawFile:
+    """
+    Memory-mapped LTspice .raw file of an AC analysis.  Traces are
+    identified by name (eg "V(n001)", case insensitive) or by index into
+    names; the frequency is variable 0.
+    """
+    def __init__(self, file):
+        self.file = file
+        with open(file, "rb") as f:
+            header, offset = _raw_header(f)
+        self.header = {}
+        self.names = []
+        lines = iter(header.splitlines())
+        for line in lines:
+            key, _, value = line.partition(":")
+            if key == "Variables":
+                break
+            self.header[key.strip()] = value.strip()
+        n_vars = int(self.header["No. Variables"])
+        for line in itertools.islice(lines, n_vars):
+            self.names.append(line.split()[1])
+        self.flags = self.header.get("Flags", "").split()
+        if "complex" not in self.flags:
+            raise ValueError("{} is not an AC analysis (no complex flag)".format(file))
+        self.n_points = int(self.header["No. Points"])
+        if "fastaccess" in self.flags:
+            # Variable by variable
+            self._data = np.memmap(file, dtype=np.complex128, mode="r", offset=offset,
+                                   shape=(n_vars, self.n_points)).T
+        else:
+            self._data = np.memmap(file, dtype=np.complex128, mode="r", offset=offset,
+                                   shape=(self.n_points, n_vars))
+        self._offsets = None
+        self._step_strs = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        # Views handed out keep the mapping open until they are released
+        self._data = None
+
+    def __len__(self):
+        # Number of runs
+        return len(self.offsets) - 1
+
+    def _index(self, trace):
+        # Variable index of a trace name or index
+        if isinstance(trace, str):
+            lower = [n.lower() for n in self.names]
+            if trace.lower() not in lower:
+                raise KeyError("No trace '{}' in {}".format(trace, self.file))
+            return lower.index(trace.lower())
+        return trace
+
+    @property
+    def hz(self):
+        """
+        Frequency of all points of all runs, a view of the file.
+        """
+        return self._data[:, 0].real
+
+    def trace(self, trace):
+        """
+        :param trace: trace name or index into names
+        :return: complex array of all points of all runs, a view of the file
+        """
+        return self._data[:, self._index(trace)]
+
+    @property
+    def offsets(self):
+        """
+        Run start offsets; run i is [offsets[i]:offsets[i+1]].
+        """
+        if self._offsets is None:
+            self._offsets = self._find_runs()
+        return self._offsets
+
+    def _find_runs(self):
+        n = self.n_points
+        if "stepped" not in self.flags or n < 2:
+            return np.array([0, n])
+        hz = self.hz
+        # Length of the first run: the first point where the sweep starts again
+        first = None
+        for a in range(1, n, RAW_SCAN_POINTS):
+            b = min(a + RAW_SCAN_POINTS, n)
+            back = np.nonzero(hz[a:b] < hz[a-1:b-1])[0]
+            if len(back):
+                first = a + back[0]
+                break
+        if first is None:
+            return np.array([0, n])
+        starts = np.arange(0, n, first)
+        # Runs all alike: check the first and last point of each
+        if (n % first == 0 and np.all(hz[starts] == hz[0]) and
+                np.all(hz[starts + first - 1] == hz[first - 1])):
+            return np.append(starts, n)
+        # Runs of different lengths: look at every point
+        return np.concatenate(([0], np.nonzero(np.diff(hz) < 0)[0] + 1, [n]))
+
+    @property
+    def step_strs(self):
+        """
+        Step information of each run: the .step lines of the simulation's
+        .log file if there is one, otherwise "Run i/n".
+        """
+        if self._step_strs is None:
+            steps = _log_steps(os.path.splitext(self.file)[0] + ".log")
+            if len(steps) != len(self):
+                steps = ["Run {}/{}".format(i + 1, len(self)) for i in range(len(self))]
+            self._step_strs = steps if len(self) > 1 else [""]
+        return self._step_strs
+
+    def run(self, i, traces):
+        """
+        Frequency and traces of one run, as views of the file.  Only the
+        points of this run are read when the views are used.
+        :param i: run index
+        :param traces: list of trace names or indices
+        :return: tuple (hz view, list of complex trace views)
+        """
+        s = slice(int(self.offsets[i]), int(self.offsets[i+1]))
+        return self.hz[s], [self.trace(t)[s] for t in traces]
+
+    def impedance(self, trace, ref=None):
+        """
+        Impedance of all runs from a trace, eg V(n001), or the ratio of two,
+        eg V(n001) / -I(V1).
+        :param trace: trace name or index
+        :param ref: optional trace to divide by; a name may start with "-"
+                    (LTspice source currents flow into the + terminal)
+        :return: complex array (a view of the file if ref is None)
+        """
+        z = self.trace(trace)
+        if ref is None:
+            return z
+        ref, sign = _signed(ref)
+        return z / (sign * self.trace(ref))
+
+    def to_dataset(self, trace, ref=None, runs=None):
+        """
+        Make a SegmentedDataset of an impedance, one segment per run.
+        :param trace: trace name or index
+        :param ref: optional trace to divide by (see impedance())
+        :param runs: list of run indices (default: all)
+        :return: SegmentedDataset with no loads; segment strings give the
+                 trace and step
+        """
+        if runs is None:
+            runs = range(len(self))
+        hz, z, segment_strs = [], [], []
+        name = self.names[self._index(trace)]
+        if ref is not None:
+            ref, sign = _signed(ref)
+            name += "/" + ("-" if sign < 0 else "") + self.names[self._index(ref)]
+        for i in runs:
+            h, t = self.run(i, [trace] if ref is None else [trace, ref])
+            hz.append(h)
+            z.append(t[0] if ref is None else t[0] / (sign * t[1]))
+            # Unit load, with the trace name and step as a comment
+            segment_strs.append("1  # " + (name + " " + self.step_strs[i]).strip())
+        offsets = np.cumsum([0] + [len(h) for h in hz])
+        hz, z = np.concatenate(hz), np.concatenate(z)
+        return SegmentedDataset(hz, np.abs(z), np.angle(z, deg=True),
+                                np.ones(len(hz), dtype=complex), offsets, segment_strs)
+
+
+def _signed(ref):
+    # Trace name or index, and sign, of a reference trace such as "-I(V1)"
+    if isinstance(ref, str) and ref.startswith("-"):
+        return ref[1:], -1.0
+    return ref, 1.0
+
+
+def _raw_header(f):
+    # Header text of a .raw file, and the offset of its binary data
+    head = b""
+    while True:
+        data = f.read(RAW_HEADER_BYTES)
+        head += data
+        # UTF-16 headers have a zero high byte after the first letter
+        enc = "utf-16-le" if head[1:2] == b"\x00" else "latin-1"
+        i = head.find("Binary:\n".encode(enc))
+        if i >= 0:
+            return head[:i].decode(enc), i + len("Binary:\n".encode(enc))
+        if head.find("Values:\n".encode(enc)) >= 0:
+            raise ValueError("{} is an ASCII .raw file; only binary ones are read".format(f.name))
+        if not data:
+            raise ValueError("No binary data in {}".format(f.name))
+
+
+def _log_steps(log):
+    # Step parameters of each run, from the .step lines of an LTspice log
+    if not os.path.exists(log):
+        return []
+    with open(log, "rb") as f:
+        text = f.read()
+    text = text.decode("utf-16-le" if text[1:2] == b"\x00" else "latin-1")
+    return [" ".join(m.split()) for m in re.findall(r"^\s*\.step\s+(.*?)\s*$", text, re.M)]
+
+
+def read_raw(file, trace, ref=None):
+    """
+    Read an impedance from an LTspice AC .raw file into a SegmentedDataset,
+    one segment per run.
+    :param file: .raw file name
+    :param trace: trace name or index
+    :param ref: optional trace to divide by, eg "-I(V1)"
+    :return: SegmentedDataset
+    """
+    with RawFile(file) as raw:
+        return raw.to_dataset(trace, ref)
+
+if __name__ == "__main__":
+    import sys
+    import tempfile
+    import time
+
+    # Synthetic files are written to a temporary directory removed at the end
+    with tempfile.TemporaryDirectory() as tmp:
+        files = sys.argv[1:]
+        if not files:
+            # Timing on the same synthetic 3-step AC results of 1M points, as a
+            # Bode export and as a .raw file
+            hz = np.logspace(0, 8, 333334)
+            runs = [r + 1j*2*np.pi*hz*1e-6 for r in (1.0, 10.0, 100.0)]
+            txt = os.path.join(tmp, "demo.txt")
+            with open(txt, "w", encoding="latin-1", newline="") as f:
+                f.write("Freq.\tV(n001)/I(V1)\r\n")
+                for k, z in enumerate(runs):
+                    f.write("Step Information: Rl={:g}  (Run: {}/3)\r\n".format(abs(z[0]), k + 1))
+                    rows = np.column_stack((hz, 20*np.log10(np.abs(z)), np.angle(z, deg=True)))
+                    f.writelines("{:.14e}\t({:.14e}dB,{:.14e}\xb0)\r\n".format(*row) for row in rows)
+            raw = os.path.join(tmp, "demo.raw")
+            with open(raw, "wb") as f:
+                f.write(("Title: * demo\nPlotname: AC Analysis\nFlags: complex forward log stepped\n"
+                         "No. Variables: 3\nNo. Points: {}\nVariables:\n\t0\tfrequency\tfrequency\n"
+                         "\t1\tV(n001)\tvoltage\n\t2\tI(V1)\tdevice_current\nBinary:\n"
+                         ).format(3*len(hz)).encode("utf-16-le"))
+                for z in runs:
+                    np.column_stack((hz, z, -np.ones(len(hz)))).astype(np.complex128).tofile(f)
+            files = [txt, raw]
+        for file in files:
+            start = time.perf_counter()
+            if file.lower().endswith(".raw"):
+                with RawFile(file) as r:
+                    r.to_dataset("V(n001)", "-I(V1)")
+                    print("{}: {} points, {} runs, traces {}, read in {:.2f} s".format(
+                        file, r.n_points, len(r), ", ".join(r.names), time.perf_counter() - start))
+                    for i, s in enumerate(r.step_strs):
+                        print("  {:3d} {}".format(i, s or "(not stepped)"))
+                continue
+            export = read_export(file)
+            print("{}: {} points, {} steps, {} traces ({}), read in {:.2f} s".format(
+                file, len(export.x), len(export), len(export.names), export.fmt,
+                time.perf_counter() - start))
+            for i, s in enumerate(export.step_strs):
+                print("  {:3d} {}".format(i, s or "(not stepped)"))
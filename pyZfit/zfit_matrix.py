@@ -0,0 +1,133 @@
+"""
+Helpers for model scripts whose impedance comes from a matrix solution
+(node voltages and coupled inductor currents) rather than a closed-form
+expression.  The system matrix is assembled once for all frequencies as a
+stacked (..., k, k) array and solved with a single call to la.solve, instead
+of building and solving one small matrix per frequency point.
+"""
+
+import numbers
+import numpy as np
+import numpy.linalg as la
+
+
+def _entry(e):
+    # Matrix entries may be arrays, plain numbers, or lmfit Parameter
+    # objects (when a param is used directly as an entry).  Parameters
+    # can't be assigned into an ndarray, so take their float value.
+    if isinstance(e, (np.ndarray, numbers.Number)):
+        return e
+    return float(e)
+
+
+def _common_shape(entries):
+    # Broadcast shape of all entries.  np.broadcast() is limited in the
+    # number of arguments, so accumulate the shape one entry at a time
+    # against a zero-copy placeholder.
+    shape = ()
+    for e in entries:
+        if np.ndim(e):
+            shape = np.broadcast(np.broadcast_to(False, shape), e).shape
+    return shape
+
+
+def stack_matrix(rows):
+    """
+    Assemble a stacked system matrix from a nested list of entries.
+    Entries may be scalars or arrays (typically functions of s = j*w), as
+    long as all arrays broadcast against each other.
+    :param rows: list of k rows, each a list of k entries
+    :return: complex array of shape (..., k, k) where ... is the broadcast
+             shape of the entries (eg (N,) for N frequencies)
+    """
+    rows = [[_entry(e) for e in row] for row in rows]
+    shape = _common_shape(e for row in rows for e in row)
+    A = np.empty(shape + (len(rows), len(rows[0])), dtype=complex)
+    for r, row in enumerate(rows):
+        for c, e in enumerate(row):
+            A[..., r, c] = e
+    return A
+
+
+def stack_vector(entries):
+    """
+    Assemble a stacked right hand side vector from a list of entries.
+    :param entries: list of k scalars or broadcastable arrays
+    :return: complex array of shape (..., k)
+    """
+    entries = [_entry(e) for e in entries]
+    shape = _common_shape(entries)
+    b = np.empty(shape + (len(entries),), dtype=complex)
+    for r, e in enumerate(entries):
+        b[..., r] = e
+    return b
+
+
+def stack_solve(A, b):
+    """
+    Solve A x = b for every matrix in a stack.
+    :param A: stacked system matrix, shape (..., k, k)
+    :param b: right hand side, either a list of k entries (see stack_vector)
+              or an array of shape (..., k).  A constant b is broadcast over
+              the whole stack.
+    :return: solution vectors, shape (..., k)
+    """
+    if not isinstance(b, np.ndarray):
+        b = stack_vector(b)
+    shape = np.broadcast(np.broadcast_to(False, A.shape[:-2]),
+                         np.broadcast_to(False, b.shape[:-1])).shape
+    A = np.broadcast_to(A, shape + A.shape[-2:])
+    b = np.broadcast_to(b, shape + b.shape[-1:])
+    # Solve with b as a stack of column vectors; la.solve() treats a
+    # stacked b of shape (..., k) ambiguously across numpy versions.
+    return la.solve(A, b[..., None])[..., 0]
+
+
+def _stack_solve_per_point(A, b):
+    # Reference implementation: one la.solve() call per frequency point,
+    # as the model scripts used to do.  Only used for benchmarking.
+    if not isinstance(b, np.ndarray):
+        b = stack_vector(b)
+    b = np.broadcast_to(b, A.shape[:-1])
+    return np.array([la.solve(_A, _b) for _A, _b in zip(A, b)])
+
+
+if __name__ == "__main__":
+    # Benchmark the stacked solution against the per-point loop, using the
+    # matrix models and the swept data they were written for.
+    import timeit
+    from importlib import import_module
+
+    data = np.loadtxt("TestDataFiles/MatrixSolnExptSwept.csv", delimiter=",", skiprows=1)
+    w = 2*np.pi*data[:, 0]
+    # Loads for CoupledFilter, which has no data file of its own
+    load = np.full(len(w), 50.0 + 0j)
+
+    for name in ("MatrixSolnExptModel", "CoupledFilter"):
+        model = import_module("Models." + name)
+        params = {p["name"]: p["init"] for p in model.PARAMS}
+        kws = {"load": load, "fsf": 1.0, "zsf": 1.0}
+
+        # Capture the stacked system the model solves, to time both solvers
+        # on identical input
+        captured = {}
+
+        def capture(A, b):
+            captured["A"], captured["b"] = A, b
+            return stack_solve(A, b)
+
+        model.stack_solve = capture
+        model.model(w, params, **kws)
+        model.stack_solve = stack_solve
+        A, b = captured["A"], captured["b"]
+        assert np.allclose(stack_solve(A, b), _stack_solve_per_point(A, b))
+
+        n = 20
+        t_model = timeit.timeit(lambda: model.model(w, params, **kws), number=n) / n
+        t_stack = timeit.timeit(lambda: stack_solve(A, b), number=n) / n
+        t_loop = timeit.timeit(lambda: _stack_solve_per_point(A, b), number=n) / n
+        print("{} ({} points, {}x{} system):".format(name, len(w), *A.shape[-2:]))
+        print("  model evaluation:      {:8.3f} ms".format(t_model * 1e3))
+        print("  stacked solve:         {:8.3f} ms".format(t_stack * 1e3))
+        print("  per-point solve loop:  {:8.3f} ms  ({:.1f}x slower)".format(
+            t_loop * 1e3, t_loop / t_stack))
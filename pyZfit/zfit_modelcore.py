@@ -1,9 +1,14 @@
+import os
 import numpy as np
-from importlib import import_module, reload
 from zfit_constants import *
-from lmfit import minimize, Parameters
+from lmfit import Parameters
 from scipy.stats import gmean   # geometric mean
 import csv
+from zfit_jacobian import residual_jacobian, JACOBIAN_METHODS, GRADIENT_METHODS
+from zfit_models import load_model, model_kws, model_label, source_hash
+from zfit_residual import ResidualEngine
+from zfit_store import FitStore, dataset_hash, signature
+from zfit_worker import FitWorker
 
 
 class CliInterface():
@@ -23,22 +28,26 @@ class DoModel:
             # Interface to the main program which instantiates this class
             self.amw = None
             self.ya = None
-            self.ya_list = None
             self.range = None
-            self.range_list = None
             self.print_results = None
             self.draw_formatted = None
+            self.render = None
             self.exc_handler = None
+            self._residuals = None
+            self._worker = None
+            self._fit_state = None
         else:
             # Interface to the main program which instantiates this class
             self.amw = CliInterface()
             self.ya = None
-            self.ya_list = None
             self.range = None
-            self.range_list = None
             self.print_results = None
             self.draw_formatted = None
+            self.render = None
             self.exc_handler = None
+            self._residuals = None
+            self._worker = None
+            self._fit_state = None
 
     # Local fitting functions ============================
 
@@ -46,6 +55,8 @@ class DoModel:
         """
         This is the function to minimize.  It is the difference between model
         and target (aka residuals) with modeling and penalty weights applied.
+        The work is done by the ResidualEngine set up for the current fit
+        (see _residual_engine), which holds the weighted target already.
         :param params:
         :param w: radian frequency array
         :param Z: complex impedances corresponding to frequencies w
@@ -53,61 +64,82 @@ class DoModel:
         :param **kwargs: keyword arguments
         :return: must return array for leastsq method, optional for others.
         """
-        if self.amw.checkBoxLogMag.isChecked():
-            diff = np.log10(
-                Z) - np.log10(self.model.model(w, params, **kwargs))
-        else:
-            diff = Z - self.model.model(w, params, **kwargs)
-        diff *= weight
-        # Flatten complex impedance into re/im adjacent floats
-        residuals = diff.view('double')
-        if LIMITS == "zfit":
-            # Get mean-square float of entire difference array for weight scaling
-            mean_sq = (residuals**2).mean()
-            # Append penalties to residuals
-            bounded = np.hstack(
-                (residuals, self._bound_penalties(params, mean_sq)))
-            return bounded
-        else:
-            return residuals
+        return self._residuals(params, w, **kwargs)
+
+    def _chisqr(self, values, w, z, weight, load):
+        # Chi-square of log impedance on the denormalized target, so that fits
+        # from different starting points are comparable
+        values_d = {param[0]: param[1] for param in values}
+        zfit = self.model.model(w, values_d, **model_kws(self.model, w, load))
+        return float((np.abs((np.log10(z) - np.log10(zfit)) * weight)**2).sum())
 
-    def _bound_penalties(self, params, weight):
+    def _warm_start(self, store, sig, w, z, weight, load):
         """
-        This function is only used when zfit_constants.LIMITS == 'zfit'.
-        Return a list of numbers each of which increases rapidly when the min or max for
-        a param is approached.  This represents boundary penalties as a parameter goes
-        out of bounds.
-        :param params:
-        :param weight:
-        :return: a list of N elements where N is the total number of min or max bounds
-        in the set of params.  Each element is a number which increases rapidly when
-        the min or max bound is approached.  Append penalty elements if params are out of bounds.
-         """
-        penalties = []
-        # Custom limiting is done here:
-        # This is an exponent which controls the abruptness of penalty increase as
-        # a min or max limit is approached:
-        PENALTY_WALL = 6
-        full_penalty = 1e4 * weight
-        for p in self.model.PARAMS:
-            name = p['name']
-            val = params[name].value
-            # max and min must be >0 or None.
-            # Use min/max limits from model.PARAMS here and set them to None
-            # for lmfit (except for diff evo method).
-            if p['max'] == None:
-                max_pen = 0
-            else:
-                max_pen = full_penalty if val >= p['max'] else \
-                    full_penalty * np.power(val/p['max'], PENALTY_WALL)
-            if p['min'] == None:
-                min_pen = 0
-            else:
-                min_pen = full_penalty if val <= p['min'] else \
-                    full_penalty * np.power(p['min']/val, PENALTY_WALL)
-            penalty = np.maximum(np.abs(max_pen), np.abs(min_pen))
-            penalties.append(penalty)
-        return penalties
+        Starting values from the stored fit of the current model whose data is
+        closest to this data, if they fit this data better than the PARAMS
+        init values.  Params which don't vary keep their init values.
+        :param store: FitStore
+        :param sig: signature of the data (see zfit_store.signature)
+        :return: dict of name: initial value, or None
+        """
+        names = [p["name"] for p in self.model.PARAMS]
+        values = store.closest(model_label(self.model), sig, names)
+        if values is None:
+            return None
+        init = [(p["name"], p["init"]) for p in self.model.PARAMS]
+        vary = {p["name"]: p["vary"] for p in self.model.PARAMS}
+        values = [(name, val if vary[name] else dict(init)[name]) for name, val in values]
+        if not self._chisqr(values, w, z, weight, load) < self._chisqr(init, w, z, weight, load):
+            return None
+        return dict(values)
+
+    def _residual_engine(self, Z, weight, log_mag):
+        """
+        Set up the residual engine used by _fcn2min for one fit.
+        :param Z: complex impedance target
+        :param weight: array of weights corresponding to Z
+        :param log_mag: True if residuals are differences of log10 impedance
+        """
+        # zfit limits are applied as penalties appended to the residuals
+        self._residuals = ResidualEngine(
+            self.model, Z, weight, log_mag,
+            self.model.PARAMS if LIMITS == "zfit" else None)
+
+    def _dfun(self, params, w, Z, weight, **kwargs):
+        """
+        Jacobian of the residuals from _fcn2min, for leastsq and least_squares.
+        Parameters are the same as for _fcn2min.
+        :return: array of shape (len(residuals), number of varying params)
+        """
+        # Runs on the fit's worker thread: take log_mag from the residual
+        # engine set up when the fit started, never from the window
+        return residual_jacobian(self.model, params, w, Z, weight,
+                                 self._residuals.log_mag, **kwargs)
+
+    def _gradient(self, params, w, Z, weight, **kwargs):
+        """
+        Gradient of the sum of squared residuals, for scalar minimizers.
+        Parameters are the same as for _fcn2min.
+        :return: array with one element per varying param
+        """
+        residuals = self._fcn2min(params, w, Z, weight, **kwargs)
+        return 2.0 * self._dfun(params, w, Z, weight, **kwargs).T.dot(residuals)
+
+    def _jacobian_kws(self, method):
+        """
+        Keyword args for minimize() that supply a Jacobian or gradient,
+        if the method can use one.  Not used with zfit limits, since the
+        penalty terms aren't differentiated.
+        :param method: lmfit method name
+        :return: dict of keyword args
+        """
+        if LIMITS == "zfit":
+            return {}
+        if method in JACOBIAN_METHODS:
+            return {"Dfun": self._dfun}
+        if method in GRADIENT_METHODS:
+            return {"jac": self._gradient}
+        return {}
 
     def _min_max_set(self, min_max, method, scaled_val):
         """
@@ -128,18 +160,19 @@ class DoModel:
             # lmfit gets spec'd limit
             return min_max
 
-    def _prog_bar_update(self, x1, x2, x3, *x4, **x5):
+    def _fit_progress(self, nfev, chisqr, rate):
         """
-        Update the progress bar in the main app.
-        (Could look for abort here too.)
-        :param xn: Dummy args to match actual sent by minimize() callback
+        Show progress of the fit running on the worker thread.
+        :param nfev: number of model evaluations so far
+        :param chisqr: chi-square of the latest evaluation
+        :param rate: model evaluations per second
         :return: nothing
         """
-        self.amw.prog_bar_tick += 1
-        if self.amw.prog_bar_tick >= 100:
-            self.amw.prog_bar_tick = 0
-            next = (self.amw.progressBar.value() + 1) % 100
-            self.amw.progressBar.setValue(next)
+        status = "Modeling... {} function calls, chi-square {:.6g}, {:.0f} calls/s".format(
+            nfev, chisqr, rate)
+        if self._worker is not None and self._worker.cancelled:
+            status = "Cancelling...<br>" + status
+        self.amw.labelStatus.setText(status)
 
     def _find_sf(self, model_list):
         """
@@ -229,36 +262,32 @@ class DoModel:
         return val * s
 
     def do_model(self):
+        if self._worker is not None:
+            # The Model button is the Cancel button while fitting
+            self._worker.cancel()
+            self.amw.labelStatus.setText("Cancelling...")
+            return
+
         # Clear status and params label boxes
         self.amw.labelParams.setText("")
         self.amw.labelParams.repaint()
         self.amw.labelStatus.setText("Modeling...")
         self.amw.labelStatus.repaint()
 
-        # Import the model script, or reload it if already imported
-        self.model = import_module("Models." + self.amw.lineEditModel.text())
-        self.model = reload(self.model)
+        # Get the model script, reloaded if its source has changed
+        self.model = load_model(self.amw.lineEditModel.text())
 
         # Clear any previous modeling, M and P axes
-        for line in self.ya.ax[M].get_lines() + self.ya.ax[P].get_lines():
-            if line.get_label() == "modeledZPlot":
-                line.remove()
-
-        # Create local concatenated arrays for freq, mag, phase, and load.
-        # Overwrites data in ya class
-        m = np.array([])
-        p = np.array([])
-        f = np.array([])
-        l = np.array([])
-        for y, r in zip(self.ya_list, self.range_list):
-            # Copy data from lists to working objects
-            self.ya.data_unbundle(y)
-            self.range.data_unbundle(r)
-            # Append data to form full set for modeling
-            m = np.append(m, self.ya.inputData[M])
-            p = np.append(p, np.radians(self.ya.inputData[P]))
-            f = np.append(f, self.range.xa["Hz"])
-            l = np.append(l, self.range.load_array)
+        for ix in (M, P):
+            self.render.hide_line(self.ya.ax[ix], "modeledZPlot")
+
+        # Freq, mag, phase, and load of all segments, from the dataset's
+        # concatenated arrays
+        ds = self.ya.dataset
+        m = ds.mag
+        p = np.radians(ds.pha)
+        f = ds.hz
+        l = ds.load
 
         # Radian frequency
         w = 2*np.pi*f
@@ -271,17 +300,22 @@ class DoModel:
             # Drawn data exists for phase, use it instead
             p = np.radians(self.ya.drawnData[P])
 
-        if len(self.ya_list) > 1:
-            # Multiple data segments.
-            # Create null weighting array, same size as m but full of 1's
-            weight = m.copy()
-            weight.fill(1.0)
+        if len(ds) > 1:
+            # Multiple data segments: the dataset's weights, all 1's
+            weight = ds.weight
         else:
             weight = self.ya.drawnData[W]
 
         # Complex impedance target
         z = m*np.exp(1j*p)
 
+        # Identify the data and model in the fit store
+        store = FitStore()
+        ds_hash = dataset_hash(f, m, p, l)
+        sig = signature(f, m)
+        label, model_hash = model_label(self.model), source_hash(self.model)
+        from_store = False
+
         # Instantiate clean class for lmfit fitter
         params = Parameters()
         params.clear()
@@ -293,18 +327,36 @@ class DoModel:
         method = METHODS[self.amw.comboBoxMethod.currentIndex()][1]
 
         if self.amw.checkBoxLocked.isChecked():
-            # Read last saved or edited params data (denormalized)
-            with open(PARAM_FILE, mode='r', encoding='utf-8', newline='') as f:
-                reader = csv.reader(f)
-                next(f)      # skip header line
-                for line in reader:
-                    v = (line[0], float(line[1]))
-                    # Build a list of name/value tuples
-                    values.append(v)
+            # Use the stored result for this data and model, unless the params
+            # file has been edited since
+            stored = store.lookup(ds_hash, label, model_hash)
+            if stored is not None and (not os.path.exists(PARAM_FILE) or
+                                       os.path.getmtime(PARAM_FILE) <= stored[1]):
+                values = stored[0]
+                from_store = True
+            else:
+                # Read last saved or edited params data (denormalized)
+                with open(PARAM_FILE, mode='r', encoding='utf-8', newline='') as f:
+                    reader = csv.reader(f)
+                    next(f)      # skip header line
+                    for line in reader:
+                        v = (line[0], float(line[1]))
+                        # Build a list of name/value tuples
+                        values.append(v)
+            store.close()
+            self._show_model(values, w, l)
+            self.amw.labelStatus.setText("From fit store" if from_store else "")
         else:
             # Do actual modeling.
-            # Make working copy of PARAMS list from model
-            param_list = list(self.model.PARAMS)
+            # Make working copy of PARAMS list from model, so the model's own
+            # dicts are left untouched (the module is kept between fits)
+            param_list = [dict(p) for p in self.model.PARAMS]
+
+            # Start from the closest previous fit of this model, if better
+            inits = self._warm_start(store, sig, w, z, weight, l)
+            if inits is not None:
+                for p in param_list:
+                    p["init"] = inits[p["name"]]
 
             # Adjust min and max if necessary
             for p in param_list:
@@ -336,37 +388,136 @@ class DoModel:
                 params.add(p["name"], value=p["init"],
                            vary=p["vary"], min=p["min"], max=p["max"])
 
-            # Perform weighted model optimization.
-            # Errors will be caught and displayed by zfit_excepthook() in main window.
-            kw_args = {"load": l, "fsf": fsf, "zsf": zsf}
-            result = minimize(self._fcn2min, params, args=(w, z, weight), kws=kw_args, method=method,
-                              iter_cb=self._prog_bar_update)
+            # Start weighted model optimization on a worker thread; _fit_done
+            # finishes up when it ends, and _fit_failed shows any error.
+            kw_args = model_kws(self.model, w, l, fsf, zsf)
+            self._residual_engine(z, weight, self.amw.checkBoxLogMag.isChecked())
+            self._fit_state = {"param_list": param_list, "fsf": fsf, "zsf": zsf,
+                               "w": w * fsf, "z": z * zsf, "l": l * zsf, "weight": weight,
+                               "method": method, "store": store, "ds_hash": ds_hash,
+                               "sig": sig, "label": label, "model_hash": model_hash}
+            self._worker = FitWorker(self._fcn2min, params, args=(w, z, weight), kws=kw_args,
+                                     method=method, fit_kws=self._jacobian_kws(method))
+            self._worker.progress.connect(self._fit_progress)
+            self._worker.finished.connect(self._fit_done)
+            self._worker.failed.connect(self._fit_failed)
+            self._set_fitting(True)
+            self._worker.start()
+
+    def _set_fitting(self, fitting):
+        """
+        Switch the main window between fitting (Model button cancels, inputs
+        which would change the data or model disabled) and idle.
+        :param fitting: True while a fit runs
+        :return: nothing
+        """
+        if fitting:
+            self.amw.pushButtonModel.setText("&Cancel")
+            self.amw.progressBar.setRange(0, 0)     # busy indicator
+            widgets = [self.amw.pushButtonDataFile, self.amw.pushButtonModelScript,
+                       self.amw.pushButtonNext, self.amw.comboBoxMethod,
+                       self.amw.checkBoxLocked, self.amw.checkBoxLogMag,
+                       self.amw.groupBoxDrawing,
+                       self.amw.groupBoxNormDenorm, self.amw.lineEditData]
+            self._disabled = [wdg for wdg in widgets if wdg.isEnabled()]
+            for wdg in self._disabled:
+                wdg.setEnabled(False)
+        else:
+            self.amw.pushButtonModel.setText("&Model")
+            self.amw.pushButtonModel.setShortcut("M")
+            self.amw.progressBar.setRange(0, 100)
+            self.amw.progressBar.setValue(0)
+            for wdg in self._disabled:
+                wdg.setEnabled(True)
+            self._disabled = []
+
+    def _end_fit(self):
+        # Stop the worker thread and return the window to idle
+        self._worker.stop()
+        self._worker = None
+        self._set_fitting(False)
+        state, self._fit_state = self._fit_state, None
+        return state
+
+    def _fit_failed(self, exc):
+        """
+        Show an exception raised by the fit on the worker thread.
+        :param exc: the exception
+        :return: nothing
+        """
+        import traceback
+        state = self._end_fit()
+        state["store"].close()
+        self.amw.labelStatus.setText("")
+        self.amw.exc_dialog(traceback.format_exception(type(exc), exc, exc.__traceback__))
 
-            # Don't use params class after minimize -- some values are scrambled or changed.
+    def _fit_done(self, result, last_values):
+        """
+        Finish a fit when the worker thread ends: denormalize, save and show
+        the result.  A cancelled fit's partial result is shown, not saved.
+        :param result: lmfit result, or None if aborted without one
+        :param last_values: dict of the last (normalized) param values tried
+        :return: nothing
+        """
+        cancelled, nfev = self._worker.cancelled, self._worker.nfev
+        state = self._end_fit()
+        fsf, zsf = state["fsf"], state["zsf"]
+        w, z, l, weight = state["w"], state["z"], state["l"], state["weight"]
 
-            # Populate values[] with modeling results, denormalized if necessary
-            for p in param_list:
-                name = p["name"]
-                val = result.params[name].value
-                if self.amw.do_norm_denorm:
-                    comp_type = name[0]
-                    val = self._denormalize(val, comp_type, fsf, zsf)
-                v = (name, val)
-                values.append(v)
+        # Don't use params class after minimize -- some values are scrambled or changed.
 
+        # Populate values[] with modeling results, denormalized if necessary
+        values = []
+        for p in state["param_list"]:
+            name = p["name"]
+            val = last_values[name] if result is None else result.params[name].value
             if self.amw.do_norm_denorm:
-                # Denormalize frequency, target Z, and load
-                w = w * fsf
-                z = z * zsf
-                l = l * zsf
+                comp_type = name[0]
+                val = self._denormalize(val, comp_type, fsf, zsf)
+            v = (name, val)
+            values.append(v)
 
+        store = state["store"]
+        if not cancelled:
             # Write denormalized modeling results to file
             with open(PARAM_FILE, mode='w', encoding='utf-8') as f:
                 print('name, value', file=f)
                 for p in values:
                     print('{}, {}'.format(p[0], p[1]), file=f)
-
-            self.amw.progressBar.setValue(0)
+            # and record them in the fit store (after the file, so that the
+            # stored result counts as newer)
+            store.save(state["ds_hash"], state["label"], values, state["model_hash"],
+                       state["method"], result.success, self._chisqr(values, w, z, weight, l),
+                       result.nfev, sig=state["sig"])
+        store.close()
+
+        self._show_model(values, w, l)
+
+        outstr = self.amw.labelParams.text()
+        if cancelled:
+            outstr += "<br>Partial result, not saved"
+        else:
+            # Append "written to" text to results box
+            outstr += "<br>Written to<br>" + PARAM_FILE
+        self.amw.labelParams.setText(outstr)
+        # Print optimization info
+        if result is not None:
+            nfev = result.nfev
+        status = "Number of function calls: " + str(nfev) + "<br>"
+        if cancelled or result.aborted:
+            status = RICH_TEXT_RED + "Process aborted:<br>" + status
+        #status += result.lmdif_message
+        self.amw.labelStatus.setText(status)
+
+    def _show_model(self, values, w, l):
+        """
+        Plot the model with the given param values and list the values.
+        :param values: list of (name, denormalized value) tuples
+        :param w: radian frequency array of all segments
+        :param l: load impedance array of all segments
+        :return: nothing
+        """
+        ds = self.ya.dataset
 
         # Convert list of tuples to a single dict for the model, to be compatible
         # with the way minimize() uses the model
@@ -374,49 +525,21 @@ class DoModel:
 
         # Get complex impedance of model using modeled or locked parameters
         # Use denormalized values
-        kw_args = {"load": l, "fsf": 1.0, "zsf": 1.0}
-        zfit = self.model.model(w, values_d, **kw_args)
-
-        # Break into magnitude and degree phase
-        magfit = np.abs(zfit)
-        phasefit = np.angle(zfit, deg=True)
-        # Split into segments as required, add to data list
-        a, b, i = 0, 0, 0
-        for y in self.ya_list:
-            self.ya.data_unbundle(y)
-            seg_length = len(self.ya.inputData[M])
-            b += seg_length
-            self.ya.modeledData[M] = magfit[a:b]
-            self.ya.modeledData[P] = phasefit[a:b]
-            a += seg_length
-            self.ya_list[i] = self.ya.data_bundle()
-            i += 1
-
-        # Refresh working classes with currently indexed segment data
-        self.ya.data_unbundle(self.ya_list[self.range.segment_index])
-        self.range.data_unbundle(self.range_list[self.range.segment_index])
-
-        # Add to plot
-        self.ya.ax[M].plot(self.range.xa["Hz"], self.ya.modeledData[M], self.ya.modeledLinePlot[M],
-                           ls=self.ya.modeledLineStyle[M], lw=1, label="modeledZPlot")
-        self.ya.ax[P].plot(self.range.xa["Hz"], self.ya.modeledData[P], self.ya.modeledLinePlot[P],
-                           ls=self.ya.modeledLineStyle[P], lw=1, label="modeledZPlot")
+        zfit = self.model.model(w, values_d, **model_kws(self.model, w, l))
+
+        # Break into magnitude and degree phase, held by the dataset
+        ds.set_modeled(np.abs(zfit), np.angle(zfit, deg=True))
+
+        # Refresh working classes with views of the displayed segment
+        self.ya.select_segment(self.range.segment_index)
+
+        # Add to plot, updating the persistent modeled lines
+        for ix in (M, P):
+            self.render.set_line(self.ya.ax[ix], "modeledZPlot", self.range.xa["Hz"],
+                                 self.ya.modeledData[ix], self.ya.modeledLinePlot[ix],
+                                 ls=self.ya.modeledLineStyle[ix], lw=1)
 
         # Update results text box
         self.print_results(values)
 
-        if self.amw.checkBoxLocked.isChecked():
-            self.amw.labelStatus.setText("")
-        else:
-            # Append "written to" text to results box
-            outstr = self.amw.labelParams.text()
-            outstr += "<br>Written to<br>" + PARAM_FILE
-            self.amw.labelParams.setText(outstr)
-            # Print optimization info
-            status = "Number of function calls: " + str(result.nfev) + "<br>"
-            if result.aborted:
-                status = RICH_TEXT_RED + "Process aborted:<br>"
-            #status += result.lmdif_message
-            self.amw.labelStatus.setText(status)
-
         self.draw_formatted()
@@ -1,8 +1,14 @@
 import numpy as np
-from importlib import import_module, reload
+from concurrent.futures import ProcessPoolExecutor
 
 from lmfit import minimize, Parameters, Minimizer, report_fit
 from scipy.stats import gmean   # geometric mean
+from zfit_jacobian import residual_jacobian, JACOBIAN_METHODS, GRADIENT_METHODS
+from zfit_models import load_model, model_kws, model_label, source_hash
+from zfit_store import FitStore, dataset_hash, signature
+from zfit_residual import ResidualEngine
+from zfit_decimate import log_decimate
+from zfit_shared import SegmentedModel, local_params
 # import csv
 # import pandas as pd
 
@@ -12,11 +18,10 @@ M, P, W = 0, 1, 2
 MAX_MODEL_WEIGHT = 100.0
 # Boolean for whether to allow negative param results
 ALLOW_NEG = True
-# File name for parameter save/restore
-PARAM_FILE = "params.csv"
-# List of fitting methods available to lmfit
-# (Dogleg and Newton CG are not included since they require a Jacobian
-# to be supplied)
+# List of fitting methods available to lmfit.
+# A Jacobian is supplied for leastsq, least_squares and the gradient methods
+# (see zfit_jacobian).  Dogleg and the trust-region methods also need a
+# Hessian, which is not supplied.
 METHODS = [
     ("Levenberg-Marquardt", "leastsq"),
     ("Least-Squares minimization, using Trust Region Reflective method", "least_squares"),
@@ -44,6 +49,8 @@ METHODS = [
 ]
 # Define one or the other:
 LIMITS = "lmfit"
+# Number of log-uniform points for the coarse stage of coarse-to-fine fits
+COARSE_POINTS = 200
 
 
 class DoModel:
@@ -56,13 +63,12 @@ class DoModel:
     def __init__(self):
         self.amw = None
         self.ya = None
-        self.ya_list = None
         self.range = None
-        self.range_list = None
         self.print_results = None
         self.draw_formatted = None
         self.exc_handler = None
         self.model = None
+        self._residuals = None
 
     # Local fitting functions ============================
 
@@ -70,6 +76,8 @@ class DoModel:
         """
         This is the function to minimize.  It is the difference between model
         and target (aka residuals) with modeling and penalty weights applied.
+        The work is done by the ResidualEngine set up for the current fit
+        (see _residual_engine), which holds the weighted target already.
         :param params:
         :param w: radian frequency array
         :param Z: complex impedances corresponding to frequencies w
@@ -77,60 +85,52 @@ class DoModel:
         :param **kwargs: keyword arguments
         :return: must return array for leastsq method, optional for others.
         """
-        if log_mag:
-            diff = np.log10(Z) - np.log10(self.model.model(w, params, **kwargs))
-        else:
-            diff = Z - self.model.model(w, params, **kwargs)
-        diff *= weight
-        # Flatten complex impedance into re/im adjacent floats
-        residuals = diff.view('double')
-        if LIMITS == "zfit":
-            # Get mean-square float of entire difference array for weight scaling
-            mean_sq = (residuals**2).mean()
-            # Append penalties to residuals
-            bounded = np.hstack(
-                (residuals, self._bound_penalties(params, mean_sq)))
-            return bounded
-        else:
-            return residuals
+        return self._residuals(params, w, **kwargs)
 
-    def _bound_penalties(self, params, weight):
+    def _residual_engine(self, Z, weight, log_mag):
         """
-        This function is only used when zfit_constants.LIMITS == 'zfit'.
-        Return a list of numbers each of which increases rapidly when the min or max for
-        a param is approached.  This represents boundary penalties as a parameter goes
-        out of bounds.
-        :param params:
-        :param weight:
-        :return: a list of N elements where N is the total number of min or max bounds
-        in the set of params.  Each element is a number which increases rapidly when
-        the min or max bound is approached.  Append penalty elements if params are out of bounds.
-         """
-        penalties = []
-        # Custom limiting is done here:
-        # This is an exponent which controls the abruptness of penalty increase as
-        # a min or max limit is approached:
-        PENALTY_WALL = 6
-        full_penalty = 1e4 * weight
-        for p in self.model.PARAMS:
-            name = p['name']
-            val = params[name].value
-            # max and min must be >0 or None.
-            # Use min/max limits from model.PARAMS here and set them to None
-            # for lmfit (except for diff evo method).
-            if p['max'] == None:
-                max_pen = 0
-            else:
-                max_pen = full_penalty if val >= p['max'] else \
-                    full_penalty * np.power(val/p['max'], PENALTY_WALL)
-            if p['min'] == None:
-                min_pen = 0
-            else:
-                min_pen = full_penalty if val <= p['min'] else \
-                    full_penalty * np.power(p['min']/val, PENALTY_WALL)
-            penalty = np.maximum(np.abs(max_pen), np.abs(min_pen))
-            penalties.append(penalty)
-        return penalties
+        Set up the residual engine used by _fcn2min for one fit.
+        :param Z: complex impedance target
+        :param weight: array of weights corresponding to Z
+        :param log_mag: True if residuals are differences of log10 impedance
+        """
+        # zfit limits are applied as penalties appended to the residuals
+        self._residuals = ResidualEngine(
+            self.model, Z, weight, log_mag,
+            self.model.PARAMS if LIMITS == "zfit" else None)
+
+    def _dfun(self, params, w, Z, weight, log_mag=True, **kwargs):
+        """
+        Jacobian of the residuals from _fcn2min, for leastsq and least_squares.
+        Parameters are the same as for _fcn2min.
+        :return: array of shape (len(residuals), number of varying params)
+        """
+        return residual_jacobian(self.model, params, w, Z, weight, log_mag, **kwargs)
+
+    def _gradient(self, params, w, Z, weight, log_mag=True, **kwargs):
+        """
+        Gradient of the sum of squared residuals, for scalar minimizers.
+        Parameters are the same as for _fcn2min.
+        :return: array with one element per varying param
+        """
+        residuals = self._fcn2min(params, w, Z, weight, log_mag, **kwargs)
+        return 2.0 * self._dfun(params, w, Z, weight, log_mag, **kwargs).T.dot(residuals)
+
+    def _jacobian_kws(self, method):
+        """
+        Keyword args for minimize() that supply a Jacobian or gradient,
+        if the method can use one.  Not used with zfit limits, since the
+        penalty terms aren't differentiated.
+        :param method: lmfit method name
+        :return: dict of keyword args
+        """
+        if LIMITS == "zfit":
+            return {}
+        if method in JACOBIAN_METHODS:
+            return {"Dfun": self._dfun}
+        if method in GRADIENT_METHODS:
+            return {"jac": self._gradient}
+        return {}
 
     def _min_max_set(self, min_max, method, scaled_val):
         """
@@ -238,30 +238,21 @@ class DoModel:
         s = scale.get(comp_type, 1.0)
         return val * s
 
-    def do_model_cli(self, range, ya, model, method_nr=0, do_norm_denorm=True):
-        # Clear status and params label boxes
-
-        # Import the model script, or reload it if already imported
-        self.model = model
-        self.model = reload(self.model)
-
-        # Append data to form full set for modeling
-        mag = np.array(ya.inputData[M])
-        phase = np.array(np.radians(ya.inputData[P]))
-        freq = np.array(range.xa["Hz"])
-        load = np.array(range.load_array)
-
-        # Radian frequency
-        w = 2*np.pi*freq
-
-        # Multiple data segments.
-        # Create null weighting array, same size as m but full of 1's
-        weight = mag.copy()
-        weight.fill(1.0)
-
-        # Complex impedance target
-        z = mag*np.exp(1j*phase)
-
+    def _fit(self, w, z, weight, load, method, do_norm_denorm=True, inits=None,
+             max_nfev=None, iter_cb=None):
+        """
+        Run one optimization of the current model against a target.
+        :param w: radian frequency array
+        :param z: complex impedance target
+        :param weight: array of weights corresponding to frequencies w
+        :param load: array of load impedances corresponding to frequencies w
+        :param method: lmfit method name
+        :param do_norm_denorm: normalize params, frequency and impedance for the fit
+        :param inits: optional dict of name: initial value, overriding PARAMS
+        :param max_nfev: optional limit on model evaluations
+        :param iter_cb: optional lmfit iteration callback; returning True aborts the fit
+        :return: tuple (list of (name, denormalized value) tuples, lmfit result)
+        """
         # Instantiate clean class for lmfit fitter
         params = Parameters()
         params.clear()
@@ -269,102 +260,181 @@ class DoModel:
         # Init list of name/value tuples
         values = []
 
-        # Get selected fitting method
-        method = METHODS[method_nr][1]
-
-        # Do actual modeling.
-        # Make working copy of PARAMS list from model
-        param_list = list(self.model.PARAMS)
+        # Make working copy of PARAMS list from model, so the model's own
+        # dicts are left untouched
+        param_list = [dict(p) for p in self.model.PARAMS]
+        if inits is not None:
+            for p in param_list:
+                p["init"] = inits.get(p["name"], p["init"])
 
         # Adjust min and max if necessary
-        for phase in param_list:
-            phase["min"] = self._min_max_set(
-                phase["min"], method, phase["init"] / 1e2)
-            phase["max"] = self._min_max_set(
-                phase["max"], method, phase["init"] * 1e2)
+        for p in param_list:
+            p["min"] = self._min_max_set(p["min"], method, p["init"] / 1e2)
+            p["max"] = self._min_max_set(p["max"], method, p["init"] * 1e2)
 
         if do_norm_denorm:
             # Normalize component, frequency, and impedance values
             # Determine frequency and Z scaling factors from initial values
             fsf, zsf = self._find_sf(param_list)
             # Normalize each component value, min, and max
-            for phase in param_list:
-                type = phase["name"][0].upper()
+            for p in param_list:
+                type = p["name"][0].upper()
                 norm = self._normalize(
-                    phase["init"], phase["min"], phase["max"], type, fsf, zsf)
-                phase["init"] = norm["init"]
-                phase["min"] = norm["min"]
-                phase["max"] = norm["max"]
-            # Normalize frequency, target Z, and load
+                    p["init"], p["min"], p["max"], type, fsf, zsf)
+                p["init"] = norm["init"]
+                p["min"] = norm["min"]
+                p["max"] = norm["max"]
+            # Normalize frequency, target Z, and load, as the GUI does
             w = w / fsf
             z = z / zsf
-            # TODO: check what does gui in case of None
-            #load = load / zsf
+            load = load / zsf
         else:
             fsf, zsf = 1.0, 1.0
 
         # Add modified params to lmfit Parameter class
         # .add converts min/max of None to -/+inf
-        for phase in param_list:
-            params.add(phase["name"], value=phase["init"],
-                       vary=phase["vary"], min=phase["min"], max=phase["max"])
+        for p in param_list:
+            params.add(p["name"], value=p["init"],
+                       vary=p["vary"], min=p["min"], max=p["max"])
 
         # Perform weighted model optimization.
-        # Errors will be caught and displayed by zfit_excepthook() in main window.
-        kw_args = {"load": load, "fsf": fsf, "zsf": zsf}
+        kw_args = model_kws(self.model, w, load, fsf, zsf)
+        self._residual_engine(z, weight, True)
         result = minimize(self._fcn2min, params, args=(
-            w, z, weight), kws=kw_args, method=method)
+            w, z, weight), kws=kw_args, method=method, max_nfev=max_nfev, iter_cb=iter_cb,
+            **self._jacobian_kws(method))
 
         # Don't use params class after minimize -- some values are scrambled or changed.
 
         # Populate values[] with modeling results, denormalized if necessary
-        for phase in param_list:
-            name = phase["name"]
+        for p in param_list:
+            name = p["name"]
             val = result.params[name].value
             if do_norm_denorm:
                 comp_type = name[0]
                 val = self._denormalize(val, comp_type, fsf, zsf)
-            v = (name, val)
-            values.append(v)
+            values.append((name, val))
 
-        if do_norm_denorm:
-            # Denormalize frequency, target Z, and load
-            w = w * fsf
-            z = z * zsf
-            # TODO: check what does gui in case of None
-            #load = load * zsf
-
-        # Write denormalized modeling results to file
-        with open(PARAM_FILE, mode='w', encoding='utf-8') as f:
-            print('name, value', file=f)
-            for param in values:
-                print('{}, {}'.format(param[0], param[1]), file=f)
-                print('{}, {}'.format(param[0], param[1]))
-
-
-        # Convert list of tuples to a single dict for the model, to be compatible
-        # with the way minimize() uses the model
+        return values, result
+
+    def _fit_coarse_to_fine(self, w, z, weight, load, method, do_norm_denorm=True, inits=None,
+                            coarse_points=COARSE_POINTS, offsets=None, max_nfev=None,
+                            iter_cb=None):
+        """
+        Fit on a log-uniform subset of the points (plus points around
+        resonances) first, then refine on all points starting from the coarse
+        result.  Parameters are the same as for _fit, and:
+        :param coarse_points: number of log-uniform points for the coarse fit
+        :param offsets: optional segment start offsets, so that each segment is
+                        decimated separately
+        :return: tuple (list of (name, value) tuples, lmfit result of the full
+                 fit, lmfit result of the coarse fit or None if there are too
+                 few points for a coarse fit to pay off)
+        """
+        idx = log_decimate(w, coarse_points, np.abs(z), np.angle(z, deg=True), offsets)
+        if len(idx) > len(w) // 2:
+            values, result = self._fit(w, z, weight, load, method, do_norm_denorm, inits,
+                                       max_nfev, iter_cb)
+            return values, result, None
+        coarse_load = load[idx] if np.ndim(load) else load
+        values, coarse = self._fit(w[idx], z[idx], np.asarray(weight)[idx], coarse_load, method,
+                                   do_norm_denorm, inits, max_nfev, iter_cb)
+        # Refine from the coarse result, unless it is worse on the full data than
+        # the starting point (the coarse fit went to a different local minimum)
+        start = [(p["name"], (inits or {}).get(p["name"], p["init"])) for p in self.model.PARAMS]
+        if self._chisqr(values, w, z, weight, load) > self._chisqr(start, w, z, weight, load):
+            values = start
+        values, result = self._fit(w, z, weight, load, method, do_norm_denorm, dict(values),
+                                   max_nfev, iter_cb)
+        return values, result, coarse
+
+    def _warm_start(self, store, sig, w, z, weight, load):
+        """
+        Starting values from the stored fit of the current model whose data is
+        closest to this data, if they fit this data better than the PARAMS
+        init values.  Params which don't vary keep their init values.
+        :param store: FitStore
+        :param sig: signature of the data (see zfit_store.signature)
+        :return: dict of name: initial value, or None
+        """
+        names = [p["name"] for p in self.model.PARAMS]
+        values = store.closest(model_label(self.model), sig, names)
+        if values is None:
+            return None
+        init = [(p["name"], p["init"]) for p in self.model.PARAMS]
+        vary = {p["name"]: p["vary"] for p in self.model.PARAMS}
+        values = [(name, val if vary[name] else dict(init)[name]) for name, val in values]
+        if not self._chisqr(values, w, z, weight, load) < self._chisqr(init, w, z, weight, load):
+            return None
+        return dict(values)
+
+    def _chisqr(self, values, w, z, weight, load):
+        # Chi-square of log impedance on the denormalized target, so that fits
+        # with different starting points (and scale factors) are comparable
         values_d = {param[0]: param[1] for param in values}
+        zfit = self.model.model(w, values_d, **model_kws(self.model, w, load))
+        return float((np.abs((np.log10(z) - np.log10(zfit)) * weight)**2).sum())
 
-        # Get complex impedance of model using modeled or locked parameters
-        # Use denormalized values
-        kw_args = {"load": load, "fsf": 1.0, "zsf": 1.0}
-        zfit = self.model.model(w, values_d, **kw_args)
+    def _cli_data(self, range, ya):
+        # Fitting arrays from the range and y axes classes: radian frequency,
+        # complex impedance target, weight, and load
+        mag = np.array(ya.inputData[M])
+        phase = np.array(np.radians(ya.inputData[P]))
+        freq = np.array(range.xa["Hz"])
+        load = np.array(range.load_array)
+        # Radian frequency
+        w = 2*np.pi*freq
+        # Create null weighting array, same size as mag but full of 1's
+        weight = np.ones_like(mag)
+        # Complex impedance target
+        z = mag*np.exp(1j*phase)
+        return w, z, weight, load
 
-        # Break into magnitude and degree phase
-        magfit = np.abs(zfit)
-        phasefit = np.angle(zfit, deg=True)
+    def _set_modeled(self, ya, w, load, values):
+        # Get complex impedance of model using modeled parameters, store it
+        # in ya as magnitude and degree phase
+        values_d = {param[0]: param[1] for param in values}
+        zfit = self.model.model(w, values_d, **model_kws(self.model, w, load))
+        ya.modeledData[M] = np.abs(zfit)
+        ya.modeledData[P] = np.angle(zfit, deg=True)
+        self.ya = ya
 
-        # TODO: understand why a, b, i are 0!!!
-        # # Split into segments as required, add to data list
-        # a, b, i = 0, 0, 0
-        # ya.modeledData[M] = magfit[a:b]
-        # ya.modeledData[P] = phasefit[a:b]
+    def do_model_cli(self, range, ya, model, method_nr=0, do_norm_denorm=True,
+                     coarse_points=None, use_store=True, dataset=""):
+        # Get the model script, reloaded if its source has changed
+        self.model = load_model(model)
 
-        ya.modeledData[M] = magfit
-        ya.modeledData[P] = phasefit
+        w, z, weight, load = self._cli_data(range, ya)
 
-        self.ya = ya
+        # Get selected fitting method
+        method = METHODS[method_nr][1]
+
+        # Start from the closest stored fit of this model, if any
+        store = FitStore() if use_store else None
+        inits = None
+        if store is not None:
+            sig = signature(range.xa["Hz"], ya.inputData[M])
+            inits = self._warm_start(store, sig, w, z, weight, load)
+
+        # Do actual modeling, coarse to fine if asked for.
+        # Errors are raised to the caller.
+        if coarse_points:
+            values, result, _ = self._fit_coarse_to_fine(w, z, weight, load, method, do_norm_denorm,
+                                                         inits, coarse_points=coarse_points)
+        else:
+            values, result = self._fit(w, z, weight, load, method, do_norm_denorm, inits)
+
+        # Record denormalized modeling results in the fit store
+        for param in values:
+            print('{}, {}'.format(param[0], param[1]))
+        if store is not None:
+            store.save(dataset_hash(range.xa["Hz"], ya.inputData[M], ya.inputData[P], load),
+                       model_label(self.model), values, source_hash(self.model), method,
+                       result.success, self._chisqr(values, w, z, weight, load), result.nfev,
+                       dataset, sig)
+            store.close()
+
+        self._set_modeled(ya, w, load, values)
 
         status = "Number of function calls: " + str(result.nfev)
         if result.aborted:
@@ -373,6 +443,142 @@ class DoModel:
         print(status)
         report_fit(result)
 
+    def do_model_arrays(self, model, hz, mag, pha, load, method_nr=0, do_norm_denorm=True,
+                        max_nfev=None, iter_cb=None, coarse_points=None, offsets=None,
+                        store=None, dataset="", local=None):
+        """
+        Fit a model to plain data arrays, without writing the params file.
+        With several segments and local params, the segments are fitted
+        jointly with one copy of each local param per segment (see zfit_shared).
+        :param model: imported model script module
+        :param hz: frequency array
+        :param mag: impedance magnitude array
+        :param pha: impedance phase array, degrees
+        :param load: complex load impedance array
+        :param method_nr: index into METHODS
+        :param do_norm_denorm: normalize params, frequency and impedance for the fit
+        :param max_nfev: optional limit on model evaluations
+        :param iter_cb: optional lmfit iteration callback; returning True aborts the fit
+        :param coarse_points: fit coarse to fine, with this many points for the
+                              coarse fit (see _fit_coarse_to_fine)
+        :param offsets: optional segment start offsets, for coarse fits and local params
+        :param store: optional FitStore to warm start from and record the fit in
+        :param dataset: data file name recorded with the fit
+        :param local: list of per-segment param names (default: those marked
+                      "local" in PARAMS).  Joint fits aren't done coarse to fine.
+        :return: tuple (list of (name, value) tuples, lmfit result, chi-square)
+        """
+        self.model = model
+        if offsets is not None and len(offsets) > 2:
+            if local_params(model) if local is None else local:
+                self.model = SegmentedModel(model, offsets, local)
+                coarse_points = None
+        w = 2*np.pi*np.asarray(hz)
+        z = np.asarray(mag)*np.exp(1j*np.radians(pha))
+        weight = np.ones_like(w)
+        method = METHODS[method_nr][1]
+        inits = None
+        if store is not None:
+            sig = signature(hz, mag)
+            inits = self._warm_start(store, sig, w, z, weight, load)
+        if coarse_points:
+            values, result, _ = self._fit_coarse_to_fine(
+                w, z, weight, load, method, do_norm_denorm, inits, coarse_points=coarse_points,
+                offsets=offsets, max_nfev=max_nfev, iter_cb=iter_cb)
+        else:
+            values, result = self._fit(w, z, weight, load, method, do_norm_denorm, inits,
+                                       max_nfev=max_nfev, iter_cb=iter_cb)
+        chisqr = self._chisqr(values, w, z, weight, load)
+        if store is not None:
+            store.save(dataset_hash(hz, mag, pha, load), model_label(self.model), values,
+                       source_hash(self.model), method, result.success, chisqr, result.nfev,
+                       dataset, sig)
+        return values, result, chisqr
+
+    def do_model_multistart(self, range, ya, model, n_starts=8, seed=0, method_nr=0,
+                            do_norm_denorm=True, processes=None):
+        """
+        Fit from several starting points in parallel and keep the best.
+        Starting points are a Latin hypercube in log space between each varying
+        param's min and max (init/100 to init*100 where a bound is missing).
+        The first start is always the PARAMS init values.
+        :param range: Range with frequency and load data
+        :param ya: YAxes with magnitude and phase data
+        :param model: imported model script module
+        :param n_starts: number of starting points
+        :param seed: random seed for the starting points, for repeatable runs
+        :param method_nr: index into METHODS
+        :param do_norm_denorm: normalize params, frequency and impedance for the fit
+        :param processes: number of worker processes (default: one per core)
+        :return: tuple (best fit, list of all fits ranked by chi-square).  Each fit
+                 is a dict with keys "start", "init", "values", "chisqr", "nfev",
+                 "success" and "message".
+        """
+        self.model = load_model(model)
+        w, z, weight, load = self._cli_data(range, ya)
+        method = METHODS[method_nr][1]
+        starts = latin_hypercube_starts(self.model.PARAMS, n_starts, seed)
+        jobs = [(self.model.__name__, w, z, weight, load, method, do_norm_denorm, i, inits)
+                for i, inits in enumerate(starts)]
+        with ProcessPoolExecutor(max_workers=processes) as pool:
+            fits = list(pool.map(_multistart_worker, jobs))
+
+        # Failed fits (nan chi-square) rank last
+        fits.sort(key=lambda fit: (not np.isfinite(fit["chisqr"]), fit["chisqr"]))
+        best = fits[0]
+        self._set_modeled(ya, w, load, best["values"])
+
+        print("Best of {} starts: start {}, chi-square {:.6g}".format(
+            len(fits), best["start"], best["chisqr"]))
+        for param in best["values"]:
+            print('{}, {}'.format(param[0], param[1]))
+        return best, fits
+
+
+def latin_hypercube_starts(param_list, n_starts, seed=0):
+    """
+    Starting points for multi-start fitting: a Latin hypercube in log space
+    over each varying param's range.  Params which don't vary keep their init.
+    :param param_list: PARAMS list from model script
+    :param n_starts: number of starting points, including the PARAMS init values
+    :param seed: random seed
+    :return: list of n_starts dicts of name: initial value
+    """
+    rng = np.random.RandomState(seed)
+    starts = [{p["name"]: p["init"] for p in param_list} for _ in range(n_starts)]
+    n = n_starts - 1
+    if n <= 0:
+        return starts
+    for p in param_list:
+        if not p["vary"]:
+            continue
+        # Log space needs positive bounds; fall back to init/100 and init*100
+        lo = p["min"] if p["min"] is not None and p["min"] > 0 else p["init"] / 1e2
+        hi = p["max"] if p["max"] is not None and p["max"] > 0 else p["init"] * 1e2
+        lo, hi = np.log10(lo), np.log10(hi)
+        # One sample in each of n equal strata, strata shuffled per param
+        u = (rng.permutation(n) + rng.uniform(size=n)) / n
+        for start, x in zip(starts[1:], lo + u * (hi - lo)):
+            start[p["name"]] = 10.0 ** x
+    return starts
+
+
+def _multistart_worker(job):
+    # Run one fit of a multi-start set in a worker process
+    model_name, w, z, weight, load, method, do_norm_denorm, start, inits = job
+    dm = DoModel()
+    dm.model = load_model(model_name)
+    fit = {"start": start, "init": inits}
+    try:
+        values, result = dm._fit(w, z, weight, load, method, do_norm_denorm, inits)
+        chisqr = dm._chisqr(values, w, z, weight, load)
+        fit.update(values=values, chisqr=chisqr if np.isfinite(chisqr) else np.nan,
+                   nfev=result.nfev, success=result.success, message=result.message)
+    except Exception as e:
+        fit.update(values=[(p["name"], inits[p["name"]]) for p in dm.model.PARAMS],
+                   chisqr=np.nan, nfev=0, success=False, message=repr(e))
+    return fit
+
 
 class Range:
     """
@@ -384,6 +590,18 @@ class Range:
         self.load_array = None
         self.segment_str = ""
         self.segment_index = 0
+        # SegmentedDataset of all segments, shared with the YAxes class
+        self.dataset = None
+
+    def select_segment(self, i):
+        # Point the frequency and load arrays at views of segment i of
+        # the dataset
+        ds = self.dataset
+        s = ds.segment_slice(i)
+        self.xa = {"Hz": ds.hz[s], "omega": 2.0*np.pi*ds.hz[s]}
+        self.load_array = ds.load[s]
+        self.segment_str = ds.segment_strs[i]
+        self.segment_index = i
 
 
 class YAxes:
@@ -402,6 +620,19 @@ class YAxes:
         self.inputData = [None, None]   # mag, pha
         self.modeledData = [None, None]  # mag, pha
         self.drawnData = [None, None, None]     # drawn mag, pha, weight curves
+        # SegmentedDataset of all segments, shared with the Range class
+        self.dataset = None
+
+    def select_segment(self, i):
+        # Point the input and modeled data at views of segment i of the
+        # dataset.  No data is copied.
+        ds = self.dataset
+        s = ds.segment_slice(i)
+        self.inputData = [ds.mag[s], ds.pha[s]]
+        if ds.model_mag is None:
+            self.modeledData = [None, None]
+        else:
+            self.modeledData = [ds.model_mag[s], ds.model_pha[s]]
 
 
 if __name__ == "__main__":
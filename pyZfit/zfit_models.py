@@ -0,0 +1,114 @@
+"""
+Registry of loaded model scripts.
+
+Model modules are imported once and kept.  A module is only reloaded when its
+source file has changed: the file's mtime and size are checked on every
+request, and its contents hash when those differ.  This way a model edited
+between fits is picked up, without re-executing unchanged scripts for every
+fit of a batch.
+
+A model script may also define
+    prepare(w, load)
+returning a dict of arrays that depend only on the dataset (eg j*w or
+np.sqrt(w)).  It is called once per fit and passed to model() as the "prep"
+keyword arg, so these aren't recomputed on every residual evaluation.
+"""
+
+import hashlib
+import importlib
+import importlib.util
+import os
+
+MODELS_PACKAGE = "Models"
+
+# Module name: (module, (mtime_ns, size), sha1 digest of source)
+_registry = {}
+
+
+def module_name(model):
+    """
+    Importable module name for a model script.
+    :param model: script name ("ls(cpr)"), path ("Models/ls(cpr).py") or
+                  module name ("Models.ls(cpr)")
+    :return: module name, eg "Models.ls(cpr)"
+    """
+    if model.startswith(MODELS_PACKAGE + "."):
+        return model
+    return MODELS_PACKAGE + "." + os.path.splitext(os.path.basename(model))[0]
+
+
+def _stamp(file):
+    st = os.stat(file)
+    return st.st_mtime_ns, st.st_size
+
+
+def _digest(file):
+    with open(file, "rb") as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+
+def load_model(model):
+    """
+    Return a model module, importing it on first use and reloading it only
+    if its source has changed since.
+    :param model: script name, path, module name, or an imported model module
+    :return: model module
+    """
+    name = module_name(getattr(model, "__name__", model))
+    entry = _registry.get(name)
+    if entry is None:
+        module = importlib.import_module(name)
+        _registry[name] = (module, _stamp(module.__file__), _digest(module.__file__))
+        return module
+
+    module, stamp, digest = entry
+    new_stamp = _stamp(module.__file__)
+    if new_stamp != stamp:
+        new_digest = _digest(module.__file__)
+        if new_digest != digest:
+            # The cached bytecode is only checked against whole-second mtime
+            # and size, so an edit within the same second could be missed
+            try:
+                os.remove(importlib.util.cache_from_source(module.__file__))
+            except OSError:
+                pass
+            module = importlib.reload(module)
+        _registry[name] = (module, new_stamp, new_digest)
+    return module
+
+
+def model_label(model):
+    """
+    :param model: model module
+    :return: model script name, eg "ls(cpr)"
+    """
+    return model.__name__.split(".", 1)[-1]
+
+
+def source_hash(model):
+    """
+    Hash of a model module's source, as last loaded.
+    :param model: model module
+    :return: hex digest string
+    """
+    entry = _registry.get(model.__name__)
+    if entry is not None and entry[0] is model:
+        return entry[2]
+    return _digest(model.__file__)
+
+
+def model_kws(model, w, load, fsf=1.0, zsf=1.0):
+    """
+    Keyword args for model(), including the model's prepare() results for
+    this dataset if it defines prepare().
+    :param model: model module
+    :param w: radian frequency array, as passed to model()
+    :param load: load impedance array
+    :param fsf: frequency scale factor
+    :param zsf: impedance scale factor
+    :return: dict of keyword args
+    """
+    kws = {"load": load, "fsf": fsf, "zsf": zsf}
+    if hasattr(model, "prepare"):
+        kws["prep"] = model.prepare(w, load)
+    return kws
@@ -0,0 +1,629 @@
+"""
+Netlist-to-model compiler.  Reads an LTspice schematic (.asc) or a SPICE
+netlist (.net, .cir, .sp) and writes a model script with the usual PARAMS list
+and model(w, params, **kws) function, so circuits drawn in LTspice can be
+fitted without writing the impedance equations by hand.
+
+The generated model evaluates the circuit by nodal analysis (with branch
+currents for coupled inductors) for all frequencies at once, using the stacked
+solver in zfit_matrix.
+
+Conventions:
+> The first voltage or current source defines the port.  Its value is ignored;
+  the model returns the impedance seen by the source.  A port can also be named
+  explicitly, eg for a subcircuit with no source.
+> Node "0" is ground.  Without a ground, the port's negative node is used.
+> Values in braces are expressions.  Every .param with a numeric value, and
+  every component with a plain numeric value (named after the component), becomes
+  a fitting parameter.  .params defined by an expression are computed from the
+  others.  The name "load" refers to the segment load impedance kws['load'].
+> Rser=... on inductors and capacitors adds a series resistance.  Unlike
+  LTspice, a missing Rser means zero, not 1 mOhm.
+
+Usage:
+    python zfit_netlist.py Models/csrsl.asc -o Models/csrsl_net.py
+"""
+
+import os
+import re
+
+# Version tag written into generated scripts
+COMPILER_VERSION = 1
+
+# SPICE scale suffixes, longest first so that "meg" wins over "m"
+_SUFFIXES = [("meg", 1e6), ("mil", 25.4e-6), ("f", 1e-15), ("p", 1e-12), ("n", 1e-9),
+             ("u", 1e-6), ("m", 1e-3), ("k", 1e3), ("g", 1e9), ("t", 1e12)]
+_NUMBER = re.compile(r"^([+-]?(?:\d+\.?\d*|\.\d+)(?:e[+-]?\d+)?)([a-z]*)$", re.IGNORECASE)
+_TOKEN = re.compile(r"(?P<num>(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?[a-zA-Z]*)|"
+                    r"(?P<name>[A-Za-z_]\w*)|(?P<other>\*\*|\S)")
+# Functions allowed in value expressions, and their numpy equivalents
+_FUNCTIONS = {"sqrt": "np.sqrt", "exp": "np.exp", "log": "np.log", "ln": "np.log",
+              "log10": "np.log10", "abs": "np.abs", "pi": "np.pi"}
+
+# LTspice symbol pin offsets (x, y) in SpiceOrder, for rotation R0
+_SYMBOL_PINS = {
+    "res": [(16, 16), (16, 96)],
+    "res2": [(16, 16), (16, 96)],
+    "cap": [(16, 0), (16, 64)],
+    "polcap": [(16, 0), (16, 64)],
+    "ind": [(16, 16), (16, 96)],
+    "ind2": [(16, 16), (16, 96)],
+    "voltage": [(0, 16), (0, 96)],
+    "current": [(0, 0), (0, 80)],
+}
+# Element type letter for each symbol
+_SYMBOL_TYPES = {"res": "R", "res2": "R", "cap": "C", "polcap": "C", "ind": "L", "ind2": "L",
+                 "voltage": "V", "current": "I"}
+
+
+def spice_number(text):
+    """
+    Convert a SPICE number with optional scale suffix and units to float,
+    eg "1k" -> 1e3, "120u" -> 120e-6, "4.7megohm" -> 4.7e6.
+    :param text: number string
+    :return: float, or None if text is not a number
+    """
+    match = _NUMBER.match(text.strip().replace("µ", "u"))
+    if match is None:
+        return None
+    value = float(match.group(1))
+    suffix = match.group(2).lower()
+    for s, scale in _SUFFIXES:
+        if suffix.startswith(s):
+            return value * scale
+    return value
+
+
+def _translate(expr):
+    """
+    Translate a SPICE value expression to Python.
+    :param expr: expression string, with or without braces
+    :return: tuple (python expression string, list of identifiers used)
+    """
+    expr = expr.strip()
+    if expr.startswith("{") and expr.endswith("}"):
+        expr = expr[1:-1]
+    out, names = [], {}
+    for m in _TOKEN.finditer(expr.replace("µ", "u")):
+        if m.group("num"):
+            value = spice_number(m.group("num"))
+            if value is None:
+                raise ValueError("Bad number '{}' in '{}'".format(m.group("num"), expr))
+            out.append(repr(value))
+        elif m.group("name"):
+            name = m.group("name")
+            if name.lower() in _FUNCTIONS:
+                out.append(_FUNCTIONS[name.lower()])
+            else:
+                out.append(name)
+                names[name] = None
+        else:
+            out.append("**" if m.group("other") == "^" else m.group("other"))
+    return "".join(out), list(names)
+
+
+class Element:
+    """
+    One two-terminal circuit element.  kind is "R", "C", "L", "V" or "I".
+    """
+    def __init__(self, kind, name, nodes, value, rser=None):
+        self.kind = kind
+        self.name = name
+        self.nodes = nodes
+        self.value = value
+        self.rser = rser
+
+
+class Circuit:
+    """
+    Parsed circuit: elements, inductor couplings, .param definitions, and
+    the port node pair.
+    """
+    def __init__(self, title=""):
+        self.title = title
+        self.elements = []
+        # List of (name, inductor 1, inductor 2, coupling expression)
+        self.couplings = []
+        # .param name -> expression string, in definition order
+        self.params = {}
+        self.port = None
+
+    def add_params(self, text):
+        # Parse "a=1 b={x*2}" from a .param line
+        for name, value in re.findall(r"(\w+)\s*=\s*(\{[^}]*\}|\S+)", text):
+            self.params[name] = value
+
+    def find_port(self):
+        # Port is the first source, with its value ignored
+        if self.port is None:
+            for e in self.elements:
+                if e.kind in ("V", "I"):
+                    self.port = tuple(e.nodes)
+                    break
+        if self.port is None:
+            raise ValueError("No source in netlist, and no port given")
+        return self.port
+
+
+# NETLIST PARSERS ==========================================================================
+
+def parse_spice(text, title=""):
+    """
+    Parse a SPICE netlist.
+    :param text: netlist text
+    :param title: circuit title (default from a leading '*' comment)
+    :return: Circuit
+    """
+    lines = []
+    for line in text.splitlines():
+        if line.startswith("+") and lines:
+            lines[-1] += " " + line[1:]
+        else:
+            lines.append(line)
+    circuit = Circuit(title)
+    for line in lines:
+        line = line.split(";")[0].strip()
+        if not line:
+            continue
+        if line.startswith("*"):
+            if not circuit.title:
+                circuit.title = line[1:].strip()
+            continue
+        fields = line.split()
+        key = fields[0].lower()
+        if key == ".end":
+            break
+        if key == ".param":
+            circuit.add_params(line[len(fields[0]):])
+        elif key.startswith("."):
+            continue
+        elif key[0] in "rclvi":
+            value = fields[3] if len(fields) > 3 else "0"
+            opts = dict(re.findall(r"(\w+)\s*=\s*(\{[^}]*\}|\S+)", " ".join(fields[3:])))
+            rser = {k.lower(): v for k, v in opts.items()}.get("rser")
+            if key[0] in "vi" or "=" in value:
+                value = "0"
+            circuit.elements.append(Element(key[0].upper(), fields[0], fields[1:3], value, rser))
+        elif key[0] == "k":
+            circuit.couplings.append((fields[0], fields[1], fields[2], fields[3]))
+        else:
+            # Controlled sources, subcircuits, semiconductors, ...
+            raise ValueError("Unsupported element '{}'".format(fields[0]))
+    return circuit
+
+
+def _transform(x, y, orient):
+    # Apply an LTspice symbol orientation (R0..R270, M0..M270) to a pin offset.
+    # Mirrored orientations are the rotation followed by negating x.
+    rot = {"0": (x, y), "90": (-y, x), "180": (-x, -y), "270": (y, -x)}[orient[1:]]
+    if orient[0] == "M":
+        rot = (-rot[0], rot[1])
+    return rot
+
+
+def parse_asc(text, title=""):
+    """
+    Parse an LTspice schematic.  Nets are formed from wires (including
+    T-junctions), net labels, and symbol pins.
+    :param text: .asc file contents
+    :param title: circuit title
+    :return: Circuit
+    """
+    wires, flags, symbols, directives = [], [], [], []
+    for line in text.splitlines():
+        fields = line.split()
+        if not fields:
+            continue
+        if fields[0] == "WIRE":
+            wires.append(tuple(int(v) for v in fields[1:5]))
+        elif fields[0] == "FLAG":
+            flags.append((int(fields[1]), int(fields[2]), fields[3]))
+        elif fields[0] == "SYMBOL":
+            symbols.append({"type": os.path.basename(fields[1].replace("\\", "/")).lower(),
+                            "at": (int(fields[2]), int(fields[3])), "orient": fields[4],
+                            "attr": {}})
+        elif fields[0] == "SYMATTR" and symbols:
+            symbols[-1]["attr"][fields[1]] = line.split(None, 2)[2] if len(fields) > 2 else ""
+        elif fields[0] == "TEXT" and "!" in line:
+            # Directive text: everything after '!', with '\n' separating lines
+            directives.extend(line.split("!", 1)[1].split("\\n"))
+
+    # Union-find over grid points
+    parent = {}
+
+    def find(p):
+        parent.setdefault(p, p)
+        while parent[p] != p:
+            parent[p] = parent[parent[p]]
+            p = parent[p]
+        return p
+
+    def union(a, b):
+        parent[find(a)] = find(b)
+
+    pins = []
+    for sym in symbols:
+        if sym["type"] not in _SYMBOL_PINS:
+            raise ValueError("Unsupported symbol '{}' ({})".format(
+                sym["type"], sym["attr"].get("InstName", "?")))
+        x0, y0 = sym["at"]
+        sym["pins"] = []
+        for px, py in _SYMBOL_PINS[sym["type"]]:
+            dx, dy = _transform(px, py, sym["orient"])
+            sym["pins"].append((x0 + dx, y0 + dy))
+            pins.append((x0 + dx, y0 + dy))
+
+    points = set(pins) | {(x, y) for x, y, _ in flags}
+    for x1, y1, x2, y2 in wires:
+        points |= {(x1, y1), (x2, y2)}
+    for x1, y1, x2, y2 in wires:
+        union((x1, y1), (x2, y2))
+        # Any point lying on the wire joins its net (T-junctions, pins on wires)
+        for x, y in points:
+            if (min(x1, x2) <= x <= max(x1, x2) and min(y1, y2) <= y <= max(y1, y2)
+                    and (x - x1) * (y2 - y1) == (y - y1) * (x2 - x1)):
+                union((x, y), (x1, y1))
+
+    # Labels with the same name connect their nets.  Name nets from labels
+    # (ground wins if a net has several), then number the rest.
+    labelled = {}
+    for x, y, name in flags:
+        if name in labelled:
+            union((x, y), labelled[name])
+        labelled[name] = (x, y)
+    net_name = {}
+    for x, y, name in flags:
+        root = find((x, y))
+        if net_name.get(root) != "0":
+            net_name[root] = name
+    count = 0
+
+    def node(p):
+        nonlocal count
+        root = find(p)
+        if root not in net_name:
+            count += 1
+            net_name[root] = "N{:03d}".format(count)
+        return net_name[root]
+
+    circuit = Circuit(title)
+    for sym in symbols:
+        attr = sym["attr"]
+        kind = _SYMBOL_TYPES[sym["type"]]
+        value = attr.get("Value", "0").strip()
+        spice_line = attr.get("SpiceLine", "")
+        rser = dict(re.findall(r"(\w+)\s*=\s*(\{[^}]*\}|\S+)", spice_line)).get("Rser")
+        if kind in ("V", "I") or not value or value == '""':
+            value = "0"
+        circuit.elements.append(
+            Element(kind, attr.get("InstName", kind), [node(p) for p in sym["pins"]], value, rser))
+
+    for directive in directives:
+        directive = directive.strip()
+        fields = directive.split()
+        if not fields:
+            continue
+        if fields[0].lower() == ".param":
+            circuit.add_params(directive[len(fields[0]):])
+        elif fields[0][0].lower() == "k" and len(fields) >= 4:
+            circuit.couplings.append((fields[0], fields[1], fields[2], fields[3]))
+    return circuit
+
+
+def read_netlist(file):
+    """
+    Read an .asc schematic or SPICE netlist file.  LTspice writes either
+    latin-1 (older) or UTF-16LE (newer) text.
+    :param file: file name
+    :return: Circuit
+    """
+    with open(file, "rb") as f:
+        raw = f.read()
+    if raw[:2] == b"\xff\xfe" or (len(raw) > 1 and raw[1:2] == b"\x00"):
+        text = raw.decode("utf-16-le").lstrip("﻿")
+    else:
+        text = raw.decode("latin-1")
+    title = os.path.splitext(os.path.basename(file))[0]
+    if file.lower().endswith(".asc"):
+        return parse_asc(text, title)
+    return parse_spice(text, title)
+
+
+# MODEL GENERATION =========================================================================
+
+def _resolve(circuit, overrides=None):
+    """
+    Work out fitting params and derived values.
+    :return: tuple (list of (name, init) fit params, list of (name, python expr)
+             derived values in dependency order, dict element name -> python
+             value expr, dict element name -> python Rser expr, uses_load flag)
+    """
+    overrides = overrides or {}
+    fit, derived = {}, {}
+    values, rsers = {}, {}
+    uses_load = False
+
+    def value_expr(text, elem_name):
+        # Numeric element values become a fit param named after the element
+        number = None if text.startswith("{") else spice_number(text)
+        if number is not None:
+            fit[elem_name] = overrides.get(elem_name, number)
+            return elem_name, [elem_name]
+        return _translate(text)
+
+    needed = []
+    for e in circuit.elements:
+        if e.kind in ("V", "I"):
+            continue
+        values[e.name], used = value_expr(e.value, e.name)
+        needed += used
+        if e.rser is not None and spice_number(e.rser.strip("{}")) != 0:
+            rsers[e.name], used = value_expr(e.rser, "Rser_" + e.name)
+            needed += used
+    for name, _, _, k in circuit.couplings:
+        values[name], used = value_expr(k, name)
+        needed += used
+
+    # Resolve identifiers through .param definitions
+    pending = list(needed)
+    while pending:
+        name = pending.pop(0)
+        if name in fit or name in derived:
+            continue
+        if name == "load":
+            uses_load = True
+            continue
+        if name in overrides:
+            fit[name] = overrides[name]
+            continue
+        if name not in circuit.params:
+            raise ValueError("'{}' is not defined by a .param or override".format(name))
+        number = spice_number(circuit.params[name].strip("{}"))
+        if number is not None:
+            fit[name] = number
+        else:
+            expr, used = _translate(circuit.params[name])
+            derived[name] = (expr, used)
+            pending.extend(used)
+
+    # Order derived values so each follows the ones it uses
+    ordered = []
+
+    def visit(name, stack=()):
+        if name in stack:
+            raise ValueError("Circular .param definition for '{}'".format(name))
+        if name in derived and name not in [d[0] for d in ordered]:
+            for dep in derived[name][1]:
+                visit(dep, stack + (name,))
+            ordered.append((name, derived[name][0]))
+
+    for name in derived:
+        visit(name)
+    return list(fit.items()), ordered, values, rsers, uses_load
+
+
+def _sum(terms):
+    # Join signed terms into an expression, "0" if none
+    if not terms:
+        return "0"
+    text = " + ".join(terms).replace("+ -", "- ")
+    return text
+
+
+def generate(circuit, name=None, port=None, overrides=None, source=""):
+    """
+    Generate model script source code for a circuit.
+    :param circuit: Circuit from read_netlist()
+    :param name: model description for the docstring
+    :param port: optional (node+, node-) pair, default from the first source
+    :param overrides: optional dict of param name -> init value
+    :param source: netlist file name, for the docstring
+    :return: python source string
+    """
+    if port is not None:
+        circuit.port = tuple(port)
+    p_node, n_node = circuit.find_port()
+    fit, derived, values, rsers, uses_load = _resolve(circuit, overrides)
+
+    nodes = []
+    for e in circuit.elements:
+        for n in e.nodes:
+            if n not in nodes:
+                nodes.append(n)
+    ground = "0" if "0" in nodes else n_node
+    for n in (p_node, n_node):
+        if n not in nodes:
+            raise ValueError("Port node '{}' is not in the circuit".format(n))
+    # Sources are not part of the network
+    passive = [e for e in circuit.elements if e.kind not in ("V", "I")]
+    # Every node needs a path to the reference, or the matrix is singular
+    reached, frontier = {ground}, [ground]
+    while frontier:
+        n = frontier.pop()
+        for e in passive:
+            if n in e.nodes:
+                for m in e.nodes:
+                    if m not in reached:
+                        reached.add(m)
+                        frontier.append(m)
+    floating = [n for n in nodes if n not in reached]
+    if floating:
+        raise ValueError("Nodes {} are not connected to reference node '{}'".format(
+            ", ".join(floating), ground))
+    nodes = [n for n in nodes if n != ground]
+
+    coupled = []
+    for _, l1, l2, _ in circuit.couplings:
+        for l in (l1, l2):
+            if l not in coupled:
+                coupled.append(l)
+    by_name = {e.name: e for e in passive}
+    for l in coupled:
+        if l not in by_name or by_name[l].kind != "L":
+            raise ValueError("Coupling refers to unknown inductor '{}'".format(l))
+
+    # Element impedance/admittance expressions
+    body = []
+    for e in passive:
+        v = values[e.name]
+        r = rsers.get(e.name)
+        if e.kind == "R":
+            z = "({})".format(v)
+        elif e.kind == "C":
+            z = "1/(s*({}))".format(v)
+        else:
+            z = "s*({})".format(v)
+        if r is not None:
+            z = "{} + ({})".format(z, r)
+        if e.name in coupled:
+            body.append("    Z_{} = {}".format(e.name, z))
+        elif e.kind == "R" and r is None:
+            body.append("    Y_{} = 1/({})".format(e.name, v))
+        elif e.kind == "C" and r is None:
+            body.append("    Y_{} = s*({})".format(e.name, v))
+        else:
+            body.append("    Y_{} = 1/({})".format(e.name, z))
+    for k_name, l1, l2, _ in circuit.couplings:
+        body.append("    sM_{} = s*({})*np.sqrt(({})*({}))".format(
+            k_name, values[k_name], values[l1], values[l2]))
+
+    # Unknowns: node voltages, then coupled inductor branch currents
+    unknowns = nodes + ["i({})".format(l) for l in coupled]
+    size = len(unknowns)
+    A = [[[] for _ in range(size)] for _ in range(size)]
+    index = {n: i for i, n in enumerate(nodes)}
+    for e in passive:
+        a, b = (index.get(n) for n in e.nodes)
+        if e.name in coupled:
+            k = len(nodes) + coupled.index(e.name)
+            # KCL: branch current leaves node a, enters node b
+            # Branch: v(a) - v(b) - Z*i - sum(sM*i_other) = 0
+            if a is not None:
+                A[a][k].append("1")
+                A[k][a].append("1")
+            if b is not None:
+                A[b][k].append("-1")
+                A[k][b].append("-1")
+            A[k][k].append("-Z_{}".format(e.name))
+            continue
+        y = "Y_{}".format(e.name)
+        for i, j_ in ((a, a), (b, b)):
+            if i is not None:
+                A[i][j_].append(y)
+        for i, j_ in ((a, b), (b, a)):
+            if i is not None and j_ is not None:
+                A[i][j_].append("-" + y)
+    for k_name, l1, l2, _ in circuit.couplings:
+        k1 = len(nodes) + coupled.index(l1)
+        k2 = len(nodes) + coupled.index(l2)
+        A[k1][k2].append("-sM_{}".format(k_name))
+        A[k2][k1].append("-sM_{}".format(k_name))
+
+    # Drive the port with 1 A; port impedance is then the port voltage
+    rhs = ["0"] * size
+    if p_node != ground:
+        rhs[index[p_node]] = "1"
+    if n_node != ground:
+        rhs[index[n_node]] = "-1"
+    zin = []
+    if p_node != ground:
+        zin.append("v[..., {}]".format(index[p_node]))
+    if n_node != ground:
+        zin.append("-v[..., {}]".format(index[n_node]))
+
+    name = name or circuit.title
+    lines = ['"""',
+             "Model script for {}.".format(name),
+             "Generated by zfit_netlist (version {}) from {}.".format(
+                 COMPILER_VERSION, source or "a netlist"),
+             "Edit the netlist and regenerate rather than editing this file.",
+             '"""',
+             "",
+             "from zfit_matrix import stack_matrix, stack_solve",
+             "",
+             "j = 1j",
+             "",
+             "# List of parameter dictionaries with names, initial values,",
+             "# and min/max bounds. Set 'vary': False to hold a param constant.",
+             "PARAMS = ["]
+    width = max([len(p) for p, _ in fit] + [1]) + 2
+    for p, init in fit:
+        max_val = "1" if p.upper().startswith("K") else "None"
+        lines.append('    {{"name": {:>{w}}, "init": {:>9.3e}, "vary": True, "min": 1e-12, '
+                     '"max": {}}},'.format('"{}"'.format(p), init, max_val, w=width))
+    lines += ["]",
+              "",
+              "# Unknowns solved for: " + ", ".join(
+                  ["v({})".format(u) if not u.startswith("i(") else u for u in unknowns]),
+              "",
+              "def model(w, params, **kws):",
+              '    """',
+              "    Calculate impedance using equations here for all frequencies w.",
+              "    :param w: radian frequency array",
+              "    :param params: list of component values to apply to the model equations",
+              "    :param kws: dict of optional args (eg load, fsf, zsf)",
+              "    :return: complex impedance array corresponding to freqs w",
+              '    """',
+              "    # Extract individual component values from params list"]
+    for p, _ in fit:
+        lines.append("    {} = params['{}']".format(p, p))
+    if uses_load:
+        lines.append("    load = kws['load']")
+    if derived:
+        lines.append("    # Values defined by .param expressions")
+        for d, expr in derived:
+            lines.append("    {} = {}".format(d, expr))
+    lines += ["    s = j*w", "", "    # Element admittances (impedances for coupled inductors)"]
+    lines += body
+    lines += ["", "    # Nodal matrix, driven by 1 A into the port", "    A = stack_matrix(["]
+    for row in A:
+        lines.append("        [" + ", ".join(_sum(t) for t in row) + "],")
+    lines += ["    ])",
+              "    v = stack_solve(A, [{}])".format(", ".join(rhs)),
+              "    return " + _sum(zin),
+              ""]
+    code = "\n".join(lines)
+    # numpy is only needed for couplings and functions in value expressions
+    if "np." in code:
+        code = code.replace("from zfit_matrix", "import numpy as np\nfrom zfit_matrix", 1)
+    return code
+
+
+def compile_netlist(file, out=None, port=None, overrides=None):
+    """
+    Compile a netlist file to a model script.
+    :param file: .asc or SPICE netlist file name
+    :param out: output .py file name, default <netlist>_net.py alongside it
+    :param port: optional (node+, node-) pair
+    :param overrides: optional dict of param name -> init value
+    :return: output file name
+    """
+    if out is None:
+        out = os.path.splitext(file)[0] + "_net.py"
+    circuit = read_netlist(file)
+    code = generate(circuit, port=port, overrides=overrides, source=os.path.basename(file))
+    with open(out, mode="w", encoding="utf-8") as f:
+        f.write(code)
+    return out
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Compile an LTspice schematic or SPICE "
+                                                 "netlist to a Zfit model script")
+    parser.add_argument("netlist", help=".asc, .net, or .cir file")
+    parser.add_argument("-o", "--out", help="output model script (default <netlist>_net.py)")
+    parser.add_argument("--port", nargs=2, metavar=("NODE+", "NODE-"),
+                        help="port nodes, if not defined by a source")
+    parser.add_argument("--param", action="append", default=[], metavar="NAME=VALUE",
+                        help="initial value for a param (may be repeated)")
+    args = parser.parse_args()
+    overrides = {}
+    for item in args.param:
+        key, val = item.split("=", 1)
+        overrides[key.strip()] = spice_number(val)
+    try:
+        print("Written to", compile_netlist(args.netlist, args.out, args.port, overrides))
+    except ValueError as e:
+        parser.error(str(e))
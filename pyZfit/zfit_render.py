@@ -0,0 +1,206 @@
+"""
+Fast redraws of the GUI plots for long sweeps.
+
+The data, modeled and drawn lines of each axes are persistent Line2D artists,
+created once and updated in place with set_data(), instead of being removed
+and plotted again on every change.  Each line holds the full arrays, but is
+given only the points that can be told apart at the current axes size and
+limits (see zfit_decimate), so a 100k-point sweep draws about as fast as a
+short one.  The decimation is redone when the axes are redrawn or resized.
+
+Points clicked in by the user are blitted onto the last full draw instead of
+redrawing the figure.
+"""
+
+import numpy as np
+
+from zfit_decimate import cell_decimate, minmax_decimate
+
+# Lines with up to this many points per pixel column are drawn whole
+DECIMATE_RATIO = 4
+
+
+def _view(ax):
+    # What the decimation of an axes' lines depends on: limits, scales and
+    # size in pixels
+    return (tuple(ax.viewLim.bounds), ax.get_xscale(), ax.get_yscale(),
+            tuple(ax.bbox.bounds))
+
+
+class Renderer:
+    """
+    Persistent lines of the figure on a canvas, by axes and role (the
+    line's label, eg "Zdata").
+    """
+    def __init__(self, canvas):
+        """
+        :param canvas: matplotlib FigureCanvas of the plots
+        """
+        self.canvas = canvas
+        # (axes, role): [Line2D, full x array, full y array, view decimated for]
+        self.lines = {}
+        self.background = None
+        # Points blitted since the last full draw
+        self._blitted = []
+        canvas.mpl_connect("draw_event", self._on_draw)
+        canvas.mpl_connect("resize_event", self._on_resize)
+
+    def set_line(self, ax, role, x, y, fmt="", **style):
+        """
+        Show a line, reusing the axes' line of the same role if there is one.
+        :param ax: matplotlib axes
+        :param role: line label
+        :param x: x array
+        :param y: y array
+        :param fmt: matplotlib format string, used when the line is created
+        :param style: other Line2D properties, used when the line is created
+        :return: the Line2D
+        """
+        key = (ax, role)
+        if key not in self.lines:
+            line, = ax.plot([], [], fmt, label=role, **style)
+            self.lines[key] = [line, None, None, None]
+        entry = self.lines[key]
+        entry[1:] = np.asarray(x), np.asarray(y), None
+        entry[0].set_visible(True)
+        self._decimate(entry)
+        return entry[0]
+
+    def hide_line(self, ax, role):
+        """
+        Hide the axes' line of a role, if there is one.  Its data is dropped
+        so that it doesn't count in autoscaling.
+        """
+        entry = self.lines.get((ax, role))
+        if entry is not None:
+            entry[0].set_data([], [])
+            entry[0].set_visible(False)
+            entry[1:] = None, None, None
+
+    def clear(self, ax, keep=()):
+        """
+        Hide the persistent lines of an axes, and remove its other lines
+        (eg drawn points).
+        :param ax: matplotlib axes
+        :param keep: roles of lines to leave alone
+        """
+        persistent = {entry[0] for entry in self.lines.values()}
+        for line in ax.get_lines():
+            if line.get_label() in keep:
+                continue
+            if line in persistent:
+                self.hide_line(ax, line.get_label())
+            else:
+                line.remove()
+
+    def _decimate(self, entry):
+        # Give a line the points of its full data which can be told apart
+        # at the axes' current size and limits, unless already done
+        line, x, y, done = entry
+        if x is None:
+            return
+        ax = line.axes
+        view = _view(ax)
+        if view == done:
+            return
+        entry[3] = view
+        n_columns = max(1, int(ax.bbox.width))
+        if len(x) <= DECIMATE_RATIO * n_columns:
+            line.set_data(x, y)
+            return
+        with np.errstate(invalid="ignore", divide="ignore"):
+            pix = ax.transData.transform(np.column_stack((x, y)))
+        ok = np.isfinite(pix).all(axis=1)
+        idx = np.nonzero(ok)[0]
+        # Points outside the axes share one column each side, so that the
+        # line still runs to the edges
+        x0, x1 = ax.bbox.x0, ax.bbox.x1
+        columns = np.floor(np.clip(pix[ok, 0], x0 - 1.0, x1 + 1.0) - x0)
+        if line.get_linestyle() in ("None", "", " "):
+            # Markers: one per pixel
+            keep = cell_decimate(columns, np.floor(pix[ok, 1]))
+        else:
+            keep = minmax_decimate(columns, pix[ok, 1])
+        # Keep the extremes, so that autoscaling sees the whole line
+        extremes = [f(v[idx]) for f in (np.argmin, np.argmax) for v in (x, y)]
+        keep = np.union1d(keep, extremes)
+        line.set_data(x[idx[keep]], y[idx[keep]])
+
+    def decimate(self):
+        """
+        Redo the decimation of all lines for the current axes limits.
+        """
+        for entry in self.lines.values():
+            self._decimate(entry)
+
+    def draw(self):
+        """
+        Full redraw of the figure, at the current axes limits.
+        """
+        self.decimate()
+        self.canvas.draw()
+
+    def add_point(self, ax, x, y, **style):
+        """
+        Add a single-point marker line, blitted onto the last full draw.
+        :param ax: matplotlib axes
+        :param x: x value
+        :param y: y value
+        :param style: Line2D properties, eg label
+        :return: the Line2D
+        """
+        line, = ax.plot(x, y, **style)
+        if self.background is None:
+            self.canvas.draw()
+            return line
+        self._blitted.append(line)
+        self.canvas.restore_region(self.background)
+        for point in self._blitted:
+            point.axes.draw_artist(point)
+        self.canvas.blit(self.canvas.figure.bbox)
+        return line
+
+    def _on_draw(self, event):
+        # Keep the finished figure as the background for blitting
+        self.background = self.canvas.copy_from_bbox(self.canvas.figure.bbox)
+        self._blitted = []
+
+    def _on_resize(self, event):
+        # Pixel columns have changed; the canvas redraws itself afterwards
+        self.decimate()
+
+
+if __name__ == "__main__":
+    # Timing of full redraws of a 100k-point sweep, whole and decimated
+    import time
+    import matplotlib
+    matplotlib.use("Agg")
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+    hz = np.logspace(1, 8, 100000)
+    mag = np.abs(1.0 + 1j*hz/1e5 + 1/(1j*hz*1e-6)) * (1 + 0.01*np.random.randn(len(hz)))
+    for decimated in (False, True):
+        fig = Figure(figsize=(8, 5))
+        canvas = FigureCanvasAgg(fig)
+        ax = fig.add_subplot(111)
+        ax.set_xscale("log")
+        ax.set_yscale("log")
+        if decimated:
+            render = Renderer(canvas)
+            line = render.set_line(ax, "Zdata", hz, mag, ".", ms=3)
+            render.set_line(ax, "modeledZPlot", hz, mag, "-", lw=1)
+            redraw = render.draw
+        else:
+            line, = ax.plot(hz, mag, ".", ms=3)
+            ax.plot(hz, mag, "-", lw=1)
+            redraw = canvas.draw
+        ax.relim()
+        ax.autoscale_view()
+        redraw()
+        start = time.perf_counter()
+        for _ in range(5):
+            redraw()
+        print("{}: {} data points drawn, {:.1f} ms per redraw".format(
+            "decimated" if decimated else "whole", len(line.get_xdata()),
+            (time.perf_counter() - start) / 5 * 1000))
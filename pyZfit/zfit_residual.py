@@ -0,0 +1,113 @@
+"""
+Residual evaluation for the fitting loop.
+
+A ResidualEngine is created once per fit.  It holds the weighted (log)
+target, computed once, and preallocated buffers into which each evaluation
+writes the weighted differences between target and model and, for zfit
+limits, the bound penalties.  Only the model evaluation and the returned
+copy of the buffer allocate.
+
+Penalties for params approaching their min or max are computed over arrays
+of bounds instead of param by param.
+"""
+
+import numpy as np
+
+# Exponent which controls the abruptness of penalty increase as a min or
+# max limit is approached
+PENALTY_WALL = 6
+# Penalty at or beyond a limit, relative to the mean square residual
+FULL_PENALTY = 1e4
+
+
+def _bound(x):
+    # None (no limit) becomes nan
+    return np.nan if x is None else x
+
+
+class ResidualEngine:
+    """
+    Callable computing the residual array minimized by lmfit:
+        weight * (log10(Z) - log10(Zmodel))     (log_mag)
+        weight * (Z - Zmodel)                   (otherwise)
+    flattened to adjacent re/im floats, followed by one bound penalty per
+    param if penalties are enabled.
+    """
+    def __init__(self, model, Z, weight, log_mag=True, param_list=None):
+        """
+        :param model: model script module
+        :param Z: complex impedance target
+        :param weight: array of weights corresponding to Z
+        :param log_mag: True for differences of log10 impedance
+        :param param_list: PARAMS list whose min/max give zfit limit penalties,
+                           or None for no penalties (lmfit limits)
+        """
+        self.model = model
+        self.log_mag = log_mag
+        n = len(Z)
+        self.weight = np.broadcast_to(np.asarray(weight, dtype=float), (n,)).copy()
+        self.target = (np.log10(Z) if log_mag else np.asarray(Z, dtype=complex)) * self.weight
+
+        if param_list is None:
+            self.names = []
+        else:
+            self.names = [p["name"] for p in param_list]
+            self.min = np.array([_bound(p["min"]) for p in param_list], dtype=float)
+            self.max = np.array([_bound(p["max"]) for p in param_list], dtype=float)
+            self._vals = np.empty(len(self.names))
+            self._pen = np.empty((2, len(self.names)))
+
+        # Output: 2n re/im floats then penalties; diff is a complex view of
+        # the re/im part
+        self.out = np.empty(2*n + len(self.names))
+        self.diff = self.out[:2*n].view(complex)
+
+    def __call__(self, params, w, **kws):
+        """
+        :param params: lmfit Parameters
+        :param w: radian frequency array
+        :param kws: keyword args for the model (eg load, fsf, zsf, prep)
+        :return: residual float array, a new copy of the output buffer each
+                 call: minimizers keep arrays from earlier calls (eg leastsq's
+                 finite difference Jacobian without Dfun)
+        """
+        zm = self.model.model(w, params, **kws)
+        diff = self.diff
+        if self.log_mag:
+            np.log10(zm, out=diff)
+        else:
+            diff[...] = zm
+        diff *= self.weight
+        np.subtract(self.target, diff, out=diff)
+        if self.names:
+            residuals = self.out[:len(self.out) - len(self.names)]
+            mean_sq = np.dot(residuals, residuals) / len(residuals)
+            self.bound_penalties(params, mean_sq, out=self.out[len(residuals):])
+        return self.out.copy()
+
+    def bound_penalties(self, params, weight, out=None):
+        """
+        Penalties which increase rapidly as each param approaches its min or
+        max, reaching FULL_PENALTY * weight at or beyond the limit.
+        :param params: lmfit Parameters or dict of values
+        :param weight: penalty scale (mean square residual)
+        :param out: optional array to write the penalties to
+        :return: array of one penalty per param
+        """
+        vals = self._vals
+        for i, name in enumerate(self.names):
+            vals[i] = getattr(params[name], "value", params[name])
+        full = FULL_PENALTY * weight
+        pen = self._pen
+        with np.errstate(divide="ignore", invalid="ignore"):
+            np.divide(vals, self.max, out=pen[0])
+            np.divide(self.min, vals, out=pen[1])
+        pen **= PENALTY_WALL
+        pen *= full
+        pen[0][vals >= self.max] = full
+        pen[1][vals <= self.min] = full
+        # No limit: no penalty
+        pen[0][np.isnan(self.max)] = 0.0
+        pen[1][np.isnan(self.min)] = 0.0
+        np.abs(pen, out=pen)
+        return np.max(pen, axis=0, out=out)
@@ -0,0 +1,193 @@
+"""
+Joint fitting of all load segments of a data file with shared (global) and
+per-segment (local) params.
+
+A model script marks a param as local with "local": True in its PARAMS
+dict, or the params can be named when fitting (eg --local on the batch
+fitter).  A local param is fitted as one copy per segment, named
+local_name(name, i), while the other params are shared by all segments.
+
+SegmentedModel wraps a model script so that the fitting code in
+zfit_modelcore_cli sees an ordinary model with the expanded PARAMS list.
+Each segment's rows of the residual array only depend on the global params
+and that segment's local copies, so the Jacobian is block structured.
+
+jacobian() differentiates each segment only with respect to its own params,
+so the derivatives cost about (global + local params) model evaluations over
+all the points, instead of (segments x local params) full model evaluations.
+Only those model evaluations grow linearly with the number of segments: the
+Jacobian is returned dense, as the lmfit minimizers need, so filling it and
+the minimizers' own linear algebra (eg the SVD in least_squares) grow with
+(points x params), ie about quadratically in the number of segments.
+"""
+
+import numpy as np
+
+from zfit_jacobian import _model_jacobian
+
+# Name of segment i's copy of a local param, eg "Rp_seg2"
+LOCAL_NAME = "{}_seg{}"
+
+
+def local_name(name, i):
+    """
+    :param name: param name in the model script
+    :param i: segment index
+    :return: name of segment i's copy of a local param
+    """
+    return LOCAL_NAME.format(name, i)
+
+
+def local_params(model):
+    """
+    :param model: model script module
+    :return: list of the names of params marked "local": True
+    """
+    return [p["name"] for p in model.PARAMS if p.get("local")]
+
+
+class SegmentedModel:
+    """
+    Model-script-like wrapper fitting a model to several segments at once.
+    Has PARAMS, model() and jacobian() like a model script, with one copy
+    of each local param per segment.
+    """
+    def __init__(self, model, offsets, local=None):
+        """
+        :param model: model script module
+        :param offsets: segment start offsets (as SegmentedDataset.offsets)
+        :param local: list of local param names (default: those marked
+                      "local" in the model's PARAMS)
+        """
+        self.inner = model
+        self.offsets = [int(o) for o in offsets]
+        self.local = set(local_params(model) if local is None else local)
+        unknown = self.local - {p["name"] for p in model.PARAMS}
+        if unknown:
+            raise ValueError("Unknown local params: {}".format(", ".join(sorted(unknown))))
+        # Distinct name, so fit store records aren't mixed with plain fits
+        self.__name__ = model.__name__ + "[local]"
+        self.__file__ = model.__file__
+
+        self.PARAMS = []
+        for p in model.PARAMS:
+            if p["name"] in self.local:
+                self.PARAMS += [dict(p, name=local_name(p["name"], i))
+                                for i in range(len(self))]
+            else:
+                self.PARAMS.append(dict(p))
+
+        if hasattr(model, "prepare"):
+            self.prepare = self._prepare
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def _segments(self):
+        return enumerate(zip(self.offsets[:-1], self.offsets[1:]))
+
+    def _prepare(self, w, load):
+        # The model's prepare() results for each segment
+        return [self.inner.prepare(w[a:b], load[a:b] if np.ndim(load) else load)
+                for _, (a, b) in self._segments()]
+
+    def _segment_kws(self, kws, i, a, b):
+        # Model keyword args for segment i: its slice of the load, and its
+        # prepare() results
+        seg_kws = dict(kws)
+        if np.ndim(kws.get("load")):
+            seg_kws["load"] = kws["load"][a:b]
+        if "prep" in kws:
+            seg_kws["prep"] = kws["prep"][i]
+        return seg_kws
+
+    def segment_values(self, params, i):
+        """
+        Values of the model script's params for one segment.
+        :param params: lmfit Parameters or dict of values of the expanded params
+        :param i: segment index
+        :return: dict of name: value
+        """
+        values = {}
+        for p in self.inner.PARAMS:
+            name = p["name"]
+            key = local_name(name, i) if name in self.local else name
+            values[name] = getattr(params[key], "value", params[key])
+        return values
+
+    def model(self, w, params, **kws):
+        """
+        Impedance of all segments, each with its own local param values.
+        Parameters are as for a model script's model().
+        """
+        z = np.empty(len(w), dtype=complex)
+        for i, (a, b) in self._segments():
+            z[a:b] = self.inner.model(w[a:b], self.segment_values(params, i),
+                                      **self._segment_kws(kws, i, a, b))
+        return z
+
+    def jacobian(self, w, params, **kws):
+        """
+        Derivatives with respect to the varying params, computed segment by
+        segment.  Rows of a local param's copy outside its segment are zero.
+        :return: dict of name: dZ/dparam array
+        """
+        names = [p["name"] for p in self.inner.PARAMS if p["vary"]]
+        jac = {name: np.zeros(len(w), dtype=complex) for name in names
+               if name not in self.local}
+        for i, (a, b) in self._segments():
+            seg_jac = _model_jacobian(self.inner, w[a:b], self.segment_values(params, i),
+                                         names, self._segment_kws(kws, i, a, b))
+            for k, name in enumerate(names):
+                if name in self.local:
+                    name = local_name(name, i)
+                    jac[name] = np.zeros(len(w), dtype=complex)
+                jac[name][a:b] = seg_jac[:, k]
+        return jac
+
+    def split_values(self, values):
+        """
+        Split fitted values into the global params and each segment's locals.
+        :param values: list of (name, value) tuples of the expanded params
+        :return: tuple (list of (name, value) of global params, list per
+                 segment of lists of (name, value) of local params)
+        """
+        values = dict(values)
+        shared = [(p["name"], values[p["name"]]) for p in self.inner.PARAMS
+                  if p["name"] not in self.local]
+        local = [[(p["name"], values[local_name(p["name"], i)]) for p in self.inner.PARAMS
+                  if p["name"] in self.local] for i in range(len(self))]
+        return shared, local
+
+
+if __name__ == "__main__":
+    # Timing of joint fits against the number of segments: a series R-C
+    # model with R global and C local, on synthetic data of 400 points per
+    # segment
+    import time
+    import types
+    from zfit_modelcore_cli import DoModel, METHODS
+
+    demo = types.ModuleType("Models.demo_rc")
+    demo.__file__ = __file__
+    demo.PARAMS = [
+        {"name": "R", "init": 10.0, "vary": True, "min": 1e-3, "max": None},
+        {"name": "C", "init": 1e-9, "vary": True, "min": 1e-15, "max": None, "local": True},
+    ]
+    demo.model = lambda w, params, **kws: params["R"] + 1/(1j*w*params["C"]) + kws["load"]
+
+    method_nr = [m[1] for m in METHODS].index("least_squares")
+    rng = np.random.default_rng(0)
+    for n_seg in (2, 4, 8, 16, 32):
+        hz = np.tile(np.logspace(3, 7, 400), n_seg)
+        offsets = 400 * np.arange(n_seg + 1)
+        load = np.repeat(np.linspace(1.0, 50.0, n_seg), 400).astype(complex)
+        cs = np.logspace(-10, -8, n_seg)
+        z = 25.0 + 1/(1j*2*np.pi*hz*np.repeat(cs, 400)) + load
+        z *= 1 + 1e-3*rng.standard_normal(len(z))
+        start = time.perf_counter()
+        values, result, chisqr = DoModel().do_model_arrays(
+            demo, hz, np.abs(z), np.angle(z, deg=True), load, method_nr, offsets=offsets,
+            do_norm_denorm=False, local=["C"])
+        print("{:3d} segments: {:6.3f} s, {:4d} evals, R = {:.4g}, chi-square {:.3g}".format(
+            n_seg, time.perf_counter() - start, result.nfev, dict(values)["R"], chisqr))
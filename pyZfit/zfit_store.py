@@ -0,0 +1,236 @@
+"""
+Local store of fit results, in an SQLite database.
+
+Each fit is recorded with the hash of the data it was fitted to, the model
+name and the hash of the model's source, the method, and the resulting
+param values.  The store is shared by the GUI, the CLI and batch workers;
+SQLite's write-ahead log and a busy timeout make concurrent writers safe.
+
+Results are used to:
+  - start new fits of a model from the result of the closest previous
+    measurement, compared by a coarse signature of the impedance curve
+    (log magnitude at fixed log-spaced frequencies)
+  - look up the result for the same data and model directly ("locked" mode)
+
+The database is $ZFIT_STORE if set, otherwise ZFit\\fits.sqlite under
+%LOCALAPPDATA% (or ~/.zfit_fits.sqlite where that isn't defined).
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import time
+import numpy as np
+
+# Signature frequencies: log10(Hz) from 0 to 10, 4 points per decade
+SIGNATURE_LOG_HZ = np.linspace(0.0, 10.0, 41)
+# Minimum number of signature points two datasets must share to be compared
+SIGNATURE_MIN_OVERLAP = 3
+# Seconds to wait for another writer to finish
+BUSY_TIMEOUT = 30.0
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS fits (
+    id INTEGER PRIMARY KEY,
+    time REAL NOT NULL,
+    dataset TEXT,
+    dataset_hash TEXT NOT NULL,
+    signature TEXT,
+    model TEXT NOT NULL,
+    model_hash TEXT,
+    method TEXT,
+    success INTEGER,
+    chisqr REAL,
+    nfev INTEGER,
+    params TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS fits_dataset ON fits (model, dataset_hash);
+"""
+
+
+def store_path():
+    """
+    :return: file name of the fit store database
+    """
+    if os.environ.get("ZFIT_STORE"):
+        return os.environ["ZFIT_STORE"]
+    if os.environ.get("LOCALAPPDATA"):
+        return os.path.join(os.environ["LOCALAPPDATA"], "ZFit", "fits.sqlite")
+    return os.path.join(os.path.expanduser("~"), ".zfit_fits.sqlite")
+
+
+def dataset_hash(hz, mag, pha, load=None):
+    """
+    Hash of the data a fit is made to.
+    :param hz: frequency array
+    :param mag: magnitude array
+    :param pha: phase array
+    :param load: optional load impedance array
+    :return: hex digest string
+    """
+    h = hashlib.sha1()
+    for a in (hz, mag, pha) if load is None else (hz, mag, pha, load):
+        h.update(np.ascontiguousarray(a).tobytes())
+    return h.hexdigest()
+
+
+def signature(hz, mag):
+    """
+    Coarse description of an impedance curve, for finding similar
+    measurements: log10 magnitude at SIGNATURE_LOG_HZ, nan outside the
+    measured range.
+    :param hz: frequency array (segments may be concatenated)
+    :param mag: magnitude array
+    :return: list of floats
+    """
+    hz, mag = np.asarray(hz), np.asarray(mag)
+    keep = (hz > 0) & (mag > 0)
+    if not keep.any():
+        return [np.nan] * len(SIGNATURE_LOG_HZ)
+    f, m = np.log10(hz[keep]), np.log10(mag[keep])
+    order = np.argsort(f, kind="stable")
+    f, m = f[order], m[order]
+    sig = np.interp(SIGNATURE_LOG_HZ, f, m)
+    sig[(SIGNATURE_LOG_HZ < f[0]) | (SIGNATURE_LOG_HZ > f[-1])] = np.nan
+    return sig.tolist()
+
+
+def _distance(a, b):
+    # RMS difference of two signatures over their common frequencies
+    d = np.asarray(a, dtype=float) - np.asarray(b, dtype=float)
+    d = d[np.isfinite(d)]
+    if len(d) < SIGNATURE_MIN_OVERLAP:
+        return np.inf
+    return float(np.sqrt(np.mean(d**2)))
+
+
+class FitStore:
+    """
+    Connection to the fit store.
+    """
+    def __init__(self, path=None):
+        self.path = path or store_path()
+        folder = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(folder, exist_ok=True)
+        self.db = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        with self.db:
+            self.db.executescript(_SCHEMA)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.db.close()
+
+    def save(self, ds_hash, model, values, model_hash=None, method=None, success=True,
+             chisqr=None, nfev=None, dataset="", sig=None):
+        """
+        Record a fit result.
+        :param ds_hash: dataset_hash() of the fitted data
+        :param model: model script name
+        :param values: list of (name, value) tuples, denormalized
+        :param model_hash: hash of the model's source
+        :param method: lmfit method name
+        :param success: whether the fit succeeded
+        :param chisqr: final chi-square
+        :param nfev: number of model evaluations
+        :param dataset: data file name, for reference
+        :param sig: signature() of the data
+        :return: row id of the new record
+        """
+        if chisqr is not None and not np.isfinite(chisqr):
+            chisqr = None
+        with self.db:
+            cur = self.db.execute(
+                "INSERT INTO fits (time, dataset, dataset_hash, signature, model, model_hash,"
+                " method, success, chisqr, nfev, params) VALUES (?,?,?,?,?,?,?,?,?,?,?)",
+                (time.time(), dataset, ds_hash, None if sig is None else json.dumps(sig),
+                 model, model_hash, method, int(bool(success)), chisqr, nfev,
+                 json.dumps([[name, float(val)] for name, val in values])))
+        return cur.lastrowid
+
+    def lookup(self, ds_hash, model, model_hash=None):
+        """
+        Latest successful result for the same data and model.
+        :param ds_hash: dataset_hash() of the data
+        :param model: model script name
+        :param model_hash: if given, only results of this model source
+        :return: tuple (list of (name, value) tuples, time saved), or None
+        """
+        sql = "SELECT params, time FROM fits WHERE model=? AND dataset_hash=? AND success=1"
+        args = [model, ds_hash]
+        if model_hash is not None:
+            sql += " AND model_hash=?"
+            args.append(model_hash)
+        row = self.db.execute(sql + " ORDER BY time DESC LIMIT 1", args).fetchone()
+        if row is None:
+            return None
+        return [tuple(p) for p in json.loads(row[0])], row[1]
+
+    def closest(self, model, sig, names=None):
+        """
+        Successful result of a model whose data is closest to a signature.
+        Results without a comparable signature are only used when nothing
+        else is found, latest first.
+        :param model: model script name
+        :param sig: signature() of the new data
+        :param names: if given, only results with exactly these param names
+        :return: list of (name, value) tuples, or None
+        """
+        best, best_d = None, np.inf
+        fallback = None
+        rows = self.db.execute(
+            "SELECT params, signature FROM fits WHERE model=? AND success=1 ORDER BY time DESC",
+            (model,))
+        for params, s in rows:
+            values = [tuple(p) for p in json.loads(params)]
+            if names is not None and [v[0] for v in values] != list(names):
+                continue
+            d = np.inf if s is None or sig is None else _distance(sig, json.loads(s))
+            if d < best_d:
+                best, best_d = values, d
+            elif fallback is None:
+                fallback = values
+        return best if best is not None else fallback
+
+    def history(self, model=None, limit=20):
+        """
+        Most recent fits.
+        :param model: optional model script name to select
+        :param limit: maximum number of fits
+        :return: list of dicts with the stored columns
+        """
+        sql = "SELECT time, dataset, model, method, success, chisqr, nfev, params FROM fits"
+        args = []
+        if model is not None:
+            sql += " WHERE model=?"
+            args.append(model)
+        sql += " ORDER BY time DESC LIMIT ?"
+        args.append(limit)
+        cols = ["time", "dataset", "model", "method", "success", "chisqr", "nfev", "params"]
+        rows = [dict(zip(cols, r)) for r in self.db.execute(sql, args)]
+        for r in rows:
+            r["params"] = [tuple(p) for p in json.loads(r["params"])]
+        return rows
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="List fits in the Zfit fit store")
+    parser.add_argument("-m", "--model", help="only fits of this model script")
+    parser.add_argument("-n", type=int, default=20, help="number of fits listed")
+    args = parser.parse_args()
+
+    with FitStore() as store:
+        print(store.path)
+        for r in store.history(args.model, args.n):
+            print("{}  {} / {} / {}: chi-square {}, {} evals{}".format(
+                time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(r["time"])), r["dataset"],
+                r["model"], r["method"], r["chisqr"], r["nfev"], "" if r["success"] else "  FAILED"))
+            print("    " + ", ".join("{} = {:.6g}".format(*p) for p in r["params"]))
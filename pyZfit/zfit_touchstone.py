@@ -0,0 +1,354 @@
+"""
+Reading of Touchstone (.s1p, .s2p, ... and version 2 .ts) network data
+files, as saved by VNAs, into impedance.
+
+A Touchstone file has comment lines starting with "!", an option line
+    # <frequency unit> <parameter> <format> R <reference impedance>
+(default "# GHz S MA R 50"), then one row per frequency: the frequency and
+the network matrix as pairs of numbers, real/imaginary (RI), linear
+magnitude/angle (MA) or dB/angle (DB), angles in degrees.  Rows of more
+than two ports may run over several lines.  Version 2 files add keyword
+lines in brackets ([Version], [Number of Ports], [Reference], ...) before
+[Network Data], and may hold only the lower or upper triangle of the
+matrix.  Noise data following the network data is ignored.
+
+The file is read in chunks of whole lines, as LTspice exports are (see
+zfit_ltspice).  All the numbers of a chunk are converted in one call, and
+its rows are converted to impedance matrices as a stack, so a large sweep
+is never held as text or as per-point Python objects.
+
+A one-port file gives one impedance segment.  For a multi-port file the
+impedance seen at port 1 is returned, with the other ports terminated in
+their reference impedance (what S11 shows), or in each of a list of loads,
+one fit segment per load with that load in the segment's load array.
+"""
+
+import itertools
+import os
+import re
+import numpy as np
+
+from zfit_data import SegmentedDataset, eval_load
+from zfit_ltspice import CHUNK_BYTES, _line_blocks, _numbers, _values
+
+# Version of the reading of Touchstone files, part of the zfit_cache key (see
+# zfit_data.LOADER_VERSION).  Increment whenever it, or the zfit_ltspice
+# number parsing it shares, changes what is produced.
+LOADER_VERSION = 2
+
+# Frequency unit multipliers
+UNITS = {"HZ": 1.0, "KHZ": 1e3, "MHZ": 1e6, "GHZ": 1e9}
+# Touchstone number formats, as zfit_ltspice._values() formats
+FORMATS = {"RI": "cartesian", "MA": "polar", "DB": "db"}
+
+_COMMENT_RE = re.compile(rb"![^\n]*")
+_PORTS_RE = re.compile(r"\.s(\d+)p$", re.I)
+
+
+class Touchstone:
+    """
+    Network data of a Touchstone file, converted to impedance matrices.
+    """
+    def __init__(self, hz, z, ref, param, fmt, version):
+        """
+        :param hz: frequency array
+        :param z: complex impedance matrices, shape (frequencies, ports, ports)
+        :param ref: reference impedance of each port
+        :param param: parameter type of the file: "S", "Y" or "Z"
+        :param fmt: number format of the file: "RI", "MA" or "DB"
+        :param version: Touchstone version, 1 or 2
+        """
+        self.hz = hz
+        self.z = z
+        self.ref = np.asarray(ref, dtype=float)
+        self.param = param
+        self.fmt = fmt
+        self.version = version
+
+    @property
+    def n_ports(self):
+        return self.z.shape[1]
+
+    def input_impedance(self, load=None):
+        """
+        Impedance seen at port 1 with the other ports terminated.
+        :param load: termination impedance, a number or an array over the
+                     frequencies, the same for all other ports; np.inf for
+                     open.  Default: each port's reference impedance.
+        :return: complex array over the frequencies
+        """
+        z = self.z
+        if self.n_ports == 1:
+            return z[:, 0, 0]
+        n = self.n_ports - 1
+        load = self.ref[1:] if load is None else np.asarray(load)[..., None]
+        load = np.broadcast_to(load, (len(z), n))
+        # All other ports open: just Z11
+        open_ = np.isinf(load).all(axis=1)
+        load = np.where(np.isinf(load), 0.0, load)
+        # Z11 - Z1o (Zoo + ZL)^-1 Zo1, o being the other ports
+        zoo = z[:, 1:, 1:] + np.eye(n) * load[:, :, None]
+        x = np.linalg.solve(zoo, z[:, 1:, :1])[:, :, 0]
+        zin = z[:, 0, 0] - np.einsum("fi,fi->f", z[:, 0, 1:], x)
+        zin[open_] = z[open_, 0, 0]
+        return zin
+
+    def to_dataset(self, terminations=None):
+        """
+        Make a SegmentedDataset of the impedance seen at port 1.
+        :param terminations: for multi-port files, list of load expressions
+                             in w and j (as on <segment> lines), eg
+                             ["1/(j*w*.2e-12)", "5e-3", "49.9"]; the other
+                             ports are terminated in each load in turn, one
+                             segment per load.  Default: one segment, other
+                             ports terminated in their reference impedance.
+        :return: SegmentedDataset
+        """
+        if self.n_ports == 1 or terminations is None:
+            z = self.input_impedance()
+            if self.n_ports == 1:
+                segment_strs = ["1  # Z11"]
+                load = np.ones(len(z), dtype=complex)
+            else:
+                segment_strs = ["{:g}  # port 1, other ports at reference".format(self.ref[1])]
+                load = np.full(len(z), self.ref[1], dtype=complex)
+            return SegmentedDataset(self.hz, np.abs(z), np.angle(z, deg=True), load,
+                                    [0, len(z)], segment_strs)
+
+        w = 2.0*np.pi*self.hz
+        z, load = [], []
+        for t in terminations:
+            load.append(eval_load(t, w))
+            z.append(self.input_impedance(load[-1]))
+        offsets = len(w) * np.arange(len(z) + 1)
+        z = np.concatenate(z)
+        return SegmentedDataset(np.tile(self.hz, len(terminations)), np.abs(z),
+                                np.angle(z, deg=True), np.concatenate(load), offsets,
+                                list(terminations))
+
+
+def s_to_z(s, ref):
+    """
+    Impedance matrices from S-parameter matrices.
+    :param s: complex array, shape (frequencies, ports, ports)
+    :param ref: real reference impedance of each port
+    :return: complex array like s
+    """
+    ref = np.asarray(ref, dtype=float)
+    if s.shape[1] == 1:
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return ref[0] * (1 + s) / (1 - s)
+    # sqrt(R) (I - S)^-1 (I + S) sqrt(R)
+    eye = np.eye(s.shape[1])
+    root = np.sqrt(ref)
+    return root[:, None] * np.linalg.solve(eye - s, eye + s) * root
+
+
+def _to_z(m, opts):
+    # Impedance matrices from the network matrices of a file
+    ref = opts["ref"]
+    if opts["param"] == "S":
+        return s_to_z(m, ref)
+    if opts["version"] == 1:
+        # Version 1 Z and Y are normalized to the reference impedance
+        m = m * ref[0] if opts["param"] == "Z" else m / ref[0]
+    if opts["param"] == "Z":
+        return m
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return 1 / m if m.shape[1] == 1 else np.linalg.inv(m)
+
+
+def _header(blocks, n_ports):
+    # Options and keywords of a file, up to its first data line
+    # :return: tuple (options dict, bytes following the header in its block)
+    opts = {"unit": "GHZ", "param": "S", "fmt": "MA", "ref": None, "r": 50.0,
+            "version": 1, "n_ports": n_ports, "order": None, "matrix": "FULL"}
+    option_line = False
+    ref = None
+    info = False
+    for block in blocks:
+        pos = 0
+        while pos < len(block):
+            end = block.find(b"\n", pos) + 1 or len(block)
+            line = block[pos:end].split(b"!", 1)[0].decode("latin-1").strip()
+            upper = line.upper()
+            if info:
+                info = upper != "[END INFORMATION]"
+            elif ref is not None and line and line[0] not in "[#":
+                # [Reference] values running over the next lines
+                ref += [float(v) for v in line.split()]
+            elif not line:
+                pass
+            elif line.startswith("#"):
+                if not option_line:
+                    tokens = upper[1:].split()
+                    for i, token in enumerate(tokens):
+                        if token in UNITS:
+                            opts["unit"] = token
+                        elif token in ("S", "Y", "Z", "H", "G"):
+                            opts["param"] = token
+                        elif token in FORMATS:
+                            opts["fmt"] = token
+                        elif token == "R" and i + 1 < len(tokens):
+                            opts["r"] = float(tokens[i+1])
+                    option_line = True
+            elif line.startswith("["):
+                keyword, _, value = upper[1:].partition("]")
+                keyword, value = keyword.strip(), value.strip()
+                if ref is not None:
+                    opts["ref"], ref = ref, None
+                if keyword == "VERSION":
+                    opts["version"] = 2
+                elif keyword == "NUMBER OF PORTS":
+                    opts["n_ports"] = int(value)
+                elif keyword == "TWO-PORT DATA ORDER":
+                    opts["order"] = value
+                elif keyword == "MATRIX FORMAT":
+                    opts["matrix"] = value
+                elif keyword == "REFERENCE":
+                    ref = [float(v) for v in value.split()]
+                elif keyword == "BEGIN INFORMATION":
+                    info = True
+                elif keyword == "MIXED-MODE ORDER":
+                    raise ValueError("Mixed-mode Touchstone data is not supported")
+                elif keyword == "NETWORK DATA":
+                    return opts, block[end:]
+            elif opts["version"] == 1:
+                return opts, block[pos:]
+            pos = end
+    raise ValueError("No network data")
+
+
+def _noise_start(buf):
+    # Offset of the first noise data line (5 numbers) of a version 1
+    # two-port file, or None
+    pos = 0
+    for line in buf.split(b"\n"):
+        if len(line.split()) == 5:
+            return pos
+        pos += len(line) + 1
+    return None
+
+
+def read_touchstone(file, chunk_bytes=CHUNK_BYTES):
+    """
+    Read a Touchstone file.
+    :param file: file name; the number of ports is taken from the
+                 extension (.s<n>p) or the [Number of Ports] keyword
+    :param chunk_bytes: bytes read and converted at a time
+    :return: Touchstone
+    """
+    m = _PORTS_RE.search(file)
+    with open(file, "rb") as f:
+        blocks = _line_blocks(f.read, chunk_bytes)
+        opts, first = _header(blocks, int(m.group(1)) if m else None)
+        n = opts["n_ports"]
+        if n is None:
+            raise ValueError("Number of ports of {} unknown".format(file))
+        if opts["param"] not in ("S", "Y", "Z"):
+            raise ValueError("{}-parameters in {} are not supported".format(opts["param"], file))
+        opts["ref"] = np.broadcast_to(
+            np.asarray(opts["ref"] or [opts["r"]], dtype=float), (n,))
+
+        # Matrix entries of a row, in file order
+        triangle = opts["matrix"] in ("LOWER", "UPPER")
+        if opts["matrix"] == "LOWER":
+            rows, cols = np.tril_indices(n)
+        elif opts["matrix"] == "UPPER":
+            rows, cols = np.triu_indices(n)
+        else:
+            rows, cols = np.indices((n, n)).reshape(2, -1)
+            if n == 2 and (opts["order"] or "21_12") == "21_12":
+                # S11 S21 S12 S22
+                rows, cols = cols, rows
+        n_values = 1 + 2*len(rows)
+        # Version 1 two-port files may end with noise data
+        noise = opts["version"] == 1 and n == 2
+
+        hz, z = [], []
+        rest = np.empty(0)
+        last_hz = -np.inf
+        for block in itertools.chain([first], blocks):
+            # Comments first: they may contain brackets
+            if b"!" in block:
+                block = _COMMENT_RE.sub(b"", block)
+            # Keywords after the network data ([Noise Data], [End]) end it
+            stop = block.find(b"[")
+            buf = block if stop < 0 else block[:stop]
+            if not buf.strip():
+                if stop >= 0:
+                    break
+                continue
+            values = np.concatenate((rest, _numbers(buf, 1)[:, 0]))
+            n_rows = len(values) // n_values
+            if noise and (len(values) % n_values or np.any(
+                    np.diff(values[:n_rows*n_values:n_values], prepend=last_hz) <= 0)):
+                cut = _noise_start(buf)
+                if cut is not None:
+                    values = np.concatenate((rest, _numbers(buf[:cut], 1)[:, 0]))
+                    n_rows = len(values) // n_values
+                    stop = cut
+            # Numbers of a row running over into the next chunk are kept
+            rest = values[n_rows*n_values:]
+            if n_rows:
+                values = values[:n_rows*n_values].reshape(-1, n_values)
+                last_hz = values[-1, 0]
+                matrix = np.empty((n_rows, n, n), dtype=complex)
+                pairs = _values(values[:, 1:], FORMATS[opts["fmt"]])
+                matrix[:, rows, cols] = pairs
+                if triangle:
+                    matrix[:, cols, rows] = pairs
+                hz.append(values[:, 0] * UNITS[opts["unit"]])
+                z.append(_to_z(matrix, opts))
+            if stop >= 0:
+                break
+
+    if not hz or len(rest):
+        raise ValueError("Incomplete network data in {}".format(file))
+    return Touchstone(np.concatenate(hz), np.concatenate(z), opts["ref"], opts["param"],
+                      opts["fmt"], opts["version"])
+
+
+def read_touchstone_dataset(file, terminations=None):
+    """
+    Read a Touchstone file into a SegmentedDataset of the impedance at port 1.
+    :param file: file name
+    :param terminations: list of load expressions for the other ports of a
+                         multi-port file, one segment each (see
+                         Touchstone.to_dataset())
+    :return: SegmentedDataset
+    """
+    return read_touchstone(file).to_dataset(terminations)
+
+
+if __name__ == "__main__":
+    # Timing of reading a synthetic 1M-point two-port file: a T network of
+    # a series R-L-C and a shunt R-C, 50 ohm reference, read with port 2
+    # open, shorted and at 50 ohms
+    import tempfile
+    import time
+
+    hz = np.logspace(3, 9, 1000000)
+    zs = 1.0 + 2j*np.pi*hz*1e-9 + 1/(2j*np.pi*hz*1e-9)
+    zp = 0.1 + 1/(2j*np.pi*hz*100e-12)
+    z = np.array([[zs + zp, zp], [zp, zp]]).transpose(2, 0, 1)
+    s = np.linalg.solve((z + 50*np.eye(2)).transpose(0, 2, 1),
+                        (z - 50*np.eye(2)).transpose(0, 2, 1)).transpose(0, 2, 1)
+    columns = [hz / 1e6]
+    for i, k in ((0, 0), (1, 0), (0, 1), (1, 1)):
+        columns += [20*np.log10(np.abs(s[:, i, k])), np.angle(s[:, i, k], deg=True)]
+    # The file is written to a temporary directory removed at the end
+    with tempfile.TemporaryDirectory() as tmp:
+        file = os.path.join(tmp, "demo.s2p")
+        with open(file, "w") as f:
+            f.write("! synthetic T network\n# MHz S DB R 50\n")
+            np.savetxt(f, np.column_stack(columns), fmt="%.12g")
+        print("{}: {:.1f} MB".format(file, os.path.getsize(file) / 1e6))
+
+        start = time.perf_counter()
+        ds = read_touchstone_dataset(file, ["np.inf", "0", "50"])
+        print("read in {:.2f} s".format(time.perf_counter() - start))
+        expected = [zs + zp, zs, zs + zp*50/(zp + 50)]
+        for i, zin in enumerate(expected):
+            print("  port 2 load {:6s}: largest |Z| error {:.2g}".format(
+                ds.segment_strs[i], np.max(np.abs(ds.mag[ds.segment_slice(i)] / np.abs(zin) - 1))))
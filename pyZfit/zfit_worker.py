@@ -0,0 +1,104 @@
+"""
+Background fitting for the GUI.
+
+FitWorker runs lmfit's minimize() on a QThread, so the window stays
+responsive during long fits (eg differential evolution).  The iteration
+callback reports progress through Qt signals, delivered on the GUI thread,
+and aborts the fit when cancel() has been called.  The worker never touches
+widgets itself.
+"""
+
+import time
+import numpy as np
+from lmfit import minimize
+from lmfit.minimizer import AbortFitException
+from PyQt5 import QtCore
+
+# Seconds between progress signals
+PROGRESS_INTERVAL = 0.2
+
+
+class FitWorker(QtCore.QObject):
+    """
+    One minimize() call, run by start() on a new thread.
+    Signals:
+        progress(nfev, chi-square, evaluations per second)
+        finished(lmfit result, or None if the method raised on abort;
+                 dict of the last param values seen by the callback)
+        failed(exception)
+    """
+    progress = QtCore.pyqtSignal(int, float, float)
+    finished = QtCore.pyqtSignal(object, object)
+    failed = QtCore.pyqtSignal(object)
+
+    def __init__(self, fcn, params, args=(), kws=None, method="leastsq", fit_kws=None):
+        """
+        :param fcn: function to minimize, as for minimize()
+        :param params: lmfit Parameters
+        :param args: positional args for fcn
+        :param kws: keyword args for fcn
+        :param method: lmfit method name
+        :param fit_kws: other keyword args for minimize() (eg Dfun)
+        """
+        super().__init__()
+        self.fcn = fcn
+        self.params = params
+        self.args = args
+        self.kws = kws or {}
+        self.method = method
+        self.fit_kws = fit_kws or {}
+        self.last_values = {p.name: p.value for p in params.values()}
+        self.nfev = 0
+        self.thread = None
+        self._cancel = False
+        self._start = 0.0
+        self._next_report = 0.0
+
+    def start(self):
+        # Move to a new thread and run there
+        self.thread = QtCore.QThread()
+        self.moveToThread(self.thread)
+        self.thread.started.connect(self.run)
+        self.thread.start()
+
+    def stop(self):
+        # Called from the GUI thread once finished or failed has been
+        # received: end the thread's event loop and wait for it
+        self.thread.quit()
+        self.thread.wait()
+
+    def cancel(self):
+        # Called from the GUI thread; the next callback aborts the fit
+        self._cancel = True
+
+    @property
+    def cancelled(self):
+        return self._cancel
+
+    def _iter_cb(self, params, nfev, resid, *args, **kws):
+        # lmfit iteration callback: report progress every PROGRESS_INTERVAL
+        # seconds, and abort (return True) if cancelled
+        self.nfev = nfev
+        now = time.perf_counter()
+        if now >= self._next_report or self._cancel:
+            self._next_report = now + PROGRESS_INTERVAL
+            self.last_values = {p.name: p.value for p in params.values()}
+            resid = np.asarray(resid, dtype=float)
+            chisqr = float(np.dot(resid.ravel(), resid.ravel()))
+            rate = nfev / max(now - self._start, 1e-9)
+            self.progress.emit(nfev, chisqr, rate)
+        return self._cancel
+
+    def run(self):
+        self._start = time.perf_counter()
+        self._next_report = self._start + PROGRESS_INTERVAL
+        try:
+            result = minimize(self.fcn, self.params, args=self.args, kws=self.kws,
+                              method=self.method, iter_cb=self._iter_cb, **self.fit_kws)
+        except AbortFitException:
+            # Some methods don't catch the abort themselves
+            result = None
+        except Exception as e:
+            self.failed.emit(e)
+            return
+        self.finished.emit(result, self.last_values)
@@ -1,5 +1,4 @@
 from zfit_constants import *
-import copy
 from matplotlib.ticker import EngFormatter
 
 
@@ -25,6 +24,8 @@ class YAxes:
         self.inputData = [None, None]   # mag, pha
         self.modeledData = [None, None] # mag, pha
         self.drawnData = [None, None, None]     # drawn mag, pha, weight curves
+        # SegmentedDataset of all segments, shared with the Range class
+        self.dataset = None
 
     def select(self, index):
         # Mouse events will only register on the top plot, so
@@ -60,17 +61,13 @@ class YAxes:
             self.ax[P].patch.set_visible(True)
             self.ax[W].patch.set_visible(False)
 
-    def data_bundle(self):
-        # Return a list of copies of the current data
-        iMag = copy.copy(self.inputData[M])
-        iPha = copy.copy(self.inputData[P])
-        mMag = copy.copy(self.modeledData[M])
-        mPha = copy.copy(self.modeledData[P])
-        return [iMag, iPha, mMag, mPha]
-
-    def data_unbundle(self, bundle):
-        # Complement of function above
-        self.inputData[M] = bundle[0]
-        self.inputData[P] = bundle[1]
-        self.modeledData[M] = bundle[2]
-        self.modeledData[P] = bundle[3]
+    def select_segment(self, i):
+        # Point the input and modeled data at views of segment i of the
+        # dataset.  No data is copied.
+        ds = self.dataset
+        s = ds.segment_slice(i)
+        self.inputData = [ds.mag[s], ds.pha[s]]
+        if ds.model_mag is None:
+            self.modeledData = [None, None]
+        else:
+            self.modeledData = [ds.model_mag[s], ds.model_pha[s]]